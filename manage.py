@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'surService.settings')
+    # Тесты - со своими настройками (кеши в памяти, зеркало реплики), см. surService/test_settings.py
+    settings_module = 'surService.test_settings' if sys.argv[1:2] == ['test'] else 'surService.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -1,5 +1,8 @@
 from django.contrib import admin
+from django.template.response import TemplateResponse
+from .columnar import mark_stale
 from .models import *
+from .profiling import recent_profiles
 from nested_inline.admin import NestedStackedInline, NestedModelAdmin
 
 
@@ -22,5 +25,42 @@ class VotingAdmin(NestedModelAdmin):
     inlines = [PageInline]
     list_display = ['title', 'description', 'author']
 
+    def save_related(self, request, form, formsets, change):
+        # Удаленные во вложенных формах варианты и вопросы уносят голоса: снимок на пересборку
+        votes = Vote.objects.filter(voting_id=form.instance.pk)
+        before = votes.count() if change else 0
+        super().save_related(request, form, formsets, change)
+        if change and votes.count() != before:
+            mark_stale(form.instance.pk)
+
+
+class VoteAdmin(admin.ModelAdmin):
+    # Опрос голоса всегда берется из вопроса: без него статистика, выгрузки и счетчики голос не видят
+    readonly_fields = ['voting']
+
+    def save_model(self, request, obj, form, change):
+        obj.voting_id = obj.question.page.voting_id
+        super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        if obj.voting_id is not None:
+            mark_stale(obj.voting_id)
+
+    def delete_queryset(self, request, queryset):
+        voting_ids = list(queryset.values_list('voting_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        for voting_id in voting_ids:
+            if voting_id is not None:
+                mark_stale(voting_id)
+
+
 admin.site.register(Voting, VotingAdmin)
-admin.site.register(Vote)
+admin.site.register(Vote, VoteAdmin)
+admin.site.register(Submission)
+
+
+def request_profiles(request):
+    # Последние профили запросов (surApp/profiling.py); открывается из админки по /admin/profiles/
+    context = {**admin.site.each_context(request), 'title': 'Профили запросов', 'profiles': recent_profiles()}
+    return TemplateResponse(request, 'admin/surApp/request_profiles.html', context)
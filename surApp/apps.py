@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SurappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'surApp'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,63 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+
+
+def is_asgi(request):
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def run_sync(request, func, *args, **kwargs):
+    # Синхронный код с ORM из асинхронного представления. В Django 3.2 все thread_sensitive-вызовы под ASGI
+    # идут через один общий поток, и синхронные представления обслуживаются строго по одному. Поэтому под
+    # ASGI код выполняется в пуле потоков asgiref (thread_sensitive=False), а соединение потока закрывается
+    # (или возвращается в пул) по тем же правилам, что и в конце запроса. Под WSGI - в потоке запроса
+    if not is_asgi(request):
+        return sync_to_async(func)(*args, **kwargs)
+
+    def call():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False)()
+
+
+class AsyncDispatchMixin:
+    # Асинхронная диспетчеризация APIView: обработчики методов - async def, а APIView.initial
+    # (аутентификация, права, троттлинг) и ORM внутри обработчиков выполняются через run_sync.
+    # Ставится перед классом DRF: class View(AsyncDispatchMixin, APIView)
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        # Django 3.2 выбирает асинхронный путь по asyncio.iscoroutinefunction(view)
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+        async_view.__dict__.update(view.__dict__)
+        async_view.__name__ = view.__name__
+        return async_view
+
+    async def dispatch(self, request, *args, **kwargs):
+        # То же, что APIView.dispatch, но с ожиданием initial и обработчика
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await run_sync(request, self.initial, request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
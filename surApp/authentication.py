@@ -0,0 +1,105 @@
+import threading
+import time
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+DEFAULT_AUTH_FAST_PATH = {
+    # 'cached' - пользователь из базы с кешем в памяти процесса, 'stateless' - TokenUser из claims без запросов
+    'MODE': 'cached',
+    # Сколько секунд процесс доверяет найденному пользователю и ответу черного списка
+    'TTL': 30,
+    # Проверять, не отозван ли refresh token, из которого выпущен access token (выход из учетной записи)
+    'CHECK_BLACKLIST': True,
+    'MAX_ENTRIES': 10_000,
+}
+
+REFRESH_JTI_CLAIM = 'refresh_jti'
+
+
+def get_auth_settings():
+    return {**DEFAULT_AUTH_FAST_PATH, **getattr(settings, 'AUTH_FAST_PATH', {})}
+
+
+class TTLCache:
+    # Небольшой потокобезопасный кеш в памяти процесса: запись живет ttl секунд
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key, value, ttl, max_entries):
+        with self._lock:
+            if len(self._entries) >= max_entries:
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[0] >= now}
+                if len(self._entries) >= max_entries:
+                    self._entries.clear()
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = TTLCache()
+blacklist_cache = TTLCache()
+
+
+def issue_tokens(user):
+    # Claims для stateless-режима: TokenUser берет из токена username и флаги прав,
+    # а refresh_jti связывает access token с refresh token для проверки выхода
+    refresh = RefreshToken.for_user(user)
+    refresh['username'] = user.get_username()
+    refresh['is_staff'] = user.is_staff
+    refresh['is_superuser'] = user.is_superuser
+    refresh[REFRESH_JTI_CLAIM] = refresh[api_settings.JTI_CLAIM]
+    return refresh
+
+
+def is_revoked(validated_token):
+    refresh_jti = validated_token.get(REFRESH_JTI_CLAIM)
+    if refresh_jti is None:
+        return False
+    revoked = blacklist_cache.get(refresh_jti)
+    if revoked is None:
+        options = get_auth_settings()
+        revoked = BlacklistedToken.objects.filter(token__jti=refresh_jti).exists()
+        blacklist_cache.set(refresh_jti, revoked, options['TTL'], options['MAX_ENTRIES'])
+    return revoked
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    # JWT без запроса User на каждый запрос: в режиме 'cached' пользователь берется из кеша процесса
+    # (до TTL секунд после блокировки или удаления пользователя он еще проходит проверку),
+    # в режиме 'stateless' - TokenUser из claims токена
+    def get_user(self, validated_token):
+        options = get_auth_settings()
+        if options['CHECK_BLACKLIST'] and is_revoked(validated_token):
+            raise AuthenticationFailed(_('Token is blacklisted'), code='token_not_valid')
+        if options['MODE'] == 'stateless':
+            return JWTStatelessUserAuthentication.get_user(self, validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user, options['TTL'], options['MAX_ENTRIES'])
+        return user
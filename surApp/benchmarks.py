@@ -0,0 +1,132 @@
+import ctypes
+import ctypes.util
+import gc
+import os
+import resource
+import statistics
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def benchmark_database():
+    # Бенчмарки работают на отдельной тестовой базе, рабочие данные не затрагиваются
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(func, repeat):
+    # Запускает func repeat раз, возвращает сводку по времени (мс) и числу SQL-запросов
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = len(context.captured_queries)
+    return {
+        'repeat': repeat,
+        'mean_ms': round(statistics.mean(timings), 3),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'queries': queries,
+    }
+
+
+def max_rss_mb():
+    # ru_maxrss в Linux - в килобайтах, и только растет за время жизни процесса: годится для всего прогона,
+    # но не для отдельного замера
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def current_rss():
+    # Текущий RSS процесса в байтах из /proc (Linux); None, если недоступен
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def release_memory():
+    # Освобожденное предыдущим замером возвращается системе, иначе RSS следующего начинается с чужого пика
+    gc.collect()
+    libc_name = ctypes.util.find_library('c')
+    if libc_name:
+        malloc_trim = getattr(ctypes.CDLL(libc_name), 'malloc_trim', None)
+        if malloc_trim is not None:
+            malloc_trim(0)
+
+
+def peak_rss_growth_mb(func, interval=0.01):
+    # Прирост RSS за один запуск func: фоновый поток опрашивает RSS, пока func выполняется.
+    # Возвращает (секунды, МБ); МБ - None, если RSS прочитать нельзя
+    release_memory()
+    baseline = current_rss()
+    peak = baseline
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(interval):
+            peak = max(peak, current_rss())
+
+    sampler = threading.Thread(target=sample, daemon=True) if baseline is not None else None
+    if sampler is not None:
+        sampler.start()
+    started = time.perf_counter()
+    try:
+        func()
+    finally:
+        elapsed = time.perf_counter() - started
+        done.set()
+        if sampler is not None:
+            sampler.join()
+    if baseline is None:
+        return elapsed, None
+    peak = max(peak, current_rss())
+    return elapsed, round((peak - baseline) / 1024 / 1024, 1)
+
+
+def measure_memory(func):
+    # Два запуска func: первый для времени и прироста RSS, второй под tracemalloc для пика памяти,
+    # выделенной Python (трассировка заметно замедляет выполнение)
+    elapsed, rss_growth = peak_rss_growth_mb(func)
+    release_memory()
+    return {
+        'seconds': round(elapsed, 3),
+        'peak_python_mb': peak_python_mb(func),
+        'peak_rss_growth_mb': rss_growth,
+    }
+
+
+def peak_python_mb(func):
+    # Пик памяти, выделенной Python за один запуск func
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024 / 1024, 1)
@@ -0,0 +1,227 @@
+import json
+import os
+import shutil
+import time
+import uuid
+from functools import lru_cache
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+
+from .exports import keyset_iterator
+from .models import Vote
+
+DEFAULT_COLUMNAR_SETTINGS = {
+    'DIRECTORY': 'columnar',
+    # Голосов в одной части: столько строк держится в памяти при сжатии
+    'BATCH_SIZE': 1_000_000,
+    # id голосов выдаются при вставке, а фиксируются транзакции в другом порядке: голос с меньшим id
+    # может появиться уже после сжатия. Последние OVERLAP id перечитываются при каждом сжатии и подсчете
+    'OVERLAP': 10_000,
+}
+
+# Колонки снимка: id голоса, номер респондента в respondents.npy, вопрос и вариант
+COLUMNS = ('id', 'respondent', 'question', 'choice')
+COLUMN_DTYPES = {'id': np.int64, 'respondent': np.int32, 'question': np.int32, 'choice': np.int32}
+STALE_FLAG = 'stale'
+
+
+def get_columnar_settings():
+    return {**DEFAULT_COLUMNAR_SETTINGS, **getattr(settings, 'COLUMNAR_SNAPSHOTS', {})}
+
+
+def snapshot_directory(voting_id):
+    return Path(get_columnar_settings()['DIRECTORY']) / str(voting_id)
+
+
+def empty_manifest(voting_id):
+    return {'voting_id': voting_id, 'last_vote_id': 0, 'votes': 0, 'parts': []}
+
+
+def read_manifest(voting_id):
+    try:
+        return json.loads((snapshot_directory(voting_id) / 'manifest.json').read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return None
+
+
+def is_stale(voting_id):
+    return (snapshot_directory(voting_id) / STALE_FLAG).exists()
+
+
+def mark_stale(voting_id):
+    # Удаление голосов приращение не видит: снимок с флагом не используется,
+    # а следующий compact_votes собирает его заново
+    directory = snapshot_directory(voting_id)
+    flag = directory / STALE_FLAG
+    if directory.exists() and not flag.exists():
+        flag.touch()
+
+
+def write_atomic(path, write):
+    # Запись во временный файл и os.replace: читатели видят либо старую, либо новую версию
+    temporary = path.with_name(f'.{path.name}.{uuid.uuid4().hex[:8]}')
+    write(temporary)
+    os.replace(temporary, path)
+
+
+def write_manifest(directory, manifest):
+    write_atomic(directory / 'manifest.json',
+                 lambda path: path.write_text(json.dumps(manifest), encoding='utf-8'))
+
+
+@lru_cache(maxsize=512)
+def load_column(path):
+    # Имена частей уникальны и файлы не изменяются после записи, поэтому memmap можно держать открытым
+    return np.load(path, mmap_mode='r')
+
+
+def load_respondents(directory):
+    path = directory / 'respondents.npy'
+    return np.load(path) if path.exists() else np.empty(0, dtype=np.int64)
+
+
+class Snapshot:
+    # Части снимка одного опроса как memmap; manifest['last_vote_id'] - наибольший id голоса в снимке
+    def __init__(self, voting_id, manifest):
+        self.voting_id = voting_id
+        self.manifest = manifest
+        self.directory = snapshot_directory(voting_id)
+
+    @property
+    def last_vote_id(self):
+        return self.manifest['last_vote_id']
+
+    @property
+    def overlap_from(self):
+        # Голоса с id больше этого читаются из базы и сверяются со снимком по id
+        if not self.manifest['parts']:
+            return 0
+        return max(0, self.last_vote_id - get_columnar_settings()['OVERLAP'])
+
+    def window(self, after_id):
+        # Строки снимка с id > after_id; id в частях возрастают, поэтому старые части пропускаются по последнему id
+        rows = {column: [] for column in COLUMNS}
+        for part in self.parts():
+            ids = part['id']
+            if not len(ids) or ids[-1] <= after_id:
+                continue
+            start = np.searchsorted(ids, after_id, side='right')
+            for column in COLUMNS:
+                rows[column].append(np.asarray(part[column][start:]))
+        return {column: np.concatenate(arrays) if arrays else np.empty(0, dtype=COLUMN_DTYPES[column])
+                for column, arrays in rows.items()}
+
+    def parts(self):
+        for part in self.manifest['parts']:
+            yield {column: load_column(str(self.directory / f'{part}.{column}.npy')) for column in COLUMNS}
+
+    def choice_counts(self, choice_ids):
+        # bincount по каждой части со сдвигом на наименьший id варианта опроса: массив счетчиков
+        # размером с диапазон id вариантов, а не с наибольший id в базе
+        counts = dict.fromkeys(choice_ids, 0)
+        if not choice_ids:
+            return counts
+        low, high = min(choice_ids), max(choice_ids)
+        totals = np.zeros(high - low + 1, dtype=np.int64)
+        for part in self.parts():
+            choices = part['choice']
+            # Варианты, удаленные после сжатия, в диапазон не попадают
+            choices = choices[(choices >= low) & (choices <= high)]
+            totals += np.bincount(choices - low, minlength=len(totals))
+        for choice_id in choice_ids:
+            counts[choice_id] = int(totals[choice_id - low])
+        return counts
+
+
+def get_snapshot(voting_id):
+    manifest = None if is_stale(voting_id) else read_manifest(voting_id)
+    return Snapshot(voting_id, manifest or empty_manifest(voting_id))
+
+
+def save_array(path, values):
+    def write(temporary):
+        with open(temporary, 'wb') as file:
+            np.save(file, values)
+    write_atomic(path, write)
+
+
+def compact_votes(voting_id, rebuild=False, batch_size=None):
+    # Дописывает в снимок новые голоса частями по batch_size. Читаются голоса с id больше
+    # last_vote_id - OVERLAP, уже сжатые пропускаются по id. rebuild (или флаг удаления голосов) -
+    # собрать снимок заново рядом и подменить старый целиком. Возвращает число добавленных голосов
+    batch_size = batch_size or get_columnar_settings()['BATCH_SIZE']
+    target = snapshot_directory(voting_id)
+    started = time.time()
+    rebuild = rebuild or is_stale(voting_id)
+    if rebuild:
+        directory = target.with_name(f'.{target.name}.rebuild')
+        shutil.rmtree(directory, ignore_errors=True)
+        manifest = empty_manifest(voting_id)
+    else:
+        directory = target
+        manifest = read_manifest(voting_id) or empty_manifest(voting_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    respondents = load_respondents(directory)
+    respondent_index = {int(user_id): index for index, user_id in enumerate(respondents)}
+    snapshot = Snapshot(voting_id, manifest)
+    overlap_from = snapshot.overlap_from
+    compacted = set(snapshot.window(overlap_from)['id'].tolist())
+
+    votes = Vote.objects.filter(voting_id=voting_id, id__gt=overlap_from)
+    rows = (row for row in keyset_iterator(votes, ['id', 'user_id', 'question_id', 'choice_id'],
+                                           chunk_size=min(batch_size, 50_000))
+            if row[0] not in compacted)
+    added = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        ids, user_ids, question_ids, choice_ids = zip(*batch)
+        known = len(respondent_index)
+        for user_id in user_ids:
+            respondent_index.setdefault(user_id, len(respondent_index))
+        part = f'part-{len(manifest["parts"]):06d}-{uuid.uuid4().hex[:8]}'
+        save_array(directory / f'{part}.id.npy', np.array(ids, dtype=COLUMN_DTYPES['id']))
+        save_array(directory / f'{part}.respondent.npy',
+                   np.fromiter((respondent_index[user_id] for user_id in user_ids), COLUMN_DTYPES['respondent'],
+                               len(batch)))
+        save_array(directory / f'{part}.question.npy', np.array(question_ids, dtype=COLUMN_DTYPES['question']))
+        save_array(directory / f'{part}.choice.npy', np.array(choice_ids, dtype=COLUMN_DTYPES['choice']))
+        if len(respondent_index) > known:
+            respondents = np.fromiter(respondent_index, np.int64, len(respondent_index))
+            save_array(directory / 'respondents.npy', respondents)
+        # Манифест пишется последним: часть без записи в манифесте читатели не видят
+        manifest = {**manifest, 'last_vote_id': max(manifest['last_vote_id'], ids[-1]),
+                    'votes': manifest['votes'] + len(batch), 'parts': manifest['parts'] + [part]}
+        write_manifest(directory, manifest)
+        added += len(batch)
+
+    write_manifest(directory, manifest)
+    if rebuild:
+        # Голоса, удаленные во время пересборки, могли в нее попасть: флаг переносится в новый снимок
+        flag = target / STALE_FLAG
+        if flag.exists() and flag.stat().st_mtime >= started:
+            (directory / STALE_FLAG).touch()
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(directory, target)
+    return added
+
+
+def delete_snapshot(voting_id):
+    shutil.rmtree(snapshot_directory(voting_id), ignore_errors=True)
+
+
+def delta_choice_counts(snapshot):
+    # Поправка к снимку одним сгруппированным запросом: голоса окна перекрытия из базы
+    # минус те из них, что уже есть в снимке
+    overlap_from = snapshot.overlap_from
+    counts = dict(Vote.objects.filter(voting_id=snapshot.voting_id, id__gt=overlap_from).order_by()
+                  .values_list('choice_id').annotate(total=Count('id')))
+    choice_ids, totals = np.unique(snapshot.window(overlap_from)['choice'], return_counts=True)
+    for choice_id, total in zip(choice_ids.tolist(), totals.tolist()):
+        counts[choice_id] = counts.get(choice_id, 0) - total
+    return counts
@@ -0,0 +1,186 @@
+import threading
+from collections import OrderedDict
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+
+from .columnar import get_snapshot, load_respondents
+from .models import Question, Choice, Vote
+from .results_cache import current_version
+from .statistics import build_poll_statistics
+
+DEFAULT_CROSSTAB_SETTINGS = {
+    # Сколько матриц опросов держать в памяти процесса и их суммарный размер (байт на ячейку)
+    'MAX_MATRICES': 4,
+    'MAX_BYTES': 512 * 1024 * 1024,
+    # Строк матрицы в одном умножении при подсчете таблицы: ограничивает временную память
+    'CHUNK_ROWS': 65536,
+    # Наибольший размер таблицы: варианты вопросов строк x варианты вопросов столбцов
+    'MAX_CELLS': 250_000,
+}
+
+
+def get_crosstab_settings():
+    return {**DEFAULT_CROSSTAB_SETTINGS, **getattr(settings, 'CROSSTAB', {})}
+
+
+class CrosstabError(ValueError):
+    pass
+
+
+class PollMatrix:
+    # Опрос как булева матрица респондент x вариант: matrix[i, j] - респондент i выбрал вариант choice_ids[j].
+    # Варианты упорядочены по вопросу, поэтому столбцы одного вопроса идут подряд
+    def __init__(self, questions, choices, matrix):
+        self.questions = questions
+        self.choices = choices
+        self.matrix = matrix
+        self.choice_ids = np.array([choice['id'] for choice in choices], dtype=np.int64)
+        self.columns = {choice['id']: index for index, choice in enumerate(choices)}
+        self.question_columns = {question['id']: [] for question in questions}
+        for index, choice in enumerate(choices):
+            self.question_columns.setdefault(choice['question_id'], []).append(index)
+
+    def filter_mask(self, choice_ids):
+        # Варианты одного вопроса объединяются через ИЛИ, условия разных вопросов - через И
+        mask = np.ones(len(self.matrix), dtype=bool)
+        by_question = {}
+        for choice_id in choice_ids:
+            if choice_id not in self.columns:
+                raise CrosstabError(f'Choice {choice_id} does not belong to the specified voting')
+            by_question.setdefault(self.choices[self.columns[choice_id]]['question_id'], []).append(
+                self.columns[choice_id])
+        for columns in by_question.values():
+            mask &= self.matrix[:, columns].any(axis=1)
+        return mask
+
+    def columns_of(self, question_ids):
+        columns = []
+        for question_id in question_ids:
+            if question_id not in self.question_columns:
+                raise CrosstabError(f'Question {question_id} does not belong to the specified voting')
+            columns += self.question_columns[question_id]
+        return columns
+
+
+def load_poll_votes(poll_id):
+    # Пары (пользователь, вариант): из колоночного снимка, если он есть, и голоса окна перекрытия из базы,
+    # которых еще нет в снимке
+    snapshot = get_snapshot(poll_id)
+    users, choices = [], []
+    if snapshot.manifest['parts']:
+        respondents = load_respondents(snapshot.directory)
+        for part in snapshot.parts():
+            users.append(respondents[part['respondent']])
+            choices.append(part['choice'].astype(np.int64))
+    overlap_from = snapshot.overlap_from
+    delta = (Vote.objects.filter(voting_id=poll_id, id__gt=overlap_from).order_by()
+             .values_list('id', 'user_id', 'choice_id').iterator())
+    rows = np.fromiter(chain.from_iterable(delta), dtype=np.int64).reshape(-1, 3)
+    rows = rows[~np.isin(rows[:, 0], snapshot.window(overlap_from)['id'])]
+    users.append(rows[:, 1])
+    choices.append(rows[:, 2])
+    return np.concatenate(users), np.concatenate(choices)
+
+
+def build_matrix(poll_id):
+    questions = list(Question.objects.filter(page__voting_id=poll_id).order_by('id').values('id', 'title', 'type'))
+    choices = list(Choice.objects.filter(question__page__voting_id=poll_id).order_by('question_id', 'id')
+                   .values('id', 'name', 'question_id'))
+    users, picked = load_poll_votes(poll_id)
+    choice_ids = np.array([choice['id'] for choice in choices], dtype=np.int64)
+    # Номер столбца по id варианта через поиск в отсортированных id; голоса за удаленные варианты отбрасываются
+    order = np.argsort(choice_ids)
+    positions = np.searchsorted(choice_ids[order], picked)
+    positions = np.minimum(positions, max(len(choice_ids) - 1, 0))
+    valid = choice_ids[order][positions] == picked if len(choice_ids) else np.zeros(len(picked), dtype=bool)
+    respondent_ids, rows = np.unique(users[valid], return_inverse=True)
+    matrix = np.zeros((len(respondent_ids), len(choice_ids)), dtype=bool)
+    matrix[rows, order[positions[valid]]] = True
+    return PollMatrix(questions, choices, matrix)
+
+
+class MatrixCache:
+    # Матрицы последних опросов в памяти процесса. Запись действительна, пока не изменилась версия опроса
+    # (results_cache.current_version меняется с каждой отправкой голосов)
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, poll_id):
+        version = current_version(poll_id)
+        with self._lock:
+            entry = self._entries.get(poll_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(poll_id)
+                return entry[1]
+        poll_matrix = build_matrix(poll_id)
+        options = get_crosstab_settings()
+        with self._lock:
+            self._entries[poll_id] = (version, poll_matrix)
+            self._entries.move_to_end(poll_id)
+            # Вытесняем старые матрицы, пока не уложимся в лимиты; последняя построенная остается всегда
+            while len(self._entries) > 1 and (
+                    len(self._entries) > options['MAX_MATRICES']
+                    or sum(entry[1].matrix.nbytes for entry in self._entries.values()) > options['MAX_BYTES']):
+                self._entries.popitem(last=False)
+        return poll_matrix
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+matrix_cache = MatrixCache()
+
+
+def filtered_counts(matrix, rows, row_columns, column_columns, chunk_rows):
+    # Пачками строк: число выбравших каждый вариант и left.T @ right (float32 через BLAS, точно в пределах
+    # пачки < 2**24, сумма копится в int64). rows - номера отфильтрованных строк или None (все строки);
+    # копируется только текущая пачка выбранных столбцов, а не вся матрица
+    total = len(matrix) if rows is None else len(rows)
+    counts = np.zeros(matrix.shape[1], dtype=np.int64)
+    table = np.zeros((len(row_columns), len(column_columns)), dtype=np.int64)
+    for start in range(0, total, chunk_rows):
+        chunk = matrix[start:start + chunk_rows] if rows is None else matrix[rows[start:start + chunk_rows]]
+        counts += chunk.sum(axis=0)
+        table += np.rint(chunk[:, row_columns].T.astype(np.float32)
+                         @ chunk[:, column_columns].astype(np.float32)).astype(np.int64)
+    return counts, table
+
+
+def crosstab(poll_id, choice_ids, row_questions, column_questions):
+    # Результаты опроса среди респондентов, выбравших choice_ids, и таблица вариант x вариант
+    # (число таких респондентов, выбравших оба варианта) для вопросов строк и столбцов
+    if not row_questions or not column_questions:
+        raise CrosstabError('"rows" and "columns" question ids are required')
+    options = get_crosstab_settings()
+    poll_matrix = matrix_cache.get(poll_id)
+    row_columns = poll_matrix.columns_of(row_questions)
+    column_columns = poll_matrix.columns_of(column_questions)
+    if len(row_columns) * len(column_columns) > options['MAX_CELLS']:
+        raise CrosstabError(f'Crosstab is limited to {options["MAX_CELLS"]} cells, '
+                            f'requested {len(row_columns)} x {len(column_columns)}')
+    rows = np.flatnonzero(poll_matrix.filter_mask(choice_ids)) if choice_ids else None
+    counts, table = filtered_counts(poll_matrix.matrix, rows, row_columns, column_columns, options['CHUNK_ROWS'])
+    choices = [{**choice, 'votes_count': int(count)} for choice, count in zip(poll_matrix.choices, counts)]
+    return {
+        'voting_id': poll_id,
+        'respondents': len(poll_matrix.matrix),
+        'filtered_respondents': len(poll_matrix.matrix) if rows is None else len(rows),
+        'filters': list(choice_ids),
+        'results': build_poll_statistics(poll_matrix.questions, choices),
+        'crosstab': {
+            'rows': poll_matrix.choice_ids[row_columns].tolist(),
+            'columns': poll_matrix.choice_ids[column_columns].tolist(),
+            'counts': table.tolist(),
+        },
+    }
+
+
+def parse_ids(values, name):
+    try:
+        return [int(value) for value in values]
+    except ValueError:
+        raise CrosstabError(f'"{name}" must be a list of integer ids')
@@ -0,0 +1,62 @@
+import csv
+import tempfile
+
+from openpyxl import Workbook
+
+VOTE_EXPORT_HEADER = ['User', 'Question ID', 'Question', 'Choice ID', 'Choice']
+VOTE_EXPORT_FIELDS = ['id', 'user__username', 'question_id', 'question__title', 'choice_id', 'choice__name']
+
+
+def keyset_iterator(queryset, fields, chunk_size=5000):
+    # Обход по возрастанию id пачками: id > последнего прочитанного. Первое поле в fields - 'id'.
+    # В отличие от OFFSET, каждая пачка стоит одинаково, а в памяти держится только одна пачка
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id).order_by('id').values_list(*fields)[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1][0]
+
+
+def iter_vote_rows(votes, chunk_size=5000):
+    for row in keyset_iterator(votes, VOTE_EXPORT_FIELDS, chunk_size):
+        yield row[1:]
+
+
+class Echo:
+    # Псевдо-файл для csv.writer: write возвращает строку вместо записи в буфер
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    # BOM, чтобы Excel правильно открыл UTF-8
+    yield '\ufeff' + writer.writerow(VOTE_EXPORT_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def spool_to_file(chunks, max_memory=8 << 20):
+    # Под ASGI Django 3.2 перебирает StreamingHttpResponse в цикле событий, где ORM недоступен,
+    # поэтому содержимое заранее пишется во временный файл в потоке представления (до max_memory - в памяти)
+    output = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    for chunk in chunks:
+        output.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    output.seek(0)
+    return output
+
+
+def write_xlsx(rows):
+    # openpyxl в режиме write_only сбрасывает строки на диск по мере добавления.
+    # Возвращается временный файл, который удаляется при закрытии
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Votes')
+    sheet.append(VOTE_EXPORT_HEADER)
+    for row in rows:
+        sheet.append(row)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
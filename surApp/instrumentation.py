@@ -0,0 +1,177 @@
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+
+DEFAULT_INSTRUMENTATION_SETTINGS = {
+    # Запросы дольше этого порога пишутся в лог вместе с самыми медленными SQL, мс
+    'SLOW_REQUEST_MS': 500,
+    'SLOWEST_QUERIES': 3,
+    # Столько одинаковых SQL за запрос считается признаком N+1
+    'REPEATED_QUERY_THRESHOLD': 5,
+    'SERVER_TIMING': True,
+    # Окно для votes_ingested_per_second, секунды
+    'VOTES_RATE_WINDOW': 60,
+}
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_request_queries = ContextVar('request_queries', default=None)
+
+
+def get_instrumentation_settings():
+    return {**DEFAULT_INSTRUMENTATION_SETTINGS, **getattr(settings, 'REQUEST_INSTRUMENTATION', {})}
+
+
+class QueryLog:
+    # SQL одного запроса: текст и длительность каждого выполнения
+    def __init__(self):
+        self.queries = []
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for sql, duration in self.queries)
+
+    def slowest(self, limit):
+        return sorted(self.queries, key=lambda query: query[1], reverse=True)[:limit]
+
+    def repeated(self, threshold):
+        # Одинаковый текст SQL (параметры не входят в текст) много раз за запрос - типичный N+1
+        counts = Counter(sql for sql, duration in self.queries)
+        return [(sql, count) for sql, count in counts.most_common() if count >= threshold]
+
+
+def record_query(execute, sql, params, many, context):
+    # execute_wrapper для всех соединений. Пишет только внутри запроса, отмеченного middleware;
+    # ContextVar передается и в потоки sync_to_async, поэтому учитываются и асинхронные представления
+    log = _request_queries.get()
+    if log is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        log.queries.append((sql, time.perf_counter() - started))
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def start_query_log():
+    log = QueryLog()
+    return log, _request_queries.set(log)
+
+
+def stop_query_log(token):
+    _request_queries.reset(token)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series['buckets'][index] += 1
+        series['sum'] += value
+        series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series['buckets']):
+                bucket_labels = format_labels(self.label_names + ('le',), labels + (bound,))
+                lines.append(f'{self.name}_bucket{bucket_labels} {count}')
+            lines.append(f'{self.name}_bucket{format_labels(self.label_names + ("le",), labels + ("+Inf",))} '
+                         f'{series["count"]}')
+            lines.append(f'{self.name}_sum{format_labels(self.label_names, labels)} {series["sum"]}')
+            lines.append(f'{self.name}_count{format_labels(self.label_names, labels)} {series["count"]}')
+        return lines
+
+
+class MetricsRegistry:
+    # Метрики процесса в текстовом формате Prometheus. У каждого воркера свои значения,
+    # Prometheus собирает их с каждого процесса отдельно
+    def __init__(self):
+        self._lock = threading.Lock()
+        labels = ('view', 'method')
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Время обработки запроса', labels, DURATION_BUCKETS)
+        self.sql_queries = Histogram(
+            'http_request_sql_queries', 'Число SQL-запросов на запрос', labels, QUERY_COUNT_BUCKETS)
+        self.sql_duration = Histogram(
+            'http_request_sql_duration_seconds', 'Суммарное время SQL на запрос', labels, DURATION_BUCKETS)
+        self.votes_ingested = 0
+        self._votes_window = deque()
+
+    def observe_request(self, view, method, duration, log):
+        labels = (view, method)
+        with self._lock:
+            self.request_duration.observe(labels, duration)
+            self.sql_queries.observe(labels, log.count)
+            self.sql_duration.observe(labels, log.duration)
+
+    def record_votes(self, count):
+        now = time.monotonic()
+        with self._lock:
+            self.votes_ingested += count
+            self._votes_window.append((now, count))
+
+    def votes_per_second(self, window):
+        now = time.monotonic()
+        with self._lock:
+            while self._votes_window and self._votes_window[0][0] < now - window:
+                self._votes_window.popleft()
+            return sum(count for moment, count in self._votes_window) / window
+
+    def render(self, extra_gauges=()):
+        options = get_instrumentation_settings()
+        with self._lock:
+            lines = self.request_duration.render() + self.sql_queries.render() + self.sql_duration.render()
+            lines += [
+                '# HELP votes_ingested_total Принятые голоса',
+                '# TYPE votes_ingested_total counter',
+                f'votes_ingested_total {self.votes_ingested}',
+            ]
+        lines += [
+            '# HELP votes_ingested_per_second Принятые голоса в секунду за последнее окно',
+            '# TYPE votes_ingested_per_second gauge',
+            f'votes_ingested_per_second {self.votes_per_second(options["VOTES_RATE_WINDOW"])}',
+        ]
+        for name, documentation, value in extra_gauges:
+            lines += [f'# HELP {name} {documentation}', f'# TYPE {name} gauge', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def record_votes_ingested(count):
+    metrics.record_votes(count)
@@ -0,0 +1,208 @@
+import json
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from .results_cache import cached_results, get_results_cache, version_key
+from .statistics import STATISTICS_SOURCES
+
+DEFAULT_LIVE_RESULTS_SETTINGS = {
+    'BACKEND': 'surApp.live.ResultsCacheBackend',
+    # Как часто проверять изменения опроса: все голоса за интервал уходят зрителям одним событием
+    'INTERVAL': 1.0,
+    # Комментарий-пинг, чтобы прокси не закрывали молчащее соединение
+    'HEARTBEAT': 15.0,
+    # После этого поток закрывается, EventSource переподключается сам (освобождает поток воркера)
+    'MAX_AGE': 300.0,
+    # Сколько последних событий хранить для продолжения по Last-Event-ID
+    'BACKLOG': 64,
+}
+
+
+def get_live_settings():
+    return {**DEFAULT_LIVE_RESULTS_SETTINGS, **getattr(settings, 'LIVE_RESULTS', {})}
+
+
+class ResultsCacheBackend:
+    # Межпроцессный источник изменений: версия опроса в кеше результатов меняется с каждой
+    # принятой отправкой голосов, а пересчитанный результат общий для всех процессов
+    def version(self, voting_id):
+        return get_results_cache().get(version_key(voting_id))
+
+    def load(self, voting_id, source):
+        try:
+            return cached_results(voting_id, source, STATISTICS_SOURCES[source])
+        finally:
+            # Пересчет идет в потоке одного из зрителей, который потом долго ждет: соединение не держим
+            connections.close_all()
+
+
+def choice_counts(data):
+    return {choice['choice_id']: choice['votes_count'] for question in data for choice in question['choices']}
+
+
+def without_counts(data):
+    return [
+        {**question, 'choices': [{**choice, 'votes_count': None} for choice in question['choices']]}
+        for question in data
+    ]
+
+
+def diff_results(old, new):
+    # Изменилось только число голосов - список изменившихся вариантов, иначе (правка дерева) - None
+    if without_counts(old) != without_counts(new):
+        return None
+    old_counts = choice_counts(old)
+    return [
+        {'question_id': question['question_id'], 'choice_id': choice['choice_id'],
+         'votes_count': choice['votes_count'], 'delta': choice['votes_count'] - old_counts[choice['choice_id']]}
+        for question in new
+        for choice in question['choices']
+        if choice['votes_count'] != old_counts[choice['choice_id']]
+    ]
+
+
+class PollFeed:
+    def __init__(self, backlog):
+        self.subscribers = 0
+        self.version = None
+        self.data = None
+        # Номера событий начинаются с текущего времени в мс: Last-Event-ID от прежнего экземпляра
+        # ленты всегда меньше, и такой клиент получит состояние целиком
+        self.seq = int(time.time() * 1000)
+        self.events = deque(maxlen=backlog)
+        self.next_refresh = 0.0
+        self.refreshing = False
+
+    def events_after(self, seq):
+        if seq >= self.seq:
+            return []
+        if not self.events or self.events[0][0] > seq + 1:
+            # Нужные события уже вытеснены - отправляем текущее состояние целиком
+            return [(self.seq, 'snapshot', self.data)]
+        return [event for event in self.events if event[0] > seq]
+
+
+class LiveResultsBroker:
+    # Раздача результатов опроса всем зрителям процесса. Изменения проверяет не чаще раза в INTERVAL
+    # один из ожидающих зрителей, остальные получают готовое событие
+    def __init__(self, backend, interval, backlog):
+        self.backend = backend
+        self.interval = interval
+        self.backlog = backlog
+        self._feeds = {}
+        self._condition = threading.Condition()
+
+    def subscribe(self, voting_id, source):
+        key = (voting_id, source)
+        with self._condition:
+            feed = self._feeds.setdefault(key, PollFeed(self.backlog))
+            feed.subscribers += 1
+            if feed.data is not None:
+                return feed.seq, feed.data
+        try:
+            self.refresh(key)
+        except Exception:
+            self.unsubscribe(voting_id, source)
+            raise
+        with self._condition:
+            return feed.seq, feed.data
+
+    def unsubscribe(self, voting_id, source):
+        key = (voting_id, source)
+        with self._condition:
+            feed = self._feeds[key]
+            feed.subscribers -= 1
+            if not feed.subscribers:
+                del self._feeds[key]
+
+    def wait(self, voting_id, source, after_seq, timeout):
+        # События после after_seq; пустой список - за timeout ничего не изменилось
+        key = (voting_id, source)
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._condition:
+                feed = self._feeds[key]
+                events = feed.events_after(after_seq)
+                now = time.monotonic()
+                if events or now >= deadline:
+                    return events
+                if feed.refreshing or feed.next_refresh > now:
+                    self._condition.wait(min(deadline, max(feed.next_refresh, now + 0.01)) - now)
+                    continue
+                feed.refreshing = True
+            self.refresh(key)
+
+    def refresh(self, key):
+        voting_id, source = key
+        with self._condition:
+            feed = self._feeds[key]
+            feed.refreshing = True
+        try:
+            version = self.backend.version(voting_id)
+            if feed.data is not None and version is not None and version == feed.version:
+                return
+            data = self.backend.load(voting_id, source)
+            with self._condition:
+                if feed.data is None:
+                    feed.data = data
+                elif data != feed.data:
+                    changes = diff_results(feed.data, data)
+                    feed.seq += 1
+                    if changes is None:
+                        feed.events.append((feed.seq, 'snapshot', data))
+                    else:
+                        feed.events.append((feed.seq, 'delta', changes))
+                    feed.data = data
+                else:
+                    # Версия выросла, а данные прежние: результат мог быть отдан устаревшим, проверим еще раз
+                    version = feed.version
+                feed.version = version
+        finally:
+            with self._condition:
+                feed.refreshing = False
+                feed.next_refresh = time.monotonic() + self.interval
+                self._condition.notify_all()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            options = get_live_settings()
+            _broker = LiveResultsBroker(import_string(options['BACKEND'])(), options['INTERVAL'], options['BACKLOG'])
+        return _broker
+
+
+def sse_event(event, seq, data):
+    return f'id: {seq}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def iter_live_results(broker, voting_id, source, last_event_id=None):
+    # Сначала состояние опроса целиком, затем только изменения счетчиков
+    options = get_live_settings()
+    seq, data = broker.subscribe(voting_id, source)
+    try:
+        if last_event_id is not None and last_event_id <= seq:
+            # Переподключение: досылаем пропущенное из очереди событий
+            seq = last_event_id
+        else:
+            yield sse_event('snapshot', seq, data)
+        started = time.monotonic()
+        while time.monotonic() - started < options['MAX_AGE']:
+            events = broker.wait(voting_id, source, seq, options['HEARTBEAT'])
+            if not events:
+                yield ': keepalive\n\n'
+                continue
+            for seq, event, data in events:
+                yield sse_event(event, seq, data)
+    finally:
+        broker.unsubscribe(voting_id, source)
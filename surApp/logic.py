@@ -0,0 +1,104 @@
+import json
+
+from .models import Page, Choice
+
+
+class LogicError(ValueError):
+    pass
+
+
+def parse_rules(value, name):
+    # Правила приходят строкой JSON ("[[1, 2], [2, 3]]") или уже списком
+    if isinstance(value, str):
+        if not value.strip():
+            return []
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise LogicError(f"{name}: invalid JSON")
+    if not isinstance(value, list) or not all(isinstance(item, list) for item in value):
+        raise LogicError(f"{name}: expected a list of lists")
+    for item in value:
+        if not all(isinstance(number, int) and not isinstance(number, bool) for number in item):
+            raise LogicError(f"{name}: expected integer ids")
+    return value
+
+
+def dump_rules(value):
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def compile_logic(voting, question_answer_pairs, hidden_pages, strict=True):
+    # Проверяет правила по реальным id вопросов, вариантов и страниц опроса и строит индекс:
+    #   pages    - id страниц в порядке показа,
+    #   position - id страницы -> позиция в pages,
+    #   hide     - id варианта -> страницы, которые он скрывает.
+    # При strict=False неверные правила пропускаются (после правки дерева опроса)
+    pairs = parse_rules(question_answer_pairs, 'question_answer_pairs')
+    hidden = parse_rules(hidden_pages, 'hidden_pages')
+    if len(pairs) != len(hidden):
+        raise LogicError("question_answer_pairs and hidden_pages must have the same length")
+
+    pages = list(Page.objects.filter(voting=voting).order_by('order', 'id').values_list('id', flat=True))
+    choice_questions = dict(
+        Choice.objects.filter(question__page__voting=voting).values_list('id', 'question_id')
+    )
+    page_ids = set(pages)
+
+    hide = {}
+    for pair, hidden_for_choice in zip(pairs, hidden):
+        try:
+            if len(pair) != 2:
+                raise LogicError(f"Rule {pair}: expected [question_id, choice_id]")
+            question_id, choice_id = pair
+            if choice_questions.get(choice_id) != question_id:
+                raise LogicError(f"Rule {pair}: choice does not belong to the question in this voting")
+            unknown = set(hidden_for_choice) - page_ids
+            if unknown:
+                raise LogicError(f"Rule {pair}: unknown pages {sorted(unknown)}")
+        except LogicError:
+            if strict:
+                raise
+            continue
+        hide.setdefault(str(choice_id), set()).update(hidden_for_choice)
+
+    return {
+        'pages': pages,
+        'position': {str(page_id): position for position, page_id in enumerate(pages)},
+        'hide': {choice_id: sorted(page_set) for choice_id, page_set in hide.items()},
+    }
+
+
+def recompile_logic(voting):
+    # Индекс нужен и без правил: в нем хранится порядок страниц
+    try:
+        voting.logic_index = compile_logic(voting, voting.question_answer_pairs, voting.hidden_pages, strict=False)
+    except LogicError:
+        voting.logic_index = {}
+    voting.save(update_fields=['logic_index'])
+
+
+def hidden_pages_for(index, choice_ids):
+    hide = index.get('hide', {})
+    hidden = set()
+    for choice_id in choice_ids:
+        hidden.update(hide.get(str(choice_id), ()))
+    return hidden
+
+
+def next_visible_page(index, current_page_id, choice_ids):
+    # Следующая нескрытая страница после current_page_id (None - с начала опроса).
+    # Позиция берется из индекса, а скрытые страницы - объединением по выбранным вариантам
+    pages = index.get('pages', [])
+    if current_page_id is None:
+        start = 0
+    else:
+        position = index.get('position', {}).get(str(current_page_id))
+        if position is None:
+            raise LogicError("Unknown page")
+        start = position + 1
+    hidden = hidden_pages_for(index, choice_ids)
+    for page_id in pages[start:]:
+        if page_id not in hidden:
+            return page_id, hidden
+    return None, hidden
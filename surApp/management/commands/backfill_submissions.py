@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from surApp.models import Voting, Submission
+from surApp.submissions import iter_missing_submissions
+
+
+class Command(BaseCommand):
+    help = ('Создает Submission для голосов, которых нет ни в одной отправке (приняты до появления Submission '
+            'или загружены прерванным import_votes): по одной отправке на респондента')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voting', type=int, help='Только этот опрос')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Submission в одном INSERT')
+
+    def handle(self, *args, **options):
+        votings = Voting.objects.order_by('id').values_list('id', flat=True)
+        if options['voting'] is not None:
+            votings = votings.filter(id=options['voting'])
+        total = 0
+        for voting_id in votings:
+            # Каждый опрос - отдельная транзакция; повторный запуск не находит непокрытых голосов
+            with transaction.atomic():
+                created = len(Submission.objects.bulk_create(iter_missing_submissions(voting_id),
+                                                             batch_size=options['batch_size']))
+            if created:
+                total += created
+                self.stdout.write(f'Опрос {voting_id}: создано {created}')
+        self.stdout.write(self.style.SUCCESS(f'Готово, создано отправок: {total}'))
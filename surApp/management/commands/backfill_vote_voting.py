@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+
+from surApp.models import Vote, Question
+
+
+class Command(BaseCommand):
+    help = 'Заполняет Vote.voting у старых голосов короткими пачками по диапазонам id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10_000, help='Размер диапазона id в одной транзакции')
+        parser.add_argument('--start-id', type=int, default=0, help='Продолжить с указанного id')
+        parser.add_argument('--pause', type=float, default=0.0, help='Пауза между пачками в секундах')
+
+    def handle(self, *args, **options):
+        # Каждая пачка - отдельная короткая транзакция, блокирующая только свои строки.
+        # Команду можно прервать и запустить снова: заполняются только строки с пустым voting
+        max_id = Vote.objects.filter(voting__isnull=True).aggregate(max_id=Max('id'))['max_id']
+        if max_id is None:
+            self.stdout.write(self.style.SUCCESS('Все голоса уже заполнены'))
+            return
+
+        voting_of_question = Question.objects.filter(id=OuterRef('question_id')).values('page__voting_id')[:1]
+        last_id = options['start_id']
+        total = 0
+        while last_id < max_id:
+            upper = last_id + options['batch_size']
+            with transaction.atomic():
+                updated = (Vote.objects.filter(id__gt=last_id, id__lte=upper, voting__isnull=True)
+                           .update(voting_id=Subquery(voting_of_question)))
+            total += updated
+            last_id = upper
+            self.stdout.write(f'id <= {min(upper, max_id)}: заполнено {updated} (всего {total})')
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(f'Готово, заполнено голосов: {total}'))
@@ -0,0 +1,70 @@
+import base64
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from surApp.authentication import CachedJWTAuthentication, issue_tokens, user_cache, blacklist_cache
+from surApp.benchmarks import benchmark_database, measure
+from surApp.views import HomeView
+
+# Режим -> (класс аутентификации, настройки AUTH_FAST_PATH)
+AUTH_MODES = {
+    'basic': (BasicAuthentication, {}),
+    'jwt': (JWTAuthentication, {}),
+    'cached': (CachedJWTAuthentication, {'MODE': 'cached'}),
+    'stateless': (CachedJWTAuthentication, {'MODE': 'stateless'}),
+}
+
+
+class Command(BaseCommand):
+    help = 'Замеряет пропускную способность аутентифицированных запросов для разных способов аутентификации'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=list(AUTH_MODES), default=list(AUTH_MODES),
+                            help='Способы аутентификации')
+        parser.add_argument('--repeat', type=int, default=500, help='Число запросов для каждого способа')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = User.objects.create_user(username='bench', password='bench-password')
+            headers = {
+                'basic': 'Basic ' + base64.b64encode(b'bench:bench-password').decode(),
+                'jwt': f'Bearer {issue_tokens(user).access_token}',
+            }
+            results = [self.run_mode(mode, headers, options['repeat']) for mode in options['modes']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write(
+                f"{result['mode']:>10}: {result['requests_per_second']:.0f} запросов/с, "
+                f"p50={result['p50_ms']:.2f} мс, p95={result['p95_ms']:.2f} мс, запросов к базе={result['queries']}"
+            )
+
+    def run_mode(self, mode, headers, repeat):
+        authentication_class, fast_path = AUTH_MODES[mode]
+        view = HomeView.as_view(authentication_classes=[authentication_class])
+        factory = APIRequestFactory()
+        header = headers['basic' if mode == 'basic' else 'jwt']
+        user_cache.clear()
+        blacklist_cache.clear()
+
+        def request():
+            response = view(factory.get('/home/', HTTP_AUTHORIZATION=header))
+            assert response.data['message'] != 'Войти', mode
+
+        with override_settings(AUTH_FAST_PATH=fast_path):
+            # Первый запрос заполняет кеши, замеряется установившийся режим
+            request()
+            started = time.perf_counter()
+            summary = measure(request, repeat)
+            elapsed = time.perf_counter() - started
+        return {'mode': mode, 'requests_per_second': round(repeat / elapsed, 1), **summary}
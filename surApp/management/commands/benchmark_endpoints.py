@@ -0,0 +1,143 @@
+import json
+import platform
+from datetime import datetime, timezone
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from surApp.benchmarks import benchmark_database, measure, peak_python_mb, max_rss_mb
+from surApp.models import Choice
+from surApp.synthetic import survey_payload, generate_survey, generate_respondents, generate_votes
+
+ENDPOINTS = ['create', 'detail', 'answer', 'poll-statistic', 'detail-statistic', 'export-votes',
+             'export-voting-json']
+
+NO_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Замеряет p50/p95/p99, число SQL-запросов и пиковую память основных эндпоинтов на опросах '
+            'с разным числом голосов и пишет результат в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000],
+                            help='Число голосов в опросе')
+        parser.add_argument('--shape', default='3x5x4', help='Форма опроса: страницы x вопросы x варианты')
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS)
+        parser.add_argument('--repeat', type=int, default=10, help='Число запросов к каждому эндпоинту')
+        parser.add_argument('--cold', action='store_true',
+                            help='Без кеша (DummyCache): замеряется подсчет, а не отдача из кеша')
+        parser.add_argument('--output', help='Файл для JSON (по умолчанию - stdout)')
+        parser.add_argument('--compare', help='JSON прошлого запуска: вывести изменение p50 по каждому замеру')
+
+    def handle(self, *args, **options):
+        try:
+            shape = [int(part) for part in options['shape'].lower().split('x')]
+            pages, questions, choices = shape
+        except ValueError:
+            raise CommandError('--shape ожидается в виде 3x5x4')
+
+        caches_override = override_settings(CACHES=NO_CACHES) if options['cold'] else override_settings()
+        with caches_override, benchmark_database():
+            caches['default'].clear()
+            author = User.objects.create_user(username='bench_author')
+            respondents = generate_respondents(max(1, max(options['sizes']) // (pages * questions)) + 1,
+                                               prefix='bench_respondent')
+            client = Client()
+            client.force_login(author)
+            results = []
+            for size in sorted(options['sizes']):
+                voting = generate_survey(author, pages, questions, choices, title=f'Benchmark {size}')
+                generate_votes(voting, respondents, size)
+                for endpoint in options['endpoints']:
+                    request = self.make_request(endpoint, client, voting, respondents[-1], shape)
+                    result = {
+                        'endpoint': endpoint,
+                        'votes': size,
+                        **measure(request, options['repeat']),
+                        'peak_python_mb': peak_python_mb(request),
+                    }
+                    results.append(result)
+                    self.stderr.write(
+                        f"{size:>9} голосов, {endpoint:<18}: p50={result['p50_ms']:.1f} мс, "
+                        f"p95={result['p95_ms']:.1f} мс, запросов={result['queries']}, "
+                        f"пик {result['peak_python_mb']} МБ"
+                    )
+
+        report = {
+            'meta': {
+                'started_at': datetime.now(timezone.utc).isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'shape': options['shape'],
+                'repeat': options['repeat'],
+                'cold': options['cold'],
+                'max_rss_mb': max_rss_mb(),
+            },
+            'results': results,
+        }
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def make_request(self, endpoint, client, voting, respondent_id, shape):
+        # Каждый вызов - один запрос к эндпоинту; ответ читается целиком, включая потоковые
+        if endpoint == 'create':
+            payload = json.dumps(survey_payload(*shape))
+            return self.requester(client.post, reverse('voting-create'), payload, 201, content_type='application/json')
+        if endpoint == 'detail':
+            return self.requester(client.get, reverse('voting-detail', args=[voting.id]), None, 200)
+        if endpoint == 'answer':
+            answers = {}
+            for choice_id, question_id in (Choice.objects.filter(question__page__voting=voting)
+                                           .order_by('id').values_list('id', 'question_id')):
+                answers.setdefault(question_id, choice_id)
+            payload = json.dumps([{'user': respondent_id, 'question': question_id, 'choice': choice_id}
+                                  for question_id, choice_id in answers.items()])
+            return self.requester(client.post, reverse('do_response', args=[voting.id]), payload, None,
+                                  content_type='application/json')
+        if endpoint == 'poll-statistic':
+            return self.requester(client.get, reverse('poll-statistic', args=[voting.id]), None, 200)
+        if endpoint == 'detail-statistic':
+            return self.requester(client.get, reverse('detail-statistic', args=[voting.id]), None, 200)
+        if endpoint == 'export-votes':
+            return self.requester(client.get, reverse('export-votes', args=[voting.id]), None, 200)
+        return self.requester(client.get, reverse('export-voting-json', args=[voting.id]), None, 200)
+
+    def requester(self, method, url, payload, expected_status, **kwargs):
+        args = (url,) if payload is None else (url, payload)
+
+        def request():
+            response = method(*args, **kwargs)
+            # Прием голосов отвечает 201 или 202 в зависимости от VOTE_INGESTION_MODE
+            assert response.status_code < 300 and expected_status in (None, response.status_code), \
+                (url, response.status_code)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            response.close()
+        return request
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            previous = {(item['endpoint'], item['votes']): item for item in json.load(file)['results']}
+        for result in results:
+            before = previous.get((result['endpoint'], result['votes']))
+            if before is None or not before['p50_ms']:
+                continue
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+            self.stderr.write(
+                f"{result['votes']:>9} голосов, {result['endpoint']:<18}: p50 {before['p50_ms']:.1f} -> "
+                f"{result['p50_ms']:.1f} мс ({change:+.0f}%), запросов {before['queries']} -> {result['queries']}"
+            )
@@ -0,0 +1,78 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from surApp.benchmarks import benchmark_database, measure_memory
+from surApp.models import Voting, Page, Question, Choice, Vote
+
+EXPORT_MODES = {
+    'legacy': {},
+    'csv': {'stream': 'csv'},
+    'xlsx': {'stream': 'xlsx'},
+}
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время и пиковую память выгрузки api/export-votes/<voting_id>/ на разном числе голосов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                            help='Число голосов в опросе')
+        parser.add_argument('--modes', nargs='+', choices=list(EXPORT_MODES), default=['csv', 'xlsx'],
+                            help='Способы выгрузки: legacy (pandas), csv, xlsx')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmark_database():
+            author = User.objects.create_user(username='bench_author')
+            User.objects.bulk_create([User(username=f'bench_voter_{i}') for i in range(1000)])
+            voters = list(User.objects.filter(username__startswith='bench_voter_').values_list('id', flat=True))
+            client = Client()
+            client.force_login(author)
+            for size in sorted(options['sizes']):
+                voting = self.make_voting(author, voters, size)
+                url = reverse('export-votes', args=[voting.id])
+                for mode in options['modes']:
+                    def export():
+                        response = client.get(url, EXPORT_MODES[mode])
+                        assert response.status_code == 200, response.status_code
+                        if response.streaming:
+                            for _ in response.streaming_content:
+                                pass
+                        else:
+                            response.content
+                        response.close()
+
+                    result = {'votes': size, 'mode': mode, **measure_memory(export)}
+                    results.append(result)
+                    if not options['json']:
+                        self.stdout.write(
+                            f"{size:>9} голосов, {mode:<6}: {result['seconds']:.2f} с, "
+                            f"пик Python {result['peak_python_mb']} МБ, прирост RSS {result['peak_rss_growth_mb']} МБ"
+                        )
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+
+    def make_voting(self, author, voters, size):
+        voting = Voting.objects.create(title=f'Export benchmark {size}', description='', author=author)
+        page = Page.objects.create(voting=voting, title='Страница')
+        pairs = []
+        for question_index in range(10):
+            question = Question.objects.create(page=page, title=f'Вопрос {question_index}')
+            for choice_index in range(4):
+                choice = Choice.objects.create(question=question, name=f'Вариант {choice_index}')
+                pairs.append((question.id, choice.id))
+        batch = []
+        for index in range(size):
+            question_id, choice_id = pairs[index % len(pairs)]
+            batch.append(Vote(voting=voting, user_id=voters[index % len(voters)], question_id=question_id,
+                              choice_id=choice_id))
+            if len(batch) == 10_000:
+                Vote.objects.bulk_create(batch)
+                batch = []
+        Vote.objects.bulk_create(batch)
+        return voting
@@ -0,0 +1,51 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from surApp.benchmarks import benchmark_database, measure
+from surApp.models import Voting, Page, Question, Choice
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время отправки ответов в api/answer-voting/<pk>/ в зависимости от числа ответов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[5, 50, 500], help='Число ответов в отправке')
+        parser.add_argument('--repeat', type=int, default=20, help='Число повторов для каждого размера')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            results = [self.run_size(size, options['repeat']) for size in options['sizes']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write(
+                f"{result['answers']:>6} ответов: p50={result['p50_ms']:.1f} мс, "
+                f"p95={result['p95_ms']:.1f} мс, запросов={result['queries']}"
+            )
+
+    def run_size(self, size, repeat):
+        user = User.objects.create_user(username=f'bench_{size}')
+        voting = Voting.objects.create(title=f'Benchmark {size}', description='', author=user)
+        page = Page.objects.create(voting=voting, title='Страница')
+        payload = []
+        for index in range(size):
+            question = Question.objects.create(page=page, title=f'Вопрос {index}')
+            choice = Choice.objects.create(question=question, name='Вариант')
+            payload.append({'user': user.id, 'question': question.id, 'choice': choice.id})
+
+        client = Client()
+        url = reverse('do_response', args=[voting.id])
+        body = json.dumps(payload)
+
+        def submit():
+            response = client.post(url, body, content_type='application/json')
+            assert response.status_code == 201, response.content
+
+        return {'answers': size, **measure(submit, repeat)}
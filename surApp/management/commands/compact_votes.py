@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from surApp.columnar import compact_votes, get_columnar_settings
+from surApp.models import Voting
+
+
+class Command(BaseCommand):
+    help = ('Дописывает новые голоса опросов в колоночные снимки .npy (COLUMNAR_SNAPSHOTS), '
+            'по которым считается api/poll-statistic/?source=columnar')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voting', type=int, action='append', help='Только эти опросы (можно повторять)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Собрать снимки заново (снимки с удаленными голосами пересобираются и без флага)')
+        parser.add_argument('--batch-size', type=int, help='Голосов в одной части снимка')
+
+    def handle(self, *args, **options):
+        votings = Voting.objects.order_by('id').values_list('id', flat=True)
+        if options['voting']:
+            votings = votings.filter(id__in=options['voting'])
+        batch_size = options['batch_size'] or get_columnar_settings()['BATCH_SIZE']
+        total = 0
+        started = time.perf_counter()
+        for voting_id in votings:
+            added = compact_votes(voting_id, rebuild=options['rebuild'], batch_size=batch_size)
+            if added:
+                total += added
+                self.stdout.write(f'Опрос {voting_id}: добавлено голосов {added}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {total} голосов за {time.perf_counter() - started:.2f} с'))
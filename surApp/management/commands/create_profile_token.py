@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from surApp.profiling import get_profiling_settings, make_profile_token
+
+
+class Command(BaseCommand):
+    help = 'Выдает подписанное значение заголовка X-Profile-Token для профилирования запроса без учетной записи сотрудника'
+
+    def handle(self, *args, **options):
+        max_age = get_profiling_settings()['TOKEN_MAX_AGE']
+        self.stderr.write(f'Действует {max_age} с. Пример: curl -H "X-Profile-Token: <токен>" ...')
+        self.stdout.write(make_profile_token())
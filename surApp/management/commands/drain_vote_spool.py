@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from surApp.spool import drain_spool, get_spool_settings, get_vote_spool
+
+
+class Command(BaseCommand):
+    help = 'Переносит голоса из локального журнала (VOTE_INGESTION_MODE = "spool") в таблицу Vote пачками'
+
+    def add_arguments(self, parser):
+        spool_settings = get_spool_settings()
+        parser.add_argument('--batch-size', type=int, default=spool_settings['BATCH_SIZE'],
+                            help='Максимум голосов в одной вставке')
+        parser.add_argument('--interval', type=float, default=spool_settings['FLUSH_INTERVAL'],
+                            help='Пауза в секундах, когда журнал пуст')
+        parser.add_argument('--once', action='store_true', help='Очистить журнал и завершиться')
+        parser.add_argument('--status', action='store_true', help='Показать глубину журнала и завершиться')
+
+    def handle(self, *args, **options):
+        spool = get_vote_spool()
+        if options['status']:
+            depth = spool.depth()
+            self.stdout.write(f"Записей: {depth['entries']}, голосов: {depth['votes']}, "
+                              f"отложено: {len(spool.dead_letters())}")
+            return
+
+        # Записи, оставшиеся после сбоя, переносятся первыми: журнал читается от контрольной точки
+        while True:
+            processed, inserted = drain_spool(spool, options['batch_size'])
+            if processed:
+                # Пачка могла целиком уйти в отложенные: журнал все равно продвинулся, продолжаем без паузы
+                self.stdout.write(f'Записей: {processed}, перенесено голосов: {inserted}')
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
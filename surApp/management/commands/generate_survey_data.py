@@ -0,0 +1,45 @@
+import math
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from surApp.synthetic import generate_survey, generate_respondents, generate_votes
+
+
+class Command(BaseCommand):
+    help = 'Создает синтетические опросы заданной формы (страницы x вопросы x варианты) и голоса к ним'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--surveys', type=int, default=1, help='Число опросов')
+        parser.add_argument('--pages', type=int, default=3, help='Страниц в опросе')
+        parser.add_argument('--questions', type=int, default=5, help='Вопросов на странице')
+        parser.add_argument('--choices', type=int, default=4, help='Вариантов в вопросе')
+        parser.add_argument('--votes', type=int, default=100_000, help='Голосов в каждом опросе')
+        parser.add_argument('--respondents', type=int, default=None,
+                            help='Число респондентов (по умолчанию - чтобы каждый ответил на все вопросы один раз)')
+        parser.add_argument('--author', default='synthetic_author', help='Имя автора опросов (создается при отсутствии)')
+        parser.add_argument('--batch-size', type=int, default=10_000, help='Голосов в одном INSERT')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора случайных ответов')
+
+    def handle(self, *args, **options):
+        if min(options['pages'], options['questions'], options['choices']) < 1:
+            raise CommandError('Форма опроса должна быть не меньше 1 x 1 x 1')
+        author, _ = User.objects.get_or_create(username=options['author'])
+        questions = options['pages'] * options['questions']
+        respondent_count = options['respondents'] or max(1, math.ceil(options['votes'] / questions))
+        respondents = generate_respondents(respondent_count)
+
+        for index in range(options['surveys']):
+            started = time.perf_counter()
+            voting = generate_survey(
+                author, options['pages'], options['questions'], options['choices'],
+                title=f'Синтетический опрос {index + 1}',
+            )
+            created = generate_votes(voting, respondents, options['votes'], options['batch_size'],
+                                     seed=options['seed'] + index)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'Опрос {voting.id}: {questions} вопросов, {created} голосов за {elapsed:.1f} с '
+                f'({created / elapsed:.0f} голосов/с)'
+            )
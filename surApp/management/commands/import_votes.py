@@ -0,0 +1,58 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from surApp.models import Voting
+from surApp.vote_import import READERS, VoteImportError, VoteImporter, detect_format
+
+
+class Command(BaseCommand):
+    help = ('Загружает голоса опроса из CSV или XLSX с колонками выгрузки api/export-votes/ '
+            '(User, Question ID, Choice ID); ошибочные строки пишутся в отчет. Каждая пачка фиксируется '
+            'отдельно: после сбоя повторный запуск с --start-row (номер выводится в ошибке) продолжает '
+            'загрузку, а запуск с начала файла задвоит уже загруженные голоса')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Файл CSV или XLSX')
+        parser.add_argument('--voting', type=int, required=True, help='id опроса')
+        parser.add_argument('--format', choices=sorted(READERS), help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--errors', help='CSV-отчет об ошибочных строках (по умолчанию - <file>.errors.csv)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Строк в одной пачке вставки')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить файл, без записи голосов')
+        parser.add_argument('--start-row', type=int, default=2,
+                            help='Первая загружаемая строка файла (строка 1 - заголовок)')
+
+    def handle(self, *args, **options):
+        voting = Voting.objects.filter(id=options['voting']).first()
+        if voting is None:
+            raise CommandError(f"Опрос {options['voting']} не найден")
+
+        importer = VoteImporter(voting, chunk_size=options['chunk_size'], dry_run=options['dry_run'],
+                                start_row=options['start_row'])
+        try:
+            file_format = options['format'] or detect_format(options['file'])
+            with open(options['file'], 'rb') as file:
+                result = importer.run(READERS[file_format](file))
+        except (OSError, VoteImportError, DatabaseError) as error:
+            if importer.last_row >= importer.start_row and not options['dry_run']:
+                raise CommandError(f'{error}. Строки до {importer.last_row} загружены, '
+                                   f'продолжить: --start-row {importer.last_row + 1}; отправки для них создаст '
+                                   f'manage.py backfill_submissions --voting {voting.id}')
+            raise CommandError(str(error))
+
+        if importer.errors:
+            errors_path = options['errors'] or f"{options['file']}.errors.csv"
+            if errors_path == '-':
+                importer.write_error_report(sys.stderr)
+            else:
+                with open(errors_path, 'w', encoding='utf-8', newline='') as output:
+                    importer.write_error_report(output)
+                self.stderr.write(f"Ошибочных строк: {result['rejected']}, отчет: {errors_path}")
+
+        rate = f", {result['rows_per_second']:.0f} строк/с" if result['rows_per_second'] else ''
+        action = 'Проверено' if options['dry_run'] else 'Загружено'
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} голосов: {result['imported']}, отклонено: {result['rejected']} "
+            f"за {result['seconds']:.2f} с{rate}"
+        ))
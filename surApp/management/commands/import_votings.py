@@ -0,0 +1,47 @@
+import sys
+from contextlib import nullcontext
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from surApp.survey_import import SurveyImportError, import_surveys
+
+
+class Command(BaseCommand):
+    help = 'Импортирует опросы из JSON выгрузки api/export-voting-json/ (один опрос, массив или объекты подряд)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Файлы JSON; "-" - стандартный ввод')
+        parser.add_argument('--author', required=True, help='Имя пользователя - автора импортированных опросов')
+        parser.add_argument('--atomic', action='store_true',
+                            help='Все файлы в одной транзакции (по умолчанию - каждый опрос отдельно)')
+
+    def handle(self, *args, **options):
+        author = User.objects.filter(username=options['author']).first()
+        if author is None:
+            raise CommandError(f"Пользователь {options['author']} не найден")
+
+        def report(result):
+            self.stdout.write(
+                f"Опрос {result['id']} \"{result['title']}\": страниц {result['pages']}, "
+                f"вопросов {result['questions']}, вариантов {result['choices']}"
+            )
+
+        rows = 0
+        seconds = 0.0
+        try:
+            with transaction.atomic() if options['atomic'] else nullcontext():
+                for path in options['files']:
+                    if path == '-':
+                        result = import_surveys(sys.stdin.buffer, author.id, report)
+                    else:
+                        with open(path, 'rb') as file:
+                            result = import_surveys(file, author.id, report)
+                    rows += result['rows']
+                    seconds += result['seconds']
+        except (OSError, SurveyImportError) as error:
+            raise CommandError(str(error))
+
+        rate = f', {rows / seconds:.0f} строк/с' if seconds else ''
+        self.stdout.write(self.style.SUCCESS(f'Готово: {rows} строк за {seconds:.2f} с{rate}'))
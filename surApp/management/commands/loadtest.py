@@ -0,0 +1,123 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from surApp.benchmarks import percentile
+from surApp.models import Voting, Choice
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест: держит N одновременных соединений к запущенным серверам и сравнивает их. '
+        'Пример для одного процесса: gunicorn surService.wsgi -w 1 --threads 8 -b :8000 и '
+        'uvicorn surService.asgi:application --workers 1 --port 8001, затем '
+        'manage.py loadtest --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001 --voting <id>'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, help='метка=базовый URL сервера')
+        parser.add_argument('--voting', type=int, required=True, help='id опроса')
+        parser.add_argument('--endpoint', choices=['stats', 'submit'], default='stats',
+                            help='stats - api/poll-statistic/, submit - api/answer-voting/')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 500],
+                            help='Число одновременных соединений')
+        parser.add_argument('--duration', type=float, default=10.0, help='Длительность каждого прогона, секунды')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Таймаут одного запроса, секунды')
+        parser.add_argument('--slow-client', type=float, default=0.0,
+                            help='Пауза между заголовками и телом запроса (медленный клиент), секунды')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        voting = Voting.objects.filter(id=options['voting']).first()
+        if voting is None:
+            raise CommandError(f"Опрос {options['voting']} не найден")
+        method, path, body = self.build_request(voting, options['endpoint'])
+
+        results = []
+        for target in options['target']:
+            label, _, base_url = target.partition('=')
+            if not base_url:
+                raise CommandError(f'Ожидается метка=URL: {target}')
+            for concurrency in options['concurrency']:
+                result = asyncio.run(run_load(
+                    base_url, method, path, body, concurrency,
+                    options['duration'], options['timeout'], options['slow_client'],
+                ))
+                results.append({'target': label, 'concurrency': concurrency, **result})
+                if not options['json']:
+                    self.stdout.write(
+                        f"{label:>6} x{concurrency:<5}: {result['requests_per_second']:.0f} запросов/с, "
+                        f"p50={result['p50_ms']:.1f} мс, p95={result['p95_ms']:.1f} мс, "
+                        f"ошибок={result['errors']} из {result['requests']}"
+                    )
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+
+    def build_request(self, voting, endpoint):
+        if endpoint == 'stats':
+            return 'GET', reverse('poll-statistic', args=[voting.id]), b''
+        # По первому варианту каждого вопроса от имени автора опроса
+        payload = {}
+        for choice_id, question_id in (Choice.objects.filter(question__page__voting=voting)
+                                       .order_by('id').values_list('id', 'question_id')):
+            payload.setdefault(question_id, choice_id)
+        body = [{'user': voting.author_id, 'question': question_id, 'choice': choice_id}
+                for question_id, choice_id in payload.items()]
+        return 'POST', reverse('do_response', args=[voting.id]), json.dumps(body).encode()
+
+
+async def send_request(host, port, method, path, body, timeout, slow_client):
+    # Одно соединение - один запрос (Connection: close), ответ читается до конца
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        head = (
+            f'{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: close\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'
+        )
+        writer.write(head.encode())
+        if slow_client:
+            await writer.drain()
+            await asyncio.sleep(slow_client)
+        writer.write(body)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+        return int(response.split(b' ', 2)[1])
+    finally:
+        writer.close()
+
+
+async def run_load(base_url, method, path, body, concurrency, duration, timeout, slow_client):
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    deadline = time.monotonic() + duration
+    timings = []
+    errors = 0
+
+    async def connection_loop():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                status_code = await send_request(host, port, method, path, body, timeout, slow_client)
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                status_code = None
+            if status_code is not None and status_code < 400:
+                timings.append((time.perf_counter() - started) * 1000)
+            else:
+                errors += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(connection_loop() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    return {
+        'requests': len(timings) + errors,
+        'errors': errors,
+        'requests_per_second': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50), 1),
+        'p95_ms': round(percentile(timings, 95), 1),
+        'p99_ms': round(percentile(timings, 99), 1),
+    }
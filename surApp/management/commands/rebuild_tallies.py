@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from surApp.tallies import rebuild_tallies, verify_tallies
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает или проверяет счетчики ChoiceTally по таблице Vote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voting', type=int, help='ID опроса (по умолчанию все опросы)')
+        parser.add_argument('--verify', action='store_true', help='Только проверить счетчики, ничего не меняя')
+
+    def handle(self, *args, **options):
+        voting_id = options['voting']
+        if options['verify']:
+            mismatches = verify_tallies(voting_id)
+            for (question_id, choice_id), (expected, actual) in sorted(mismatches.items()):
+                self.stdout.write(f'question={question_id} choice={choice_id}: votes={expected} tally={actual}')
+            if mismatches:
+                raise CommandError(f'Найдено расхождений: {len(mismatches)}')
+            self.stdout.write(self.style.SUCCESS('Счетчики совпадают с голосами'))
+            return
+
+        rebuilt = rebuild_tallies(voting_id)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано вариантов: {rebuilt}'))
@@ -0,0 +1,130 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from surService.routers import record_write
+
+from .instrumentation import get_instrumentation_settings, metrics, start_query_log, stop_query_log
+from .profiling import PROFILE_ID_HEADER, RequestProfiler, should_profile
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReadYourWritesMiddleware:
+    # После успешного изменяющего запроса пользователя его аналитика временно читается с основной базы.
+    # request.user к этому моменту уже выставлен аутентификацией DRF
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.record(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        # request.user может быть ленивым пользователем сессии, который читается из базы
+        await sync_to_async(self.record)(request, response)
+        return response
+
+    def record(self, request, response):
+        user = getattr(request, 'user', None)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and user and user.is_authenticated:
+            record_write(user.id)
+
+
+class RequestInstrumentationMiddleware:
+    # Время запроса, число и время SQL по имени URL: заголовок Server-Timing, гистограммы для /metrics
+    # и лог медленных запросов с самыми медленными и повторяющимися (N+1) SQL.
+    # Для потоковых ответов учитывается время до начала отдачи
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        log, token = start_query_log()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_query_log(token)
+        self.record(request, response, time.perf_counter() - started, log)
+        return response
+
+    async def __acall__(self, request):
+        log, token = start_query_log()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_query_log(token)
+        self.record(request, response, time.perf_counter() - started, log)
+        return response
+
+    def record(self, request, response, duration, log):
+        options = get_instrumentation_settings()
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unresolved'
+        metrics.observe_request(view, request.method, duration, log)
+
+        if options['SERVER_TIMING']:
+            response['Server-Timing'] = (
+                f'app;dur={duration * 1000:.1f}, '
+                f'db;dur={log.duration * 1000:.1f};desc="{log.count} queries"'
+            )
+
+        if duration * 1000 >= options['SLOW_REQUEST_MS']:
+            slowest = '; '.join(f'{seconds * 1000:.1f} ms: {sql[:300]}'
+                                for sql, seconds in log.slowest(options['SLOWEST_QUERIES']))
+            repeated = '; '.join(f'{count}x {sql[:300]}'
+                                 for sql, count in log.repeated(options['REPEATED_QUERY_THRESHOLD']))
+            logger.warning(
+                'Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms. Slowest: %s. Repeated: %s',
+                request.method, request.path, view, duration * 1000, log.count, log.duration * 1000,
+                slowest or '-', repeated or '-',
+            )
+
+
+class RequestProfilingMiddleware:
+    # Профиль одного запроса по требованию (см. surApp/profiling.py); id профиля - в заголовке X-Profile-Id.
+    # Асинхронные запросы (ASGI) не профилируются: их работа идет в других потоках
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode or not should_profile(request):
+            return self.get_response(request)
+        with RequestProfiler() as profiler:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        response[PROFILE_ID_HEADER] = profiler.save({
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': match.url_name if match else None,
+            'status': response.status_code,
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        return response
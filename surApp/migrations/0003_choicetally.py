@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surApp', '0002_voting_hidden_pages_voting_question_answer_pairs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('votes_count', models.PositiveIntegerField(default=0)),
+                ('choice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tallies', to='surApp.choice')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tallies', to='surApp.question')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='choicetally',
+            constraint=models.UniqueConstraint(fields=('choice', 'shard'), name='unique_choice_tally_shard'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surApp', '0003_choicetally'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpoolCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spool_id', models.CharField(max_length=64, unique=True)),
+                ('last_entry_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surApp', '0004_spoolcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='logic_index',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
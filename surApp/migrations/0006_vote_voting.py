@@ -0,0 +1,64 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:18
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class AddIndexOnline(migrations.AddIndex):
+    # На PostgreSQL индекс строится CREATE INDEX CONCURRENTLY, без блокировки записи в Vote
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            AddIndexConcurrently(self.model_name, self.index).database_forwards(
+                app_label, schema_editor, from_state, to_state)
+        else:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            AddIndexConcurrently(self.model_name, self.index).database_backwards(
+                app_label, schema_editor, from_state, to_state)
+        else:
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class AddForeignKeyNotValid(migrations.AddField):
+    # На PostgreSQL внешний ключ добавляется как NOT VALID: без проверки существующих строк под блокировкой
+    # таблицы. Проверка выполняется отдельно миграцией 0008 (VALIDATE CONSTRAINT не блокирует запись)
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        field = model._meta.get_field(self.name)
+        field.db_constraint = False
+        try:
+            schema_editor.add_field(model, field)
+        finally:
+            field.db_constraint = True
+        statement = schema_editor._create_fk_sql(model, field, '_fk_%(to_table)s_%(to_column)s')
+        schema_editor.execute(f'{statement} NOT VALID')
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('surApp', '0005_voting_logic_index'),
+    ]
+
+    operations = [
+        AddForeignKeyNotValid(
+            model_name='vote',
+            name='voting',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='surApp.voting'),
+        ),
+        AddIndexOnline(
+            model_name='vote',
+            index=models.Index(fields=['voting', 'question', 'choice'], name='vote_voting_question_choice'),
+        ),
+        AddIndexOnline(
+            model_name='vote',
+            index=models.Index(fields=['voting', 'user'], name='vote_voting_user'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('surApp', '0006_vote_voting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Submission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('choices', models.BinaryField()),
+                ('respondent', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to=settings.AUTH_USER_MODEL)),
+                ('voting', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to='surApp.voting')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['voting', 'respondent'], name='submission_voting_respondent'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['respondent', 'created_at'], name='submission_respondent_created'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def validate_vote_voting(apps, schema_editor):
+    # Проверка внешнего ключа, добавленного в 0006 как NOT VALID: берет SHARE UPDATE EXCLUSIVE,
+    # запись в Vote во время проверки продолжается
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Vote = apps.get_model('surApp', 'Vote')
+    table = Vote._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, table)
+    for name, constraint in constraints.items():
+        if constraint['foreign_key'] and constraint['columns'] == ['voting_id']:
+            schema_editor.execute(f'ALTER TABLE {schema_editor.quote_name(table)} '
+                                  f'VALIDATE CONSTRAINT {schema_editor.quote_name(name)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surApp', '0007_submission'),
+    ]
+
+    operations = [
+        migrations.RunPython(validate_vote_voting, migrations.RunPython.noop),
+    ]
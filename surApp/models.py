@@ -1,3 +1,5 @@
+import struct
+
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -17,6 +19,8 @@ class Voting(models.Model):
     is_submit = models.BooleanField(default=False)
     question_answer_pairs = models.TextField(blank=True)
     hidden_pages = models.TextField(blank=True)
+    # Скомпилированная логика переходов (см. surApp/logic.py): порядок страниц и вариант -> скрытые страницы
+    logic_index = models.JSONField(default=dict, blank=True)
 
 class Page(models.Model):
     voting = models.ForeignKey(Voting, related_name='pages', on_delete=models.CASCADE)
@@ -37,11 +41,74 @@ class Vote(models.Model):
     user = models.ForeignKey(User, related_name='votes', on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, related_name='votes', on_delete=models.CASCADE)
     question = models.ForeignKey(Question, related_name='votes', on_delete=models.CASCADE)
+    # Опрос голоса хранится прямо в строке, чтобы статистика и выгрузки не делали JOIN через Question и Page.
+    # Все места создания голосов передают voting_id сами; старые строки заполняются командой
+    # manage.py backfill_vote_voting
+    voting = models.ForeignKey(Voting, related_name='votes', on_delete=models.CASCADE, null=True, blank=True,
+                               db_index=False)
+
+    class Meta:
+        indexes = [
+            # Отдельный индекс по voting не нужен: его покрывают составные индексы
+            models.Index(fields=['voting', 'question', 'choice'], name='vote_voting_question_choice'),
+            models.Index(fields=['voting', 'user'], name='vote_voting_user'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s vote for {self.choice.name} in question: {self.question.title}"
 
 
+def pack_choice_ids(choice_ids):
+    # Выбранные варианты отправки: 4 байта на вариант (uint32, little-endian) вместо строки Vote на каждый ответ
+    return struct.pack(f'<{len(choice_ids)}I', *choice_ids)
+
+
+def unpack_choice_ids(packed):
+    packed = bytes(packed)
+    return list(struct.unpack(f'<{len(packed) // 4}I', packed))
+
+
+class Submission(models.Model):
+    # Одна отправка ответов респондента: создается на каждый вызов VoteBulkCreateView (и при переносе из журнала),
+    # при загрузке файла и генерации данных - одна на респондента за весь запуск.
+    # Число респондентов и ответы респондента читаются по индексу (voting, respondent) без обхода Vote
+    voting = models.ForeignKey(Voting, related_name='submissions', on_delete=models.CASCADE, db_index=False)
+    respondent = models.ForeignKey(User, related_name='submissions', on_delete=models.CASCADE, db_index=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    choices = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['voting', 'respondent'], name='submission_voting_respondent'),
+            models.Index(fields=['respondent', 'created_at'], name='submission_respondent_created'),
+        ]
+
+    @property
+    def choice_ids(self):
+        return unpack_choice_ids(self.choices)
+
+
+class ChoiceTally(models.Model):
+    # Материализованный счетчик голосов. Для каждого варианта хранится несколько шардов,
+    # чтобы одновременные голосующие не блокировали одну и ту же строку
+    question = models.ForeignKey(Question, related_name='tallies', on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, related_name='tallies', on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField(default=0)
+    votes_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['choice', 'shard'], name='unique_choice_tally_shard'),
+        ]
+
+
+class SpoolCheckpoint(models.Model):
+    # Последняя запись журнала голосов, перенесенная в Vote. Обновляется в той же транзакции,
+    # что и вставка голосов, поэтому после сбоя записи журнала не вставляются повторно
+    spool_id = models.CharField(max_length=64, unique=True)
+    last_entry_id = models.BigIntegerField(default=0)
+
+
 # Пример запроса POST для создания опроса
 # {
 #     "title": "Название опросаИЗМ",
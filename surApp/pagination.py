@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    # Курсор по id: каждая страница - это WHERE id > ... LIMIT n, без OFFSET
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
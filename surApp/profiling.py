@@ -0,0 +1,141 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from rest_framework.exceptions import APIException
+
+from .authentication import CachedJWTAuthentication
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:
+    SamplingProfiler = None
+
+DEFAULT_PROFILING_SETTINGS = {
+    'ENABLED': True,
+    'DIRECTORY': 'profiles',
+    # Сколько последних профилей хранить: старые удаляются после записи нового
+    'MAX_PROFILES': 50,
+    'TOP_FUNCTIONS': 25,
+    # 'cprofile' или 'auto' - сэмплирующий pyinstrument, если установлен
+    'PROFILER': 'auto',
+    # Срок действия подписанного заголовка X-Profile-Token, секунды
+    'TOKEN_MAX_AGE': 3600,
+}
+
+PROFILE_SALT = 'surApp.profiling'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+
+def get_profiling_settings():
+    return {**DEFAULT_PROFILING_SETTINGS, **getattr(settings, 'REQUEST_PROFILING', {})}
+
+
+def profile_directory():
+    return Path(get_profiling_settings()['DIRECTORY'])
+
+
+def make_profile_token():
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign('profile')
+
+
+def is_valid_profile_token(token):
+    try:
+        signing.TimestampSigner(salt=PROFILE_SALT).unsign(token, max_age=get_profiling_settings()['TOKEN_MAX_AGE'])
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def should_profile(request):
+    # Профилируем только по запросу: подписанный X-Profile-Token (manage.py create_profile_token)
+    # или X-Profile: 1 / ?profile=1 от сотрудника (сессия или JWT)
+    if not get_profiling_settings()['ENABLED']:
+        return False
+    token = request.headers.get('X-Profile-Token')
+    if token:
+        return is_valid_profile_token(token)
+    if request.headers.get('X-Profile') != '1' and request.GET.get('profile') != '1':
+        return False
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        result = CachedJWTAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return result is not None and result[0].is_staff
+
+
+class RequestProfiler:
+    # Один запрос под профилировщиком. cProfile считает все вызовы (заметно замедляет запрос),
+    # pyinstrument периодически снимает стек и почти не влияет на время
+    def __init__(self):
+        use_sampling = get_profiling_settings()['PROFILER'] == 'auto' and SamplingProfiler is not None
+        self.kind = 'pyinstrument' if use_sampling else 'cprofile'
+        self.profiler = SamplingProfiler() if use_sampling else cProfile.Profile()
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        if self.kind == 'pyinstrument':
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.kind == 'pyinstrument':
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+        self.duration = time.perf_counter() - self.started
+
+    def save(self, meta):
+        # Профиль и описание запроса рядом; имя начинается со времени, поэтому сортировка по имени - по возрасту
+        directory = profile_directory()
+        directory.mkdir(parents=True, exist_ok=True)
+        profile_id = f'{datetime.now().strftime("%Y%m%d-%H%M%S-%f")}-{uuid.uuid4().hex[:6]}'
+        if self.kind == 'pyinstrument':
+            (directory / f'{profile_id}.html').write_text(self.profiler.output_html(), encoding='utf-8')
+            summary = self.profiler.output_text(unicode=True, color=False)
+        else:
+            self.profiler.dump_stats(directory / f'{profile_id}.prof')
+            summary = top_functions(self.profiler, get_profiling_settings()['TOP_FUNCTIONS'])
+        meta = {**meta, 'id': profile_id, 'profiler': self.kind, 'duration_ms': round(self.duration * 1000, 1),
+                'summary': summary}
+        (directory / f'{profile_id}.json').write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+        rotate_profiles(directory, get_profiling_settings()['MAX_PROFILES'])
+        return profile_id
+
+
+def top_functions(profiler, limit):
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
+
+
+def rotate_profiles(directory, max_profiles):
+    profiles = sorted(directory.glob('*.json'))
+    for meta_path in profiles[:-max_profiles]:
+        for path in directory.glob(f'{meta_path.stem}.*'):
+            path.unlink(missing_ok=True)
+
+
+def recent_profiles():
+    directory = profile_directory()
+    if not directory.exists():
+        return []
+    profiles = []
+    for meta_path in sorted(directory.glob('*.json'), reverse=True):
+        try:
+            profiles.append(json.loads(meta_path.read_text(encoding='utf-8')))
+        except (OSError, ValueError):
+            continue
+    return profiles
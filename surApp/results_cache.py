@@ -0,0 +1,164 @@
+import hashlib
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+from django.db import transaction
+
+from surService.routers import read_database
+
+DEFAULT_RESULTS_CACHE_SETTINGS = {
+    'ALIAS': 'default',
+    # Сколько хранить посчитанный результат, секунды
+    'TIMEOUT': 300,
+    # Сколько секунд после подсчета результат можно отдавать устаревшим, пока другой воркер его пересчитывает
+    'MAX_STALENESS': 5,
+    # Максимальное время пересчета: по истечении блокировку может взять другой воркер
+    'LOCK_TIMEOUT': 10,
+}
+
+
+def get_results_cache_settings():
+    return {**DEFAULT_RESULTS_CACHE_SETTINGS, **getattr(settings, 'POLL_RESULTS_CACHE', {})}
+
+
+def get_results_cache():
+    return caches[get_results_cache_settings()['ALIAS']]
+
+
+def version_key(poll_id):
+    return f'poll-results-version:{poll_id}'
+
+
+def entry_key(poll_id, source):
+    return f'poll-results:{poll_id}:{source}'
+
+
+def lock_key(poll_id, source):
+    return f'poll-results-lock:{poll_id}:{source}'
+
+
+def new_version():
+    # Версия сравнивается только на равенство, поэтому это случайное значение, а не счетчик: incr в
+    # FileBasedCache и DatabaseCache - чтение и запись без блокировки, и два одновременных увеличения
+    # дали бы одно значение. Одновременные set оставляют одно из двух новых значений, и оба отличаются
+    # от версии, под которой считался любой более ранний результат
+    return uuid.uuid4().hex
+
+
+def current_version(poll_id):
+    # Если версия вытеснена из кеша, новая не совпадет со старыми записями
+    cache = get_results_cache()
+    cache.add(version_key(poll_id), new_version(), timeout=None)
+    return cache.get(version_key(poll_id))
+
+
+def bump_version(poll_id):
+    get_results_cache().set(version_key(poll_id), new_version(), timeout=None)
+
+
+def bump_version_on_commit(poll_id):
+    transaction.on_commit(lambda: bump_version(poll_id))
+
+
+class CacheLock:
+    # Блокировка через cache.add: атомарна в Redis, Memcached, LocMemCache (в пределах процесса) и
+    # DatabaseCache (вставка по первичному ключу). Сама снимается через timeout, если воркер упал
+    def __init__(self, cache, key, timeout):
+        self.cache, self.key, self.timeout = cache, key, timeout
+        self.locked = False
+
+    def acquire(self):
+        self.locked = self.cache.add(self.key, True, timeout=self.timeout)
+        return self.locked
+
+    def release(self):
+        if self.locked:
+            self.cache.delete(self.key)
+            self.locked = False
+
+
+class FileLock:
+    # В FileBasedCache add - проверка и запись без блокировки, и блокировку через него могут взять
+    # сразу несколько процессов. Поэтому берется flock на файл в каталоге кеша: он атомарен для всех
+    # процессов, которые видят этот каталог, и снимается ОС, если воркер упал
+    def __init__(self, cache, key):
+        self.path = os.path.join(cache._dir, hashlib.md5(key.encode()).hexdigest() + '.lock')
+        self.file = None
+
+    @property
+    def locked(self):
+        return self.file is not None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        file = open(self.path, 'a')
+        if not locks.lock(file, locks.LOCK_EX | locks.LOCK_NB):
+            file.close()
+            return False
+        self.file = file
+        return True
+
+    def release(self):
+        if self.file is not None:
+            locks.unlock(self.file)
+            self.file.close()
+            self.file = None
+
+
+def results_lock(cache, poll_id, source, timeout):
+    if isinstance(cache, FileBasedCache):
+        return FileLock(cache, lock_key(poll_id, source))
+    return CacheLock(cache, lock_key(poll_id, source), timeout)
+
+
+def cached_results(poll_id, source, compute):
+    # Результат опроса по ключу (опрос, источник) с версией опроса внутри записи.
+    # Совпала версия - отдаем из кеша. Версия устарела недавно - пересчитывает только воркер,
+    # взявший блокировку, остальные отдают предыдущее значение
+    options = get_results_cache_settings()
+    cache = get_results_cache()
+    version = current_version(poll_id)
+
+    def fresh_entry():
+        entry = cache.get(entry_key(poll_id, source))
+        return entry if entry is not None and entry['version'] == version else None
+
+    entry = cache.get(entry_key(poll_id, source))
+    if entry is not None and entry['version'] == version:
+        return entry['data']
+
+    lock = results_lock(cache, poll_id, source, options['LOCK_TIMEOUT'])
+    if not lock.acquire():
+        if entry is not None and time.time() - entry['computed_at'] <= options['MAX_STALENESS']:
+            return entry['data']
+        # Отдать нечего: ждем результат воркера, который сейчас считает. Освободилась блокировка
+        # без свежего результата - считаем сами
+        deadline = time.time() + options['LOCK_TIMEOUT']
+        while time.time() < deadline:
+            time.sleep(0.05)
+            fresh = fresh_entry()
+            if fresh is not None:
+                return fresh['data']
+            if lock.acquire():
+                # Результат мог появиться между проверкой и освобождением блокировки
+                fresh = fresh_entry()
+                if fresh is not None:
+                    lock.release()
+                    return fresh['data']
+                break
+
+    try:
+        # Результат сохраняется под текущей версией, поэтому считается по основной базе: отстающая
+        # реплика могла еще не получить голоса, из-за которых версия изменилась
+        with read_database('default'):
+            data = compute(poll_id)
+        cache.set(entry_key(poll_id, source), {'version': version, 'computed_at': time.time(), 'data': data},
+                  timeout=options['TIMEOUT'])
+    finally:
+        lock.release()
+    return data
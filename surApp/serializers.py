@@ -1,18 +1,29 @@
 from django.contrib.auth import authenticate
+from django.db import transaction
 from rest_framework import serializers
 from .models import *
+from .logic import recompile_logic
+from .results_cache import bump_version_on_commit
+from .snapshots import refresh_snapshot, tree_refresh_muted
+from .submissions import create_submissions
+from .survey_tree import own_fields, create_choices, create_questions, create_pages, sync_pages
+from .tallies import apply_votes
 
 
 class ChoiceSerializer(serializers.ModelSerializer):
+    # id принимается на запись, чтобы при обновлении сопоставлять варианты с сохраненными
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = Choice
         fields = ['id', 'name']
 
     def create(self, validated_data):
         question = self.context['question']
-        return Choice.objects.create(question=question, **validated_data)
+        return Choice.objects.create(question=question, **own_fields(validated_data))
 
 class QuestionSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
     choices = ChoiceSerializer(many=True)
 
     class Meta:
@@ -20,13 +31,13 @@ class QuestionSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'type', 'choices']
 
     def create(self, validated_data):
-        choices_data = validated_data.pop('choices')
-        question = Question.objects.create(**validated_data)
-        for choice_data in choices_data:
-            Choice.objects.create(question=question, **choice_data)
+        with transaction.atomic():
+            question = Question.objects.create(**own_fields(validated_data))
+            create_choices([(question, validated_data.get('choices', []))])
         return question
 
 class PageSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
     questions = QuestionSerializer(many=True)
 
     class Meta:
@@ -34,13 +45,9 @@ class PageSerializer(serializers.ModelSerializer):
         fields = ['id', 'order', 'title', 'questions']
 
     def create(self, validated_data):
-        questions_data = validated_data.pop('questions')
-        page = Page.objects.create(**validated_data)
-        for question_data in questions_data:
-            choices_data = question_data.pop('choices', [])
-            question = Question.objects.create(page=page, **question_data)
-            for choice_data in choices_data:
-                Choice.objects.create(question=question, **choice_data)
+        with transaction.atomic():
+            page = Page.objects.create(**own_fields(validated_data))
+            create_questions([(page, validated_data.get('questions', []))])
         return page
 
 class VotingSerializer(serializers.ModelSerializer):
@@ -53,32 +60,39 @@ class VotingSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         pages_data = validated_data.pop('pages')
-        voting = Voting.objects.create(**validated_data)
-        for page_data in pages_data:
-            questions_data = page_data.pop('questions', [])
-            page = Page.objects.create(voting=voting, **page_data)
-            for question_data in questions_data:
-                choices_data = question_data.pop('choices', [])
-                question = Question.objects.create(page=page, **question_data)
-                for choice_data in choices_data:
-                    Choice.objects.create(question=question, **choice_data)
+        with transaction.atomic(), tree_refresh_muted():
+            voting = Voting.objects.create(**validated_data)
+            create_pages(voting, pages_data)
+            recompile_logic(voting)
+        refresh_snapshot(voting.id)
         return voting
 
     def update(self, instance, validated_data):
-        pages_data = validated_data.pop('pages', [])
-        instance = super().update(instance, validated_data)
-        instance.pages.all().delete()  # Удаляем все старые страницы
-        for page_data in pages_data:
-            questions_data = page_data.pop('questions', [])
-            page = Page.objects.create(voting=instance, **page_data)
-            for question_data in questions_data:
-                choices_data = question_data.pop('choices', [])
-                question = Question.objects.create(page=page, **question_data)
-                for choice_data in choices_data:
-                    Choice.objects.create(question=question, **choice_data)
+        # Дерево обновляется по разнице с сохраненным: id и собранные голоса не теряются.
+        # Если pages не передан (PATCH), страницы не трогаем
+        pages_data = validated_data.pop('pages', None)
+        with transaction.atomic(), tree_refresh_muted():
+            instance = super().update(instance, validated_data)
+            if pages_data is not None:
+                sync_pages(instance, pages_data)
+                # Страницы и варианты могли измениться: пересобираем индекс, отбрасывая устаревшие правила
+                recompile_logic(instance)
+                bump_version_on_commit(instance.id)
+        refresh_snapshot(instance.id)
         return instance
 
 
+class VotingSummarySerializer(serializers.ModelSerializer):
+    # Краткая карточка опроса для списка; счетчики приходят аннотациями из VotingListByUserAPIView
+    page_count = serializers.IntegerField(read_only=True)
+    question_count = serializers.IntegerField(read_only=True)
+    response_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Voting
+        fields = ['id', 'title', 'is_submit', 'page_count', 'question_count', 'response_count']
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -106,9 +120,44 @@ class VoteSerializer(serializers.ModelSerializer):
         model = Vote
         fields = ['user', 'question', 'choice']
 
+class VoteSubmissionSerializer(serializers.Serializer):
+    # Простые целочисленные поля вместо PrimaryKeyRelatedField: существование и принадлежность
+    # вопросов и вариантов проверяются сразу для всей отправки в BulkVoteSerializer.validate
+    user = serializers.IntegerField(source='user_id')
+    question = serializers.IntegerField(source='question_id')
+    choice = serializers.IntegerField(source='choice_id')
+
+
 class BulkVoteSerializer(serializers.ListSerializer):
-    child = VoteSerializer()
+    child = VoteSubmissionSerializer()
+
+    def validate(self, attrs):
+        voting = self.context['voting']
+        question_ids = {item['question_id'] for item in attrs}
+        user_ids = {item['user_id'] for item in attrs}
+
+        # Один запрос: все варианты присланных вопросов, которые принадлежат этому опросу
+        question_choices = {}
+        choices = Choice.objects.filter(question_id__in=question_ids, question__page__voting_id=voting.id)
+        for choice_id, question_id in choices.values_list('id', 'question_id'):
+            question_choices.setdefault(question_id, set()).add(choice_id)
+
+        for item in attrs:
+            if item['question_id'] not in question_choices:
+                raise serializers.ValidationError({"error": "Question does not belong to the specified voting"})
+            if item['choice_id'] not in question_choices[item['question_id']]:
+                raise serializers.ValidationError({"error": "Choice does not belong to the specified question"})
+
+        if User.objects.filter(id__in=user_ids).count() != len(user_ids):
+            raise serializers.ValidationError({"error": "User not found"})
+        return attrs
 
     def create(self, validated_data):
-        votes = [Vote(**item) for item in validated_data]
-        return Vote.objects.bulk_create(votes)
+        voting_id = self.context['voting'].id
+        votes = [Vote(voting_id=voting_id, **item) for item in validated_data]
+        with transaction.atomic():
+            votes = Vote.objects.bulk_create(votes, batch_size=1000)
+            apply_votes(votes)
+            create_submissions(voting_id, votes)
+            bump_version_on_commit(voting_id)
+        return votes
@@ -0,0 +1,64 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from .columnar import delete_snapshot, mark_stale
+from .instrumentation import install_query_recorder
+from .models import Voting, Page, Question, Choice, Vote
+from .results_cache import bump_version_on_commit
+from .snapshots import invalidate_snapshot, refresh_tree_snapshot
+
+
+@receiver([post_save, post_delete], sender=Voting)
+def invalidate_voting_snapshot(sender, instance, **kwargs):
+    # Любое сохранение опроса (API, админка) сбрасывает готовый снимок
+    invalidate_snapshot(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Page)
+@receiver([post_save, post_delete], sender=Question)
+@receiver([post_save, post_delete], sender=Choice)
+def refresh_voting_tree_snapshot(sender, instance, **kwargs):
+    # Правка страниц, вопросов и вариантов по отдельности (админка, shell) меняет снимок и ETag опроса.
+    # bulk_create / bulk_update сигналов не шлют: serializers обновляют снимок сами
+    if sender is Page:
+        refresh_tree_snapshot(voting_id=instance.voting_id)
+    elif sender is Question:
+        refresh_tree_snapshot(page_id=instance.page_id)
+    else:
+        refresh_tree_snapshot(question_id=instance.question_id)
+
+
+@receiver(post_delete, sender=Voting)
+def invalidate_voting_results(sender, instance, **kwargs):
+    bump_version_on_commit(instance.pk)
+
+
+@receiver(post_delete, sender=Voting)
+def delete_columnar_snapshot(sender, instance, **kwargs):
+    voting_id = instance.pk
+    transaction.on_commit(lambda: delete_snapshot(voting_id))
+
+
+@receiver(pre_delete, sender=User)
+def flag_voter_snapshots(sender, instance, **kwargs):
+    # Голоса пользователя удаляются каскадом. Приемника на Vote нет, чтобы каскад оставался одним DELETE,
+    # поэтому опросы с его голосами помечаются здесь одним запросом. Варианты и вопросы с голосами
+    # удаляет sync_pages и админка: они помечают снимок сами
+    for voting_id in Vote.objects.filter(user_id=instance.pk).values_list('voting_id', flat=True).distinct():
+        if voting_id is not None:
+            mark_stale(voting_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    # Кеш процесса; в остальных процессах запись устареет по TTL
+    user_cache.delete(instance.pk)
+
+
+@receiver(connection_created)
+def record_request_queries(sender, connection, **kwargs):
+    install_query_recorder(connection)
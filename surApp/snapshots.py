@@ -0,0 +1,117 @@
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from .models import Voting, Page, Question
+
+
+def get_snapshot_cache():
+    return caches[getattr(settings, 'VOTING_SNAPSHOT_CACHE_ALIAS', 'default')]
+
+
+def snapshot_key(voting_id):
+    return f'voting-snapshot:{voting_id}'
+
+
+def build_snapshot(voting_id):
+    # Готовый JSON опроса (те же байты, что отдавал VotingSerializer) и сильный ETag по его содержимому
+    from .serializers import VotingSerializer  # serializers сами обновляют снимок после записи
+
+    voting = Voting.objects.prefetch_related('pages__questions__choices').get(pk=voting_id)
+    body = JSONRenderer().render(VotingSerializer(voting).data)
+    snapshot = {'body': body, 'etag': '"%s"' % hashlib.sha256(body).hexdigest()}
+    get_snapshot_cache().set(snapshot_key(voting_id), snapshot, timeout=None)
+    return snapshot
+
+
+def get_snapshot(voting_id):
+    # При попадании в кеш база не читается совсем; Voting.DoesNotExist, если опроса нет
+    snapshot = get_snapshot_cache().get(snapshot_key(voting_id))
+    if snapshot is None:
+        snapshot = build_snapshot(voting_id)
+    return snapshot
+
+
+def invalidate_snapshot(voting_id):
+    get_snapshot_cache().delete(snapshot_key(voting_id))
+
+
+class PendingRefreshes(threading.local):
+    def __init__(self):
+        self.tokens = {}
+        self.page_ids = set()
+        self.question_ids = set()
+        self.muted = 0
+
+
+_pending = PendingRefreshes()
+
+
+def refresh_snapshot(voting_id):
+    # Пересборка после фиксации транзакции, чтобы в кеш не попало незавершенное дерево.
+    # Правка дерева вызывает это для каждой строки: собирает снимок только последний вызов в транзакции,
+    # более ранние лишь сбрасывают его (на случай, если последний вызов был в откаченной точке сохранения)
+    token = object()
+    _pending.tokens[voting_id] = token
+
+    def rebuild():
+        if _pending.tokens.get(voting_id) is not token:
+            invalidate_snapshot(voting_id)
+            return
+        del _pending.tokens[voting_id]
+        rebuild_snapshot(voting_id)
+    transaction.on_commit(rebuild)
+
+
+def rebuild_snapshot(voting_id):
+    try:
+        build_snapshot(voting_id)
+    except Voting.DoesNotExist:
+        invalidate_snapshot(voting_id)
+
+
+@contextmanager
+def tree_refresh_muted():
+    # serializers правят дерево сами и вызывают refresh_snapshot после записи: сигналы строк не нужны
+    _pending.muted += 1
+    try:
+        yield
+    finally:
+        _pending.muted -= 1
+
+
+def refresh_tree_snapshot(voting_id=None, page_id=None, question_id=None):
+    # Опрос вопроса или варианта находится по родителю уже после фиксации, одним запросом на транзакцию,
+    # а не запросом на каждую строку: каскадное удаление шлет сигнал для каждой
+    if _pending.muted:
+        return
+    if voting_id is not None:
+        refresh_snapshot(voting_id)
+        return
+    if page_id is not None:
+        _pending.page_ids.add(page_id)
+    if question_id is not None:
+        _pending.question_ids.add(question_id)
+    transaction.on_commit(rebuild_tree_snapshots)
+
+
+def rebuild_tree_snapshots():
+    # Первый вызов после фиксации забирает все отложенные id, остальные ничего не делают.
+    # Родителя, удаленного тем же каскадом, уже нет: его опрос сбросили сигналы Page или Voting
+    page_ids, question_ids = _pending.page_ids, _pending.question_ids
+    if not page_ids and not question_ids:
+        return
+    _pending.page_ids, _pending.question_ids = set(), set()
+    voting_ids = set()
+    if page_ids:
+        voting_ids.update(Page.objects.filter(pk__in=page_ids).values_list('voting_id', flat=True))
+    if question_ids:
+        voting_ids.update(Question.objects.filter(pk__in=question_ids).values_list('page__voting_id', flat=True))
+    for voting_id in voting_ids:
+        rebuild_snapshot(voting_id)
+
@@ -0,0 +1,172 @@
+import json
+import sqlite3
+import threading
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .models import Choice, Vote, SpoolCheckpoint, Submission
+from .results_cache import bump_version_on_commit
+from .submissions import build_submissions
+from .tallies import apply_votes
+
+DEFAULT_SPOOL_SETTINGS = {
+    'PATH': 'vote_spool.sqlite3',
+    'BATCH_SIZE': 5000,
+    'FLUSH_INTERVAL': 1.0,
+}
+
+
+def get_spool_settings():
+    return {**DEFAULT_SPOOL_SETTINGS, **getattr(settings, 'VOTE_SPOOL', {})}
+
+
+class VoteSpool:
+    # Локальный журнал принятых, но еще не записанных в Vote отправок.
+    # SQLite в режиме WAL с synchronous=FULL: запись переживает падение процесса и сервера
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        self.spool_id = self._init_schema()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')
+            self._local.connection = connection
+        return connection
+
+    def _init_schema(self):
+        connection = self._connection()
+        connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, voting_id INTEGER NOT NULL, '
+            'size INTEGER NOT NULL, payload TEXT NOT NULL)'
+        )
+        # Записи, которые нельзя вставить (вариант или пользователь удалены после приема): откладываются
+        # сюда, чтобы не останавливать перенос остальных. entry_id - id записи в entries
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS dead_letters ('
+            'entry_id INTEGER PRIMARY KEY, voting_id INTEGER NOT NULL, payload TEXT NOT NULL, error TEXT NOT NULL)'
+        )
+        # Идентификатор файла журнала: если журнал пересоздан, нумерация записей начинается заново,
+        # и контрольная точка старого журнала к нему не применяется
+        connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('spool_id', ?)", (uuid.uuid4().hex,))
+        return connection.execute("SELECT value FROM meta WHERE key = 'spool_id'").fetchone()[0]
+
+    def append(self, voting_id, votes):
+        rows = [[vote['user_id'], vote['question_id'], vote['choice_id']] for vote in votes]
+        self._connection().execute(
+            'INSERT INTO entries (voting_id, size, payload) VALUES (?, ?, ?)',
+            (voting_id, len(rows), json.dumps(rows)),
+        )
+
+    def read(self, after_id, max_votes):
+        # Записи по порядку, пока суммарное число голосов не достигнет max_votes (минимум одна запись)
+        cursor = self._connection().execute(
+            'SELECT id, voting_id, size, payload FROM entries WHERE id > ? ORDER BY id', (after_id,)
+        )
+        entries = []
+        total = 0
+        for entry_id, voting_id, size, payload in cursor:
+            if entries and total + size > max_votes:
+                break
+            entries.append((entry_id, voting_id, json.loads(payload)))
+            total += size
+        cursor.close()
+        return entries
+
+    def dead_letter(self, entries):
+        # entries: [(entry_id, voting_id, rows, error), ...]. Повтор после сбоя не дублирует записи
+        self._connection().executemany(
+            'INSERT OR IGNORE INTO dead_letters (entry_id, voting_id, payload, error) VALUES (?, ?, ?, ?)',
+            [(entry_id, voting_id, json.dumps(rows), error) for entry_id, voting_id, rows, error in entries],
+        )
+
+    def dead_letters(self):
+        cursor = self._connection().execute(
+            'SELECT entry_id, voting_id, payload, error FROM dead_letters ORDER BY entry_id')
+        return [(entry_id, voting_id, json.loads(payload), error) for entry_id, voting_id, payload, error in cursor]
+
+    def delete_through(self, entry_id):
+        self._connection().execute('DELETE FROM entries WHERE id <= ?', (entry_id,))
+
+    def depth(self):
+        entries, votes = self._connection().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'entries': entries, 'votes': votes}
+
+
+_spools = {}
+_spools_lock = threading.Lock()
+
+
+def get_vote_spool():
+    path = str(get_spool_settings()['PATH'])
+    with _spools_lock:
+        if path not in _spools:
+            _spools[path] = VoteSpool(path)
+        return _spools[path]
+
+
+def entry_error(voting_id, rows, choices, user_ids):
+    for user_id, question_id, choice_id in rows:
+        if user_id not in user_ids:
+            return f'User {user_id} not found'
+        if choices.get(choice_id) != (question_id, voting_id):
+            return f'Choice {choice_id} of question {question_id} not found in voting {voting_id}'
+    return None
+
+
+def split_invalid(entries):
+    # Записи журнала проверены при приеме, но до переноса вариант, вопрос, опрос или пользователь
+    # могли быть удалены: такая запись вызвала бы IntegrityError и навсегда остановила перенос
+    rows = [row for entry_id, voting_id, entry_rows in entries for row in entry_rows]
+    user_ids = set(User.objects.filter(id__in={row[0] for row in rows}).values_list('id', flat=True))
+    choices = {choice_id: (question_id, voting_id) for choice_id, question_id, voting_id in
+               Choice.objects.filter(id__in={row[2] for row in rows})
+               .values_list('id', 'question_id', 'question__page__voting_id')}
+    valid, invalid = [], []
+    for entry_id, voting_id, entry_rows in entries:
+        error = entry_error(voting_id, entry_rows, choices, user_ids)
+        if error:
+            invalid.append((entry_id, voting_id, entry_rows, error))
+        else:
+            valid.append((entry_id, voting_id, entry_rows))
+    return valid, invalid
+
+
+def drain_spool(spool, batch_size):
+    # Переносит одну пачку из журнала в Vote. Возвращает (число прочитанных записей, число вставленных голосов):
+    # пачка из одних неисправимых записей вставляет 0 голосов, но продвигает журнал.
+    # Неисправимые записи уходят в dead_letters журнала, контрольная точка проходит и через них
+    with transaction.atomic():
+        checkpoint, _ = SpoolCheckpoint.objects.get_or_create(spool_id=spool.spool_id)
+        checkpoint = SpoolCheckpoint.objects.select_for_update().get(pk=checkpoint.pk)
+        read = spool.read(checkpoint.last_entry_id, batch_size)
+        entries, invalid = split_invalid(read)
+        # Журнал не входит в транзакцию базы: при откате записи будут прочитаны и отложены повторно без дублей
+        spool.dead_letter(invalid)
+        if entries:
+            # Одна запись журнала - одна отправка VoteBulkCreateView
+            submitted = [
+                (voting_id, [Vote(voting_id=voting_id, user_id=user_id, question_id=question_id, choice_id=choice_id)
+                             for user_id, question_id, choice_id in rows])
+                for entry_id, voting_id, rows in entries
+            ]
+            votes = [vote for voting_id, entry_votes in submitted for vote in entry_votes]
+            Vote.objects.bulk_create(votes, batch_size=1000)
+            apply_votes(votes)
+            Submission.objects.bulk_create(build_submissions(submitted), batch_size=1000)
+            for voting_id in {entry[1] for entry in entries}:
+                bump_version_on_commit(voting_id)
+        if read:
+            checkpoint.last_entry_id = read[-1][0]
+            checkpoint.save(update_fields=['last_entry_id'])
+    # Удаляем уже после фиксации: при падении здесь записи останутся в журнале, но будут пропущены по контрольной точке
+    spool.delete_through(checkpoint.last_entry_id)
+    return len(read), sum(len(rows) for entry_id, voting_id, rows in entries)
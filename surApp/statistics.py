@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+from .columnar import delta_choice_counts, get_snapshot
+from .models import Question, Choice
+
+
+def build_poll_statistics(questions, choices):
+    # Собираем ответ в формате PollDetailAPIView из плоских строк вопросов и вариантов
+    data = []
+    by_question = {}
+    for question in questions:
+        question_data = {
+            'question_id': question['id'],
+            'question_title': question['title'],
+            'question_type': question['type'],
+            'choices': []
+        }
+        by_question[question['id']] = question_data
+        data.append(question_data)
+    for choice in choices:
+        question_data = by_question.get(choice['question_id'])
+        if question_data is None:
+            continue
+        question_data['choices'].append({
+            'choice_id': choice['id'],
+            'choice_title': choice['name'],
+            'votes_count': choice['votes_count']
+        })
+    return data
+
+
+def poll_statistics(poll_id):
+    # Два запроса на весь опрос: список вопросов и сгруппированный подсчет голосов по вариантам.
+    # LEFT JOIN через Count('votes') сохраняет варианты без голосов (votes_count = 0)
+    questions = Question.objects.filter(page__voting_id=poll_id).order_by('id').values('id', 'title', 'type')
+    choices = (Choice.objects.filter(question__page__voting_id=poll_id)
+               .annotate(votes_count=Count('votes'))
+               .order_by('id')
+               .values('id', 'name', 'question_id', 'votes_count'))
+    return build_poll_statistics(questions, choices)
+
+
+def tally_poll_statistics(poll_id):
+    # То же самое, но по материализованным счетчикам ChoiceTally вместо подсчета строк Vote
+    questions = Question.objects.filter(page__voting_id=poll_id).order_by('id').values('id', 'title', 'type')
+    choices = (Choice.objects.filter(question__page__voting_id=poll_id)
+               .annotate(votes_count=Coalesce(Sum('tallies__votes_count'), 0))
+               .order_by('id')
+               .values('id', 'name', 'question_id', 'votes_count'))
+    return build_poll_statistics(questions, choices)
+
+
+def columnar_poll_statistics(poll_id):
+    # Счетчики из снимка manage.py compact_votes (bincount по memmap) плюс голоса, принятые после сжатия.
+    # Без снимка считается целиком по базе, как aggregate
+    questions = Question.objects.filter(page__voting_id=poll_id).order_by('id').values('id', 'title', 'type')
+    choices = list(Choice.objects.filter(question__page__voting_id=poll_id).order_by('id')
+                   .values('id', 'name', 'question_id'))
+    snapshot = get_snapshot(poll_id)
+    counts = snapshot.choice_counts([choice['id'] for choice in choices])
+    for choice_id, total in delta_choice_counts(snapshot).items():
+        if choice_id in counts:
+            counts[choice_id] += total
+    for choice in choices:
+        choice['votes_count'] = counts[choice['id']]
+    return build_poll_statistics(questions, choices)
+
+
+# ?source=tally читает готовые счетчики ChoiceTally вместо подсчета голосов,
+# ?source=columnar - колоночный снимок голосов
+STATISTICS_SOURCES = {
+    'aggregate': poll_statistics,
+    'tally': tally_poll_statistics,
+    'columnar': columnar_poll_statistics,
+}
+
+
+def requested_source(query_params):
+    return query_params.get('source', getattr(settings, 'POLL_STATISTICS_SOURCE', 'aggregate'))
@@ -0,0 +1,84 @@
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import Count
+
+from .models import Submission, Vote, pack_choice_ids, unpack_choice_ids
+
+
+def build_submissions(entries):
+    # entries: (voting_id, голоса одной отправки). Голоса разных респондентов в одной отправке
+    # (так бывает при загрузке за несколько человек) дают отдельные Submission
+    submissions = []
+    for voting_id, votes in entries:
+        by_respondent = {}
+        for vote in votes:
+            by_respondent.setdefault(vote.user_id, []).append(vote.choice_id)
+        submissions += [Submission(voting_id=voting_id, respondent_id=respondent_id, choices=pack_choice_ids(choice_ids))
+                        for respondent_id, choice_ids in by_respondent.items()]
+    return submissions
+
+
+def create_submissions(voting_id, votes):
+    # Вызывается в транзакции вставки голосов
+    return Submission.objects.bulk_create(build_submissions([(voting_id, votes)]), batch_size=1000)
+
+
+class SubmissionCollector:
+    # Загрузка и генерация вставляют голоса пачками, но отправка респондента - вся загрузка целиком:
+    # варианты копятся по респондентам через все пачки, и create() пишет по одной Submission на респондента
+    def __init__(self, voting_id):
+        self.voting_id = voting_id
+        self.choices = {}
+
+    def add(self, votes):
+        for vote in votes:
+            self.choices.setdefault(vote.user_id, []).append(vote.choice_id)
+
+    def create(self, batch_size=1000):
+        submissions = [Submission(voting_id=self.voting_id, respondent_id=respondent_id,
+                                  choices=pack_choice_ids(choice_ids))
+                       for respondent_id, choice_ids in self.choices.items()]
+        self.choices = {}
+        return Submission.objects.bulk_create(submissions, batch_size=batch_size)
+
+
+def submission_counts(voting_id):
+    # Один запрос по индексу (voting, respondent): число респондентов и отправок
+    return Submission.objects.filter(voting_id=voting_id).aggregate(
+        respondents=Count('respondent_id', distinct=True), submissions=Count('id'))
+
+
+def respondent_submissions(voting_id, respondent_id):
+    submissions = Submission.objects.filter(voting_id=voting_id, respondent_id=respondent_id).order_by('id')
+    return [{'id': submission.id, 'created_at': submission.created_at, 'choices': submission.choice_ids}
+            for submission in submissions]
+
+
+def iter_missing_submissions(voting_id):
+    # Голоса, которых нет ни в одной Submission (приняты до их появления): по одной отправке на респондента.
+    # Варианты отправок респондента с учетом повторов вычитаются из его голосов начиная с новых, поэтому
+    # новые отправки не скрывают старые голоса, а повторный запуск ничего не создает.
+    # Голоса и отправки читаются двумя потоками, упорядоченными по респонденту
+    votes = (Vote.objects.filter(voting_id=voting_id).order_by('user_id', '-id')
+             .values_list('user_id', 'choice_id').iterator())
+    submissions = groupby(Submission.objects.filter(voting_id=voting_id).order_by('respondent_id', 'id')
+                          .values_list('respondent_id', 'choices').iterator(), key=itemgetter(0))
+    pending = next(submissions, None)
+    for respondent_id, group in groupby(votes, key=itemgetter(0)):
+        covered = Counter()
+        while pending is not None and pending[0] <= respondent_id:
+            if pending[0] == respondent_id:
+                for _, packed in pending[1]:
+                    covered.update(unpack_choice_ids(packed))
+            pending = next(submissions, None)
+        missing = []
+        for _, choice_id in group:
+            if covered[choice_id]:
+                covered[choice_id] -= 1
+            else:
+                missing.append(choice_id)
+        if missing:
+            yield Submission(voting_id=voting_id, respondent_id=respondent_id,
+                             choices=pack_choice_ids(missing[::-1]))
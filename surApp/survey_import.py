@@ -0,0 +1,174 @@
+import codecs
+import json
+import re
+import time
+
+from django.db import transaction
+
+from .logic import LogicError, dump_rules, parse_rules, recompile_logic
+from .models import Voting, Page, Question, Choice
+from .survey_tree import create_pages
+
+
+class SurveyImportError(ValueError):
+    pass
+
+
+# Хвост буфера, на котором raw_decode может споткнуться из-за обрыва чтения, а не ошибки в файле:
+# пробелы, недочитанная строка или недочитанное число / true / false / null
+TRUNCATED = re.compile(r'\s*(?:"(?:[^"\\]|\\.)*\\?|[-+.0-9eEtrufalsn]*)')
+
+
+def iter_json_documents(stream, chunk_size=1 << 20):
+    # Опросы по одному из потока байт: один объект, массив объектов (как пишет выгрузка нескольких опросов)
+    # или объекты подряд / по строке. Целиком в памяти держится только текущий опрос.
+    # Незаконченный опрос разбирается повторно, только когда недочитанный текст вырос вдвое: суммарная
+    # работа raw_decode линейна по размеру файла. Ошибка не в конце буфера - синтаксическая, а не обрыв
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    position = 0
+    # Прочитанные куски склеиваются с буфером только перед разбором, а не после каждого чтения
+    pending = []
+    pending_length = 0
+    retry_at = 0
+    eof = False
+    while True:
+        # Пропускаем пробелы и разделители верхнего уровня: '[', ',' и ']'
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            position += 1
+        ready = eof or len(buffer) - position + pending_length >= retry_at
+        if pending and ready:
+            buffer = buffer[position:] + ''.join(pending)
+            position = 0
+            pending, pending_length = [], 0
+            continue
+        if position < len(buffer) and ready:
+            try:
+                document, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as error:
+                if eof or not TRUNCATED.fullmatch(buffer, error.pos):
+                    raise SurveyImportError(f'Invalid JSON: {error}')
+                retry_at = 2 * (len(buffer) - position)
+            else:
+                yield document
+                position = end
+                retry_at = 0
+                continue
+        elif eof:
+            return
+        chunk = stream.read(chunk_size)
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        eof = not chunk
+        text = text_decoder.decode(chunk, final=eof)
+        pending.append(text)
+        pending_length += len(text)
+
+
+def require_list(data, key, where):
+    value = data.get(key, [])
+    if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+        raise SurveyImportError(f'{where}: "{key}" must be a list of objects')
+    return value
+
+
+def require_text(data, key, model, where, default=None):
+    value = data.get(key, default)
+    max_length = model._meta.get_field(key).max_length
+    if not isinstance(value, str) or len(value) > max_length:
+        raise SurveyImportError(f'{where}: "{key}" must be a string of at most {max_length} characters')
+    return value
+
+
+def clean_tree(data):
+    # Только поля, которые пишет ExportVotingToJsonFileView; id из файла используются лишь для пересчета логики.
+    # Проверка по полям моделей вместо VotingSerializer: вложенные сериализаторы слишком медленны на тысячах вариантов
+    if not isinstance(data, dict):
+        raise SurveyImportError('Each survey must be a JSON object')
+    require_text(data, 'title', Voting, 'survey')
+    pages = []
+    for page_index, page in enumerate(require_list(data, 'pages', 'survey')):
+        where = f'page {page_index}'
+        order = page.get('order', page_index)
+        if not isinstance(order, int):
+            raise SurveyImportError(f'{where}: "order" must be an integer')
+        questions = []
+        for question_index, question in enumerate(require_list(page, 'questions', where)):
+            where = f'page {page_index}, question {question_index}'
+            choices = [{'name': require_text(choice, 'name', Choice, where)}
+                       for choice in require_list(question, 'choices', where)]
+            questions.append({'title': require_text(question, 'title', Question, where),
+                              'type': require_text(question, 'type', Question, where, default='checkbox'),
+                              'choices': choices})
+        where = f'page {page_index}'
+        pages.append({'title': require_text(page, 'title', Page, where, default=''), 'order': order,
+                      'questions': questions})
+    return pages
+
+
+def old_ids(items, nested_key=None):
+    # id из файла в том же порядке, в каком create_pages возвращает созданные объекты
+    if nested_key is None:
+        return [item.get('id') for item in items]
+    return [child.get('id') for item in items for child in item.get(nested_key, [])]
+
+
+def remap_rules(data, page_ids, question_ids, choice_ids):
+    # Правила логики ссылаются на id исходного опроса: переводим их в новые id,
+    # правила с неизвестными id отбрасываются (как при recompile_logic)
+    try:
+        pairs = parse_rules(data.get('question_answer_pairs') or '', 'question_answer_pairs')
+        hidden = parse_rules(data.get('hidden_pages') or '', 'hidden_pages')
+    except LogicError:
+        return '', ''
+    new_pairs, new_hidden = [], []
+    for pair, hidden_for_choice in zip(pairs, hidden):
+        if len(pair) != 2 or pair[0] not in question_ids or pair[1] not in choice_ids:
+            continue
+        new_pairs.append([question_ids[pair[0]], choice_ids[pair[1]]])
+        new_hidden.append([page_ids[page_id] for page_id in hidden_for_choice if page_id in page_ids])
+    if not new_pairs:
+        return '', ''
+    return dump_rules(new_pairs), dump_rules(new_hidden)
+
+
+def import_voting(data, author_id):
+    # Один опрос из формата выгрузки: один INSERT на уровень дерева (на PostgreSQL), затем логика
+    pages_data = clean_tree(data)
+    with transaction.atomic():
+        voting = Voting.objects.create(
+            title=data['title'], description=data.get('description') or '', author_id=author_id,
+            is_submit=bool(data.get('is_submit', False)),
+        )
+        pages, questions, choices = create_pages(voting, pages_data)
+
+        raw_pages = require_list(data, 'pages', 'survey')
+        raw_questions = [question for page in raw_pages for question in page.get('questions', [])]
+        page_ids = {old: new.id for old, new in zip(old_ids(raw_pages), pages) if old is not None}
+        question_ids = {old: new.id for old, new in zip(old_ids(raw_questions), questions) if old is not None}
+        choice_ids = {old: new.id for old, new in zip(old_ids(raw_questions, 'choices'), choices) if old is not None}
+        voting.question_answer_pairs, voting.hidden_pages = remap_rules(data, page_ids, question_ids, choice_ids)
+        voting.save(update_fields=['question_answer_pairs', 'hidden_pages'])
+        recompile_logic(voting)
+    return {'id': voting.id, 'title': voting.title, 'pages': len(pages), 'questions': len(questions),
+            'choices': len(choices), 'rows': 1 + len(pages) + len(questions) + len(choices)}
+
+
+def import_surveys(stream, author_id, on_imported=None):
+    # Все опросы файла; при ошибке в одном из них исключение прерывает импорт
+    started = time.perf_counter()
+    imported = []
+    for data in iter_json_documents(stream):
+        result = import_voting(data, author_id)
+        imported.append(result)
+        if on_imported is not None:
+            on_imported(result)
+    seconds = time.perf_counter() - started
+    rows = sum(result['rows'] for result in imported)
+    return {
+        'imported': imported,
+        'rows': rows,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(rows / seconds, 1) if seconds else None,
+    }
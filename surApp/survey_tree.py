@@ -0,0 +1,148 @@
+from django.db import connections, router
+
+from .columnar import mark_stale
+from .models import Page, Question, Choice, ChoiceTally, Vote
+
+NESTED_KEYS = ('id', 'questions', 'choices')
+
+
+def own_fields(data):
+    # Поля самой строки без id и вложенных уровней
+    return {key: value for key, value in data.items() if key not in NESTED_KEYS}
+
+
+def bulk_create_with_ids(model, objs):
+    # bulk_create проставляет id только если база умеет возвращать строки из INSERT
+    # (PostgreSQL; SQLite - начиная с Django 4.0). Иначе вставляем по одной, чтобы у детей был родитель
+    if not objs:
+        return objs
+    connection = connections[router.db_for_write(model)]
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objs)
+    for obj in objs:
+        obj.save(force_insert=True)
+    return objs
+
+
+def create_choices(parents):
+    # parents: [(question, choices_data), ...]
+    choices = [
+        Choice(question=question, **own_fields(choice_data))
+        for question, choices_data in parents
+        for choice_data in choices_data
+    ]
+    return bulk_create_with_ids(Choice, choices)
+
+
+def create_questions(parents):
+    # parents: [(page, questions_data), ...]; возвращает (questions, choices) в порядке входных данных
+    questions = []
+    children = []
+    for page, questions_data in parents:
+        for question_data in questions_data:
+            questions.append(Question(page=page, **own_fields(question_data)))
+            children.append(question_data.get('choices', []))
+    bulk_create_with_ids(Question, questions)
+    choices = create_choices(zip(questions, children))
+    return questions, choices
+
+
+def create_pages(voting, pages_data):
+    # Дерево создается по уровням: один bulk_create на страницы, вопросы и варианты
+    pages = [Page(voting=voting, **own_fields(page_data)) for page_data in pages_data]
+    bulk_create_with_ids(Page, pages)
+    questions, choices = create_questions(
+        (page, page_data.get('questions', [])) for page, page_data in zip(pages, pages_data)
+    )
+    return pages, questions, choices
+
+
+def assign_fields(obj, fields):
+    changed = False
+    for name, value in fields.items():
+        if getattr(obj, name) != value:
+            setattr(obj, name, value)
+            changed = True
+    return changed
+
+
+class LevelDiff:
+    # Изменения одного уровня дерева: что создать, что обновить, что удалить
+    def __init__(self, existing):
+        self.existing = existing
+        self.kept = set()
+        self.created = []
+        self.updated = []
+
+    def match(self, data, make, fields):
+        obj = self.existing.get(data.get('id'))
+        if obj is None or obj.id in self.kept:
+            obj = make(**fields)
+            self.created.append(obj)
+            return obj
+        self.kept.add(obj.id)
+        if assign_fields(obj, fields):
+            self.updated.append(obj)
+        return obj
+
+    @property
+    def removed_ids(self):
+        return [obj_id for obj_id in self.existing if obj_id not in self.kept]
+
+
+def sync_pages(voting, pages_data):
+    # Сопоставляет присланное дерево с сохраненным по id. Совпавшие строки сохраняют id (и голоса),
+    # измененные обновляются через bulk_update, новые - через bulk_create, отсутствующие удаляются
+    # одним DELETE на уровень. Должна вызываться внутри transaction.atomic()
+    pages = LevelDiff({page.id: page for page in voting.pages.all()})
+    questions = LevelDiff({question.id: question for question in Question.objects.filter(page__voting=voting)})
+    choices = LevelDiff({choice.id: choice for choice in Choice.objects.filter(question__page__voting=voting)})
+    choice_questions = {choice_id: choice.question_id for choice_id, choice in choices.existing.items()}
+
+    page_tree = []
+    for page_data in pages_data:
+        page = pages.match(page_data, lambda **fields: Page(voting=voting, **fields), own_fields(page_data))
+        page_tree.append((page, page_data.get('questions', [])))
+    bulk_create_with_ids(Page, pages.created)
+
+    question_tree = []
+    for page, questions_data in page_tree:
+        for question_data in questions_data:
+            question = questions.match(question_data, Question, {**own_fields(question_data), 'page_id': page.id})
+            question_tree.append((question, question_data.get('choices', [])))
+    bulk_create_with_ids(Question, questions.created)
+
+    for question, choices_data in question_tree:
+        for choice_data in choices_data:
+            choices.match(choice_data, Choice, {**own_fields(choice_data), 'question_id': question.id})
+    Choice.objects.bulk_create(choices.created)
+
+    Page.objects.bulk_update(pages.updated, ['title', 'order'])
+    Question.objects.bulk_update(questions.updated, ['title', 'type', 'page'])
+    Choice.objects.bulk_update(choices.updated, ['name', 'question'])
+    move_choice_votes(voting, [choice for choice in choices.updated
+                               if choice.question_id != choice_questions[choice.id]])
+
+    # Сначала удаляем нижние уровни: перенесенные вопросы и варианты уже привязаны к новым родителям.
+    # Голоса удаленных вариантов уходят каскадом, и колоночный снимок опроса помечается на пересборку
+    removed_votes = 0
+    for model, diff in ((Choice, choices), (Question, questions), (Page, pages)):
+        if diff.removed_ids:
+            removed_votes += model.objects.filter(id__in=diff.removed_ids).delete()[1].get(Vote._meta.label, 0)
+    if removed_votes:
+        mark_stale(voting.id)
+
+
+def move_choice_votes(voting, moved_choices):
+    # Вариант перенесен в другой вопрос: голоса и счетчики за него переходят туда же в той же транзакции,
+    # иначе Vote.question_id расходится с Choice.question_id. В колоночном снимке вопрос записан в строках,
+    # поэтому снимок помечается на пересборку
+    by_question = {}
+    for choice in moved_choices:
+        by_question.setdefault(choice.question_id, []).append(choice.id)
+    moved = 0
+    for question_id, choice_ids in by_question.items():
+        moved += Vote.objects.filter(choice_id__in=choice_ids).update(question_id=question_id)
+        ChoiceTally.objects.filter(choice_id__in=choice_ids).update(question_id=question_id)
+    if moved:
+        mark_stale(voting.id)
@@ -0,0 +1,86 @@
+import random
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .logic import recompile_logic
+from .models import Voting, Choice, Vote
+from .submissions import SubmissionCollector
+from .survey_tree import create_pages
+from .tallies import rebuild_tallies
+
+
+def survey_payload(pages, questions, choices, title='Синтетический опрос'):
+    # Дерево опроса в формате VotingSerializer (create/voting/)
+    return {
+        'title': title,
+        'description': f'{pages} x {questions} x {choices}',
+        'pages': [
+            {
+                'title': f'Страница {page_index + 1}',
+                'order': page_index,
+                'questions': [
+                    {
+                        'title': f'Вопрос {page_index + 1}.{question_index + 1}',
+                        'choices': [{'name': f'Вариант {choice_index + 1}'} for choice_index in range(choices)],
+                    }
+                    for question_index in range(questions)
+                ],
+            }
+            for page_index in range(pages)
+        ],
+    }
+
+
+def generate_survey(author, pages, questions, choices, title='Синтетический опрос'):
+    payload = survey_payload(pages, questions, choices, title)
+    with transaction.atomic():
+        voting = Voting.objects.create(title=payload['title'], description=payload['description'], author=author,
+                                       is_submit=True)
+        create_pages(voting, payload['pages'])
+        recompile_logic(voting)
+    return voting
+
+
+def generate_respondents(count, prefix='respondent'):
+    # Пользователи-респонденты; существующие с тем же именем переиспользуются
+    # (по префиксу, а не username__in: у SQLite ограничено число параметров запроса)
+    usernames = [f'{prefix}_{index}' for index in range(count)]
+    existing = User.objects.filter(username__startswith=f'{prefix}_')
+    known = set(existing.values_list('username', flat=True))
+    User.objects.bulk_create([User(username=name) for name in usernames if name not in known], batch_size=5000)
+    ids = dict(existing.values_list('username', 'id'))
+    return [ids[name] for name in usernames]
+
+
+def generate_votes(voting, respondents, votes, batch_size=10_000, seed=0):
+    # Каждый респондент отвечает на вопросы опроса по порядку, выбирая случайный вариант.
+    # Вставка пачками по batch_size, затем одним проходом пересчитываются ChoiceTally
+    question_choices = {}
+    for choice_id, question_id in (Choice.objects.filter(question__page__voting=voting)
+                                   .order_by('question_id', 'id').values_list('id', 'question_id')):
+        question_choices.setdefault(question_id, []).append(choice_id)
+    questions = list(question_choices.items())
+    if not questions or not respondents:
+        return 0
+
+    rng = random.Random(seed)
+    submissions = SubmissionCollector(voting.id)
+    batch = []
+    created = 0
+    for index in range(votes):
+        respondent = respondents[(index // len(questions)) % len(respondents)]
+        question_id, choices = questions[index % len(questions)]
+        batch.append(Vote(voting_id=voting.id, user_id=respondent, question_id=question_id,
+                          choice_id=rng.choice(choices)))
+        if len(batch) == batch_size:
+            Vote.objects.bulk_create(batch)
+            submissions.add(batch)
+            created += len(batch)
+            batch = []
+    Vote.objects.bulk_create(batch)
+    submissions.add(batch)
+    submissions.create()
+    created += len(batch)
+    rebuild_tallies(voting.id)
+    return created
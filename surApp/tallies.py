@@ -0,0 +1,84 @@
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import Vote, ChoiceTally
+from .results_cache import bump_version_on_commit
+
+
+def get_shard_count():
+    return max(1, getattr(settings, 'VOTE_TALLY_SHARDS', 8))
+
+
+def apply_votes(votes):
+    # Вызывается в той же транзакции, что и вставка голосов.
+    # Все строки одной отправки попадают в случайный шард, поэтому параллельные отправки
+    # обычно обновляют разные строки ChoiceTally
+    counts = Counter((vote.question_id, vote.choice_id) for vote in votes)
+    if not counts:
+        return
+    shard = random.randrange(get_shard_count())
+    ChoiceTally.objects.bulk_create(
+        [ChoiceTally(question_id=question_id, choice_id=choice_id, shard=shard)
+         for question_id, choice_id in counts],
+        ignore_conflicts=True,
+    )
+    # Обычно все приращения равны 1, поэтому обновление укладывается в один UPDATE
+    by_amount = {}
+    for (question_id, choice_id), amount in counts.items():
+        by_amount.setdefault(amount, []).append(choice_id)
+    for amount, choice_ids in by_amount.items():
+        ChoiceTally.objects.filter(choice_id__in=choice_ids, shard=shard).update(votes_count=F('votes_count') + amount)
+
+
+def count_votes(voting_id=None):
+    votes = Vote.objects.all()
+    if voting_id is not None:
+        votes = votes.filter(voting_id=voting_id)
+    return {
+        (row['question_id'], row['choice_id']): row['total']
+        for row in votes.values('question_id', 'choice_id').annotate(total=Count('id'))
+    }
+
+
+def count_tallies(voting_id=None):
+    tallies = ChoiceTally.objects.all()
+    if voting_id is not None:
+        tallies = tallies.filter(question__page__voting_id=voting_id)
+    return {
+        (row['question_id'], row['choice_id']): row['total']
+        for row in tallies.values('question_id', 'choice_id').annotate(total=Sum('votes_count'))
+        if row['total']
+    }
+
+
+def verify_tallies(voting_id=None):
+    # Возвращает расхождения {(question_id, choice_id): (по голосам, по счетчикам)}
+    expected = count_votes(voting_id)
+    actual = count_tallies(voting_id)
+    return {
+        key: (expected.get(key, 0), actual.get(key, 0))
+        for key in expected.keys() | actual.keys()
+        if expected.get(key, 0) != actual.get(key, 0)
+    }
+
+
+def rebuild_tallies(voting_id=None):
+    # Пересчитывает счетчики из Vote. Итог каждого варианта кладется в шард 0
+    with transaction.atomic():
+        tallies = ChoiceTally.objects.all()
+        if voting_id is not None:
+            tallies = tallies.filter(question__page__voting_id=voting_id)
+        tallies.delete()
+        expected = count_votes(voting_id)
+        ChoiceTally.objects.bulk_create(
+            [ChoiceTally(question_id=question_id, choice_id=choice_id, shard=0, votes_count=total)
+             for (question_id, choice_id), total in expected.items()],
+            batch_size=1000,
+        )
+        if voting_id is not None:
+            bump_version_on_commit(voting_id)
+    return len(expected)
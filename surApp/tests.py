@@ -1,3 +1,1331 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import json
+import os
+import re
+import tempfile
+import threading
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, router
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from openpyxl import load_workbook
+from surService.routers import PrimaryReplicaRouter, choose_read_database, read_database
+
+from .columnar import compact_votes, get_snapshot
+from .crosstab import build_matrix, matrix_cache
+from .exports import keyset_iterator
+from .live import LiveResultsBroker, ResultsCacheBackend
+from .models import Voting, Page, Question, Choice, Vote, Submission
+from .profiling import make_profile_token
+from .results_cache import FileLock, bump_version, cached_results, current_version, get_results_cache, lock_key
+from .serializers import VotingSerializer
+from .snapshots import build_snapshot
+from .spool import VoteSpool, drain_spool
+from .survey_import import SurveyImportError, iter_json_documents
+from .tallies import rebuild_tallies, verify_tallies
+from .vote_import import VoteImporter, VoteImportError
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SurveyTestCase(TestCase):
+    # Реплики в тестах зеркалят default (TEST MIRROR); кеши перед каждым тестом очищает
+    # surService.test_runner.IsolatedCachesTestRunner
+    databases = '__all__'
+
+    def _should_check_constraints(self, connection):
+        # Зеркало работает с той же базой, что default, вне транзакции теста: в Django 3.2 проверка
+        # ограничений на нем упирается в блокировку таблиц SQLite
+        return not connection.settings_dict['TEST']['MIRROR'] and super()._should_check_constraints(connection)
+
+
+def make_voting(author, questions=2, choices=2, pages=1):
+    voting = Voting.objects.create(title='Опрос', description='Описание', author=author)
+    for page_index in range(pages):
+        page = Page.objects.create(voting=voting, title=f'Страница {page_index}', order=page_index)
+        for question_index in range(questions):
+            question = Question.objects.create(page=page, title=f'Вопрос {question_index}')
+            for choice_index in range(choices):
+                Choice.objects.create(question=question, name=f'Вариант {choice_index}')
+    return voting
+
+
+class PollDetailAPIViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='password')
+
+    def test_counts_include_choices_without_votes(self):
+        voting = make_voting(self.user, questions=2, choices=2)
+        choice = Choice.objects.filter(question__page__voting=voting).first()
+        Vote.objects.create(user=self.user, voting=voting, question=choice.question, choice=choice)
+
+        response = self.client.get(reverse('poll-statistic', args=[voting.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        counts = {c['choice_id']: c['votes_count'] for q in response.data for c in q['choices']}
+        self.assertEqual(len(counts), 4)
+        self.assertEqual(counts[choice.id], 1)
+        self.assertEqual(sum(counts.values()), 1)
+        self.assertEqual(set(response.data[0]), {'question_id', 'question_title', 'question_type', 'choices'})
+
+    def test_query_count_does_not_grow_with_questions(self):
+        small = make_voting(self.user, questions=2, choices=3)
+        large = make_voting(self.user, questions=40, choices=6)
+
+        with self.assertNumQueries(2):
+            self.client.get(reverse('poll-statistic', args=[small.id]))
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('poll-statistic', args=[large.id]))
+        self.assertEqual(len(response.data), 40)
+
+
+class PollResultsCacheTests(SurveyTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='voter', password='password')
+        self.voting = make_voting(self.user, questions=2, choices=2)
+        self.choice = Choice.objects.filter(question__page__voting=self.voting).first()
+        self.url = reverse('poll-statistic', args=[self.voting.id])
+
+    def total_votes(self, response):
+        return sum(c['votes_count'] for q in response.data for c in q['choices'])
+
+    def test_repeated_reads_are_served_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_submission_invalidates_cached_results(self):
+        self.assertEqual(self.total_votes(self.client.get(self.url)), 0)
+        payload = [{'user': self.user.id, 'question': self.choice.question_id, 'choice': self.choice.id}]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('do_response', args=[self.voting.id]), payload, content_type='application/json')
+
+        self.assertEqual(self.total_votes(self.client.get(self.url)), 1)
+
+    def test_stale_results_served_while_other_worker_recomputes(self):
+        self.client.get(self.url)
+        Vote.objects.create(user=self.user, voting=self.voting, question=self.choice.question, choice=self.choice)
+        bump_version(self.voting.id)
+        cache.add(lock_key(self.voting.id, 'aggregate'), True)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(self.total_votes(response), 0)
+
+        cache.delete(lock_key(self.voting.id, 'aggregate'))
+        self.assertEqual(self.total_votes(self.client.get(self.url)), 1)
+
+    def test_every_bump_changes_version(self):
+        versions = {current_version(self.voting.id)}
+        for _ in range(3):
+            bump_version(self.voting.id)
+            versions.add(current_version(self.voting.id))
+        self.assertEqual(len(versions), 4)
+
+    def test_versioned_results_are_computed_on_primary(self):
+        with read_database('replica_0'):
+            alias = cached_results(self.voting.id, 'probe', lambda poll_id: router.db_for_read(Vote))
+        self.assertEqual(alias, 'default')
+
+
+class FileCacheResultsLockTests(SurveyTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                              'LOCATION': directory.name}}
+        settings_override = override_settings(CACHES=caches)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='voter', password='password')
+        self.voting = make_voting(self.user, questions=1, choices=1)
+
+    def test_lock_is_exclusive_across_open_files(self):
+        first = FileLock(get_results_cache(), lock_key(self.voting.id, 'aggregate'))
+        second = FileLock(get_results_cache(), lock_key(self.voting.id, 'aggregate'))
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+
+    def test_stale_results_served_while_lock_is_held(self):
+        self.assertEqual(cached_results(self.voting.id, 'probe', lambda poll_id: 'old'), 'old')
+        bump_version(self.voting.id)
+        holder = FileLock(get_results_cache(), lock_key(self.voting.id, 'probe'))
+        holder.acquire()
+        self.addCleanup(holder.release)
+
+        self.assertEqual(cached_results(self.voting.id, 'probe', lambda poll_id: 'new'), 'old')
+        holder.release()
+        self.assertEqual(cached_results(self.voting.id, 'probe', lambda poll_id: 'new'), 'new')
+
+
+class ChoiceTallyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='voter', password='password')
+        self.voting = make_voting(self.user, questions=2, choices=2)
+        self.choices = list(Choice.objects.filter(question__page__voting=self.voting).order_by('id'))
+
+    def submit(self, choices):
+        payload = [{'user': self.user.id, 'question': c.question_id, 'choice': c.id} for c in choices]
+        return self.client.post(reverse('do_response', args=[self.voting.id]), payload, content_type='application/json')
+
+    def test_submission_updates_tallies(self):
+        for _ in range(3):
+            self.assertEqual(self.submit([self.choices[0], self.choices[2]]).status_code, 201)
+
+        response = self.client.get(reverse('poll-statistic', args=[self.voting.id]), {'source': 'tally'})
+
+        counts = {c['choice_id']: c['votes_count'] for q in response.data for c in q['choices']}
+        self.assertEqual(counts, {self.choices[0].id: 3, self.choices[1].id: 0,
+                                  self.choices[2].id: 3, self.choices[3].id: 0})
+        self.assertEqual(verify_tallies(self.voting.id), {})
+
+    def test_rebuild_restores_drifted_tallies(self):
+        self.submit([self.choices[0]])
+        Vote.objects.create(user=self.user, voting=self.voting, question=self.choices[1].question, choice=self.choices[1])
+        self.assertEqual(verify_tallies(self.voting.id), {(self.choices[1].question_id, self.choices[1].id): (1, 0)})
+
+        call_command('rebuild_tallies', voting=self.voting.id, stdout=StringIO())
+
+        self.assertEqual(verify_tallies(self.voting.id), {})
+
+
+class VoteBulkCreateViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='voter', password='password')
+        self.voting = make_voting(self.user, questions=3, choices=2)
+        self.other = make_voting(self.user, questions=1, choices=2)
+        self.url = reverse('do_response', args=[self.voting.id])
+
+    def payload(self, voting):
+        return [{'user': self.user.id, 'question': c.question_id, 'choice': c.id}
+                for c in Choice.objects.filter(question__page__voting=voting)]
+
+    def test_query_count_does_not_grow_with_answers(self):
+        small = self.payload(self.voting)[:2]
+        large = self.payload(make_voting(self.user, questions=50, choices=2))
+
+        with CaptureQueriesContext(connection) as small_queries:
+            self.client.post(self.url, small, content_type='application/json')
+        large_url = reverse('do_response', args=[Voting.objects.latest('id').id])
+        with CaptureQueriesContext(connection) as large_queries:
+            response = self.client.post(large_url, large, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 100)
+        self.assertEqual(len(small_queries), len(large_queries))
+
+    def test_rejects_question_from_another_voting(self):
+        response = self.client.post(self.url, self.payload(self.other), content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"error": "Question does not belong to the specified voting"})
+        self.assertFalse(Vote.objects.exists())
+
+    def test_rejects_choice_from_another_question(self):
+        first, second = Question.objects.filter(page__voting=self.voting)[:2]
+        payload = [{'user': self.user.id, 'question': first.id, 'choice': second.choices.first().id}]
+
+        response = self.client.post(self.url, payload, content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"error": "Choice does not belong to the specified question"})
+        self.assertFalse(Vote.objects.exists())
+
+
+class VoteSpoolTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='voter', password='password')
+        self.voting = make_voting(self.user, questions=2, choices=2)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.spool = VoteSpool(os.path.join(self.directory.name, 'spool.sqlite3'))
+        patcher = mock.patch('surApp.views.get_vote_spool', return_value=self.spool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self):
+        payload = [{'user': self.user.id, 'question': c.question_id, 'choice': c.id}
+                   for c in Choice.objects.filter(question__page__voting=self.voting)[::2]]
+        return self.client.post(reverse('do_response', args=[self.voting.id]), payload, content_type='application/json')
+
+    @override_settings(VOTE_INGESTION_MODE='spool')
+    def test_spooled_votes_are_drained_in_batches(self):
+        for _ in range(3):
+            self.assertEqual(self.submit().status_code, 202)
+        self.assertFalse(Vote.objects.exists())
+        self.assertEqual(self.spool.depth(), {'entries': 3, 'votes': 6})
+
+        self.assertEqual(drain_spool(self.spool, batch_size=4), (2, 4))
+        self.assertEqual(drain_spool(self.spool, batch_size=4), (1, 2))
+
+        self.assertEqual(Vote.objects.count(), 6)
+        self.assertEqual(self.spool.depth(), {'entries': 0, 'votes': 0})
+        self.assertEqual(Submission.objects.filter(voting=self.voting, respondent=self.user).count(), 3)
+        self.assertEqual(verify_tallies(self.voting.id), {})
+
+    @override_settings(VOTE_INGESTION_MODE='spool')
+    def test_replay_after_crash_does_not_duplicate_votes(self):
+        self.submit()
+        self.submit()
+        # Сбой между фиксацией вставки и очисткой журнала
+        with mock.patch.object(self.spool, 'delete_through'):
+            drain_spool(self.spool, batch_size=100)
+        self.assertEqual(self.spool.depth()['entries'], 2)
+
+        self.assertEqual(drain_spool(self.spool, batch_size=100), (0, 0))
+        self.assertEqual(Vote.objects.count(), 4)
+        self.assertEqual(self.spool.depth()['entries'], 0)
+
+    @override_settings(VOTE_INGESTION_MODE='spool')
+    def test_entry_with_deleted_choice_is_dead_lettered(self):
+        self.submit()
+        self.submit()
+        deleted = Choice.objects.filter(question__page__voting=self.voting)[1]
+        row = [self.user.id, deleted.question_id, deleted.id]
+        self.spool.append(self.voting.id, [dict(zip(['user_id', 'question_id', 'choice_id'], row))])
+        self.submit()
+        deleted.delete()
+
+        self.assertEqual(drain_spool(self.spool, batch_size=100), (4, 6))
+        self.assertEqual(self.spool.depth()['entries'], 0)
+        [(entry_id, voting_id, rows, error)] = self.spool.dead_letters()
+        self.assertEqual(rows, [row])
+        self.assertIn('not found', error)
+
+    @override_settings(VOTE_INGESTION_MODE='spool')
+    def test_drain_once_passes_batches_of_dead_letters(self):
+        deleted = Choice.objects.filter(question__page__voting=self.voting)[1]
+        for _ in range(3):
+            self.spool.append(self.voting.id, [{'user_id': self.user.id, 'question_id': deleted.question_id,
+                                                'choice_id': deleted.id}])
+        self.submit()
+        deleted.delete()
+
+        with mock.patch('surApp.management.commands.drain_vote_spool.get_vote_spool', return_value=self.spool):
+            call_command('drain_vote_spool', '--once', '--batch-size', '1', stdout=StringIO())
+
+        self.assertEqual(self.spool.depth()['entries'], 0)
+        self.assertEqual(len(self.spool.dead_letters()), 3)
+        self.assertEqual(Vote.objects.count(), 2)
+
+
+class ExportVotesToExcelViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='password')
+        self.voting = make_voting(self.user, questions=2, choices=2)
+        for choice in Choice.objects.filter(question__page__voting=self.voting):
+            Vote.objects.create(user=self.user, voting=self.voting, question=choice.question, choice=choice)
+        self.client.force_login(self.user)
+        self.url = reverse('export-votes', args=[self.voting.id])
+
+    def test_stream_csv(self):
+        response = self.client.get(self.url, {'stream': 'csv'})
+
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(rows[0], ['User', 'Question ID', 'Question', 'Choice ID', 'Choice'])
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1][0], 'author')
+
+    def test_stream_xlsx(self):
+        response = self.client.get(self.url, {'stream': 'xlsx'})
+
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook['Votes'].iter_rows(values_only=True))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1][1], Vote.objects.order_by('id').first().question_id)
+
+    def test_keyset_iterator_reads_in_chunks(self):
+        ids = [row[0] for row in keyset_iterator(Vote.objects.all(), ['id'], chunk_size=3)]
+
+        self.assertEqual(ids, list(Vote.objects.order_by('id').values_list('id', flat=True)))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VotingDetailViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author', password='password')
+        self.voting = make_voting(self.user, questions=2, choices=2)
+        self.url = reverse('voting-detail', args=[self.voting.id])
+
+    def test_snapshot_matches_serializer_and_skips_database(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+
+        self.assertEqual(json.loads(first.content), VotingSerializer(self.voting).data)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertIn('Cache-Control', second)
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_survey_change_produces_new_snapshot(self):
+        etag = self.client.get(self.url)['ETag']
+        self.voting.title = 'Новое название'
+        self.voting.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['title'], 'Новое название')
+
+    def test_choice_change_produces_new_snapshot(self):
+        etag = self.client.get(self.url)['ETag']
+        choice = Choice.objects.filter(question__page__voting=self.voting).first()
+        choice.name = 'Новый вариант'
+        with self.captureOnCommitCallbacks(execute=True):
+            choice.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Новый вариант', response.content.decode())
+
+        etag = response['ETag']
+        with mock.patch('surApp.snapshots.build_snapshot', wraps=build_snapshot) as build, \
+                self.captureOnCommitCallbacks(execute=True):
+            Question.objects.filter(page__voting=self.voting).first().delete()
+        build.assert_called_once_with(self.voting.id)
+        self.assertNotEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_cascade_delete_does_not_query_per_row(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            votings = [make_voting(self.user, questions=1, choices=1), make_voting(self.user, questions=5, choices=10)]
+        counts = []
+        for voting in votings:
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                voting.delete()
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_missing_voting_returns_404(self):
+        self.assertEqual(self.client.get(reverse('voting-detail', args=[self.voting.id + 100])).status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VotingSerializerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='password')
+        self.voting = make_voting(self.user, questions=2, choices=2, pages=2)
+
+    def test_create_builds_tree(self):
+        data = VotingSerializer(self.voting).data
+        serializer = VotingSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        voting = serializer.save(author=self.user)
+
+        self.assertEqual(voting.pages.count(), 2)
+        self.assertEqual(Question.objects.filter(page__voting=voting).count(), 4)
+        self.assertEqual(Choice.objects.filter(question__page__voting=voting).count(), 8)
+        self.assertNotEqual(voting.pages.first().id, self.voting.pages.first().id)
+
+    def test_update_preserves_ids_and_votes(self):
+        data = VotingSerializer(self.voting).data
+        kept = data['pages'][0]['questions'][0]['choices'][0]
+        Vote.objects.create(user=self.user, voting=self.voting, question_id=data['pages'][0]['questions'][0]['id'],
+                            choice_id=kept['id'])
+        removed_page_id = data['pages'][1]['id']
+        moved_question = data['pages'][1]['questions'][0]
+        data['title'] = 'Исправленный заголовок'
+        kept['name'] = 'Исправленный вариант'
+        data['pages'][0]['questions'][1]['choices'].pop()
+        data['pages'][0]['questions'].append(moved_question)
+        data['pages'][0]['questions'][0]['choices'].append({'name': 'Новый вариант'})
+        del data['pages'][1]
+
+        serializer = VotingSerializer(self.voting, data=data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        choice = Choice.objects.get(id=kept['id'])
+        self.assertEqual(choice.name, 'Исправленный вариант')
+        self.assertEqual(choice.votes.count(), 1)
+        self.assertFalse(Page.objects.filter(id=removed_page_id).exists())
+        self.assertEqual(Question.objects.get(id=moved_question['id']).page_id, data['pages'][0]['id'])
+        self.assertEqual(Question.objects.filter(page__voting=self.voting).count(), 3)
+        self.assertEqual(Choice.objects.filter(question__page__voting=self.voting).count(), 6)
+        self.assertTrue(Choice.objects.filter(name='Новый вариант', question_id=data['pages'][0]['questions'][0]['id']).exists())
+
+    def test_moved_choice_takes_its_votes_and_tallies(self):
+        data = VotingSerializer(self.voting).data
+        source, target = data['pages'][0]['questions']
+        moved = source['choices'].pop()
+        target['choices'].append(moved)
+        Vote.objects.create(user=self.user, voting=self.voting, question_id=source['id'], choice_id=moved['id'])
+        rebuild_tallies(self.voting.id)
+
+        serializer = VotingSerializer(self.voting, data=data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEqual(Vote.objects.get(choice_id=moved['id']).question_id, target['id'])
+        self.assertEqual(verify_tallies(self.voting.id), {})
+
+    def test_partial_update_without_pages_keeps_tree(self):
+        serializer = VotingSerializer(self.voting, data={'title': 'Новое'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEqual(self.voting.pages.count(), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VotingLogicTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='password')
+        self.voting = make_voting(self.user, questions=1, choices=2, pages=4)
+        self.pages = list(self.voting.pages.order_by('order').values_list('id', flat=True))
+        self.question = Question.objects.filter(page_id=self.pages[0]).first()
+        self.first, self.second = self.question.choices.order_by('id')
+
+    def add_logic(self, pairs, hidden):
+        return self.client.patch(reverse('add-logic', args=[self.voting.id]),
+                                 {'question_answer_pairs': json.dumps(pairs), 'hidden_pages': json.dumps(hidden)},
+                                 content_type='application/json')
+
+    def next_page(self, page, choices):
+        return self.client.post(reverse('next-page', args=[self.voting.id]), {'page': page, 'choices': choices},
+                                content_type='application/json').data
+
+    def test_compiled_logic_skips_hidden_pages(self):
+        response = self.add_logic([[self.question.id, self.first.id]], [[self.pages[1], self.pages[2]]])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.next_page(self.pages[0], [self.first.id])['next_page'], self.pages[3])
+        self.assertEqual(self.next_page(self.pages[0], [self.second.id])['next_page'], self.pages[1])
+        self.assertIsNone(self.next_page(self.pages[3], [])['next_page'])
+        self.assertEqual(self.next_page(None, [])['next_page'], self.pages[0])
+
+    def test_rejects_non_object_body(self):
+        for body in ([self.first.id], 'page', 1):
+            next_page = self.client.post(reverse('next-page', args=[self.voting.id]), json.dumps(body),
+                                         content_type='application/json')
+            add_logic = self.client.patch(reverse('add-logic', args=[self.voting.id]), json.dumps(body),
+                                          content_type='application/json')
+
+            self.assertEqual(next_page.status_code, 400)
+            self.assertEqual(add_logic.status_code, 400)
+
+    def test_rejects_rules_with_foreign_ids(self):
+        other_question = Question.objects.filter(page_id=self.pages[1]).first()
+
+        wrong_choice = self.add_logic([[other_question.id, self.first.id]], [[self.pages[2]]])
+        wrong_page = self.add_logic([[self.question.id, self.first.id]], [[self.pages[2] + 1000]])
+        wrong_length = self.add_logic([[self.question.id, self.first.id]], [])
+
+        for response in (wrong_choice, wrong_page, wrong_length):
+            self.assertEqual(response.status_code, 400)
+        self.voting.refresh_from_db()
+        self.assertEqual(self.voting.question_answer_pairs, '')
+
+
+class VotingListByUserAPIViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='password')
+        self.other = User.objects.create_user(username='other', password='password')
+        self.client.force_login(self.user)
+        self.url = reverse('voting-list-by-user', args=[self.user.id])
+
+    def test_summary_counts(self):
+        voting = make_voting(self.user, questions=2, choices=2, pages=2)
+        for user in (self.user, self.other):
+            for choice in Choice.objects.filter(question__page__voting=voting)[:3]:
+                Vote.objects.create(user=user, voting=voting, question=choice.question, choice=choice)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [{
+            'id': voting.id, 'title': voting.title, 'is_submit': False,
+            'page_count': 2, 'question_count': 4, 'response_count': 2,
+        }])
+
+    def test_summary_query_count_does_not_grow_with_votings(self):
+        make_voting(self.user)
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(self.url)
+        for _ in range(5):
+            make_voting(self.user)
+        with CaptureQueriesContext(connection) as six:
+            response = self.client.get(self.url)
+
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(len(one), len(six))
+
+    def test_cursor_pagination_and_expand(self):
+        votings = [make_voting(self.user) for _ in range(3)]
+
+        first = self.client.get(self.url, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+        expanded = self.client.get(self.url, {'expand': 1})
+
+        self.assertEqual([v['id'] for v in first.data['results'] + second.data['results']], [v.id for v in votings])
+        self.assertEqual(len(expanded.data['results'][0]['pages'][0]['questions']), 2)
+
+
+class DetailStatisticAPIViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='password')
+        self.voting = make_voting(self.user, questions=3, choices=2)
+        for choice in Choice.objects.filter(question__page__voting=self.voting):
+            Vote.objects.create(user=self.user, voting=self.voting, question=choice.question, choice=choice)
+        self.client.force_login(self.user)
+        self.url = reverse('detail-statistic', args=[self.voting.id])
+        self.expected = [{'user': v.user_id, 'question': v.question_id, 'choice': v.choice_id}
+                         for v in Vote.objects.order_by('id')]
+
+    def test_keyset_pages(self):
+        results = []
+        url, params = self.url, {'page_size': 4}
+        while url:
+            response = self.client.get(url, params)
+            results.extend(response.data['results'])
+            url, params = response.data['next'], None
+
+        self.assertEqual(results, self.expected)
+
+    def test_ndjson_stream(self):
+        response = self.client.get(self.url, {'stream': 'ndjson'})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected)
+
+
+class VoteVotingBackfillTests(TestCase):
+    def test_backfill_fills_missing_voting_in_batches(self):
+        user = User.objects.create_user(username='voter', password='password')
+        voting = make_voting(user, questions=3, choices=2)
+        Vote.objects.bulk_create([Vote(user=user, question_id=c.question_id, choice=c)
+                                  for c in Choice.objects.filter(question__page__voting=voting)])
+        self.assertEqual(Vote.objects.filter(voting__isnull=True).count(), 6)
+
+        call_command('backfill_vote_voting', batch_size=2, stdout=StringIO())
+
+        self.assertEqual(Vote.objects.filter(voting=voting).count(), 6)
+
+    def test_admin_sets_voting_from_question(self):
+        admin = User.objects.create_superuser(username='admin', password='password')
+        voting = make_voting(admin, questions=1, choices=1)
+        choice = Choice.objects.get(question__page__voting=voting)
+        self.client.force_login(admin)
+
+        response = self.client.post(reverse('admin:surApp_vote_add'),
+                                    {'user': admin.id, 'question': choice.question_id, 'choice': choice.id})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Vote.objects.get().voting_id, voting.id)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, DATABASE_REPLICAS=['replica_0'], REPLICA_READ_YOUR_WRITES_SECONDS=30)
+class PrimaryReplicaRouterTests(SurveyTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.user = User.objects.create_user(username='author', password='password')
+
+    def test_reads_go_to_replica_only_inside_read_database(self):
+        self.assertEqual(self.router.db_for_read(Vote), 'default')
+        with read_database(choose_read_database(self.user.id)):
+            self.assertEqual(self.router.db_for_read(Vote), 'replica_0')
+            self.assertEqual(self.router.db_for_write(Vote), 'default')
+        self.assertEqual(self.router.db_for_read(Vote), 'default')
+
+    def test_recent_write_keeps_user_on_primary(self):
+        self.client.force_login(self.user)
+        voting = make_voting(self.user)
+        self.client.patch(reverse('submit', args=[voting.id]), {'is_submit': True}, content_type='application/json')
+
+        self.assertEqual(choose_read_database(self.user.id), 'default')
+        self.assertEqual(choose_read_database(self.user.id + 1), 'replica_0')
+
+
+class CachedJWTAuthenticationTests(SurveyTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='password')
+        response = self.client.post(reverse('login'), {'username': 'author', 'password': 'password'})
+        self.tokens = response.data
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {self.tokens['access']}"}
+
+    def test_cached_mode_skips_user_query_on_repeated_requests(self):
+        self.client.get(reverse('home'), **self.auth)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'), **self.auth)
+        self.assertEqual(response.data['message'], 'Привет, author!')
+
+    @override_settings(AUTH_FAST_PATH={'MODE': 'stateless', 'CHECK_BLACKLIST': False})
+    def test_stateless_mode_uses_token_claims(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'), **self.auth)
+        self.assertEqual(response.data['message'], 'Привет, author!')
+
+        payload = {'title': 'Опрос', 'description': 'Описание', 'pages': []}
+        response = self.client.post(reverse('voting-create'), payload, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Voting.objects.get().author_id, self.user.id)
+
+    def test_logout_revokes_access_token(self):
+        self.client.get(reverse('home'), **self.auth)
+        response = self.client.post(reverse('logout'), {'refresh_token': self.tokens['refresh']}, **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.client.get(reverse('home'), **self.auth).status_code, 401)
+
+    def test_basic_auth_is_not_accepted(self):
+        credentials = base64.b64encode(b'author:password').decode()
+        response = self.client.get(reverse('home'), HTTP_AUTHORIZATION=f'Basic {credentials}')
+        self.assertEqual(response.data['message'], 'Войти')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsgiServingTests(TransactionTestCase):
+    # Под ASGI прием голосов и статистика - асинхронные представления, их запросы идут в других потоках
+    # со своими соединениями: данные теста должны быть зафиксированы, поэтому TransactionTestCase
+    def setUp(self):
+        self.user = User.objects.create_user(username='voter', password='password')
+        self.voting = make_voting(self.user, questions=2, choices=2)
+        self.payload = [{'user': self.user.id, 'question': c.question_id, 'choice': c.id}
+                        for c in Choice.objects.filter(question__page__voting=self.voting)[:2]]
+        self.async_client = AsyncClient()
+
+    async def test_asgi_submission_matches_sync_contract(self):
+        url = reverse('do_response', args=[self.voting.id])
+        response = await self.async_client.post(url, self.payload, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), self.payload)
+        self.assertEqual(await sync_to_async(Vote.objects.filter(voting=self.voting).count)(), 2)
+
+    async def test_asgi_submission_errors_match_sync_contract(self):
+        bad = [{**self.payload[0], 'choice': 0}]
+        url = reverse('do_response', args=[self.voting.id])
+        async_response = await self.async_client.post(url, bad, content_type='application/json')
+        sync_response = await sync_to_async(self.client.post)(url, bad, content_type='application/json')
+
+        self.assertEqual(async_response.status_code, 400)
+        self.assertEqual(async_response.json(), sync_response.json())
+        missing = await self.async_client.post(reverse('do_response', args=[0]), bad, content_type='application/json')
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual((await self.async_client.get(url)).status_code, 405)
+
+    async def test_asgi_statistics_match_sync_response(self):
+        url = reverse('poll-statistic', args=[self.voting.id])
+        async_response = await self.async_client.get(url)
+        sync_response = await sync_to_async(self.client.get)(url)
+
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual(async_response.json(), sync_response.json())
+        self.assertEqual((await self.async_client.get(f'{url}?source=unknown')).status_code, 400)
+
+    async def test_asgi_requests_are_served_concurrently(self):
+        # Обе статистики ждут друг друга в барьере: синхронные представления под ASGI в Django 3.2
+        # выполнялись бы по одному, и барьер истек бы
+        barrier = threading.Barrier(2, timeout=5)
+
+        def results(poll_id, query_params):
+            barrier.wait()
+            return {}, 200
+
+        url = reverse('poll-statistic', args=[self.voting.id])
+        with mock.patch('surApp.views.poll_results', side_effect=results):
+            responses = await asyncio.gather(self.async_client.get(url), self.async_client.get(url))
+
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func))
+
+    async def test_asgi_streams_are_buffered_or_refused(self):
+        await sync_to_async(Vote.objects.create)(user=self.user, voting=self.voting,
+                                                 question_id=self.payload[0]['question'],
+                                                 choice_id=self.payload[0]['choice'])
+        await sync_to_async(self.async_client.force_login)(self.user)
+
+        response = await self.async_client.get(
+            reverse('detail-statistic', args=[self.voting.id]) + '?stream=ndjson')
+        body = response.getvalue()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([json.loads(line)['choice'] for line in body.splitlines()], [self.payload[0]['choice']])
+
+        response = await self.async_client.get(reverse('poll-statistic-stream', args=[self.voting.id]))
+        self.assertEqual(response.status_code, 501)
+
+
+class LiveResultsTests(SurveyTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='voter', password='password')
+        self.voting = make_voting(self.user, questions=2, choices=2)
+        self.choice = Choice.objects.filter(question__page__voting=self.voting).first()
+        self.backend = ResultsCacheBackend()
+        self.broker = LiveResultsBroker(self.backend, interval=0, backlog=8)
+
+    def vote(self):
+        payload = [{'user': self.user.id, 'question': self.choice.question_id, 'choice': self.choice.id}]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('do_response', args=[self.voting.id]), payload, content_type='application/json')
+
+    def test_viewers_receive_coalesced_delta(self):
+        seq, data = self.broker.subscribe(self.voting.id, 'aggregate')
+        self.broker.subscribe(self.voting.id, 'aggregate')
+        self.assertEqual(sum(c['votes_count'] for q in data for c in q['choices']), 0)
+        self.assertEqual(self.broker.wait(self.voting.id, 'aggregate', seq, timeout=0.05), [])
+
+        self.vote()
+        self.vote()
+        with mock.patch.object(self.backend, 'load', wraps=self.backend.load) as load:
+            first = self.broker.wait(self.voting.id, 'aggregate', seq, timeout=1)
+            second = self.broker.wait(self.voting.id, 'aggregate', seq, timeout=1)
+
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(first, second)
+        [(event_seq, event, changes)] = first
+        self.assertEqual(event, 'delta')
+        self.assertEqual(event_seq, seq + 1)
+        self.assertEqual(changes, [{'question_id': self.choice.question_id, 'choice_id': self.choice.id,
+                                    'votes_count': 2, 'delta': 2}])
+
+    def test_stream_starts_with_snapshot(self):
+        with mock.patch('surApp.views.get_broker', return_value=self.broker), \
+                mock.patch('surApp.views.connections') as connections:
+            response = self.client.get(reverse('poll-statistic-stream', args=[self.voting.id]))
+            # Соединение запроса отдано до начала потока
+            connections.close_all.assert_called_once_with()
+            chunk = next(response.streaming_content).decode()
+            response.close()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn('event: snapshot\n', chunk)
+        data = json.loads(chunk.split('data: ', 1)[1])
+        self.assertEqual(len(data), 2)
+        self.assertEqual(self.client.get(reverse('poll-statistic-stream', args=[0])).status_code, 404)
+
+
+class GenerateSurveyDataTests(SurveyTestCase):
+    def test_generates_shape_votes_and_tallies(self):
+        call_command('generate_survey_data', pages=2, questions=3, choices=4, votes=60, stdout=StringIO())
+
+        voting = Voting.objects.get()
+        self.assertEqual(voting.pages.count(), 2)
+        self.assertEqual(Question.objects.filter(page__voting=voting).count(), 6)
+        self.assertEqual(Choice.objects.filter(question__page__voting=voting).count(), 24)
+        self.assertEqual(Vote.objects.filter(voting=voting).count(), 60)
+        self.assertEqual(Vote.objects.filter(voting=voting).values('user').distinct().count(), 10)
+        self.assertEqual(verify_tallies(voting.id), {})
+        self.assertEqual(Submission.objects.filter(voting=voting).count(), 10)
+
+
+class RequestInstrumentationTests(SurveyTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='password')
+        self.voting = make_voting(self.user, questions=3, choices=2)
+
+    def test_server_timing_reports_queries(self):
+        response = self.client.get(reverse('poll-statistic', args=[self.voting.id]))
+
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="2 queries"$')
+
+    @override_settings(REQUEST_INSTRUMENTATION={'SLOW_REQUEST_MS': 0, 'REPEATED_QUERY_THRESHOLD': 3})
+    def test_slow_request_log_includes_repeated_queries(self):
+        self.client.force_login(self.user)
+        with self.assertLogs('surApp.middleware', 'WARNING') as logs:
+            self.client.get(reverse('export-voting-json', args=[self.voting.id]))
+
+        [message] = logs.output
+        self.assertIn('Slow request GET', message)
+        self.assertIn('(export-voting-json)', message)
+        self.assertRegex(message, r'Repeated: \d+x SELECT')
+
+    def test_metrics_expose_histograms_and_ingested_votes(self):
+        def ingested():
+            body = self.client.get(reverse('metrics')).content.decode()
+            return int(re.search(r'^votes_ingested_total (\d+)$', body, re.M).group(1)), body
+
+        before, _ = ingested()
+        choice = Choice.objects.filter(question__page__voting=self.voting).first()
+        payload = [{'user': self.user.id, 'question': choice.question_id, 'choice': choice.id}]
+        self.client.post(reverse('do_response', args=[self.voting.id]), payload, content_type='application/json')
+        after, body = ingested()
+
+        self.assertEqual(after - before, 1)
+        self.assertIn('http_request_duration_seconds_bucket{view="do_response",method="POST",le="+Inf"}', body)
+        self.assertIn('# TYPE votes_ingested_per_second gauge', body)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+
+class RequestProfilingTests(SurveyTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(REQUEST_PROFILING={
+            'DIRECTORY': self.directory.name, 'MAX_PROFILES': 2, 'PROFILER': 'cprofile'})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.staff = User.objects.create_user(username='staff', password='password', is_staff=True)
+        self.url = reverse('poll-statistic', args=[make_voting(self.staff).id])
+
+    def test_profiles_only_staff_or_signed_requests(self):
+        self.assertNotIn('X-Profile-Id', self.client.get(self.url, HTTP_X_PROFILE='1'))
+        self.assertNotIn('X-Profile-Id', self.client.get(self.url, HTTP_X_PROFILE_TOKEN='forged'))
+
+        response = self.client.get(self.url, HTTP_X_PROFILE_TOKEN=make_profile_token())
+        self.assertIn('X-Profile-Id', response)
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, HTTP_X_PROFILE='1')
+        profile_id = response['X-Profile-Id']
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, f'{profile_id}.prof')))
+
+        page = self.client.get(reverse('request-profiles'))
+        self.assertContains(page, profile_id)
+        self.assertContains(page, 'cumulative')
+
+    def test_keeps_only_recent_profiles(self):
+        self.client.force_login(self.staff)
+        ids = [self.client.get(self.url, HTTP_X_PROFILE='1')['X-Profile-Id'] for _ in range(3)]
+
+        self.assertEqual(sorted(os.listdir(self.directory.name)),
+                         sorted(f'{profile_id}.{ext}' for profile_id in ids[1:] for ext in ('json', 'prof')))
+
+
+class SurveyImportTests(SurveyTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='password')
+        self.voting = make_voting(self.user, questions=2, choices=3, pages=2)
+        first, second = self.voting.pages.order_by('order')
+        choice = Choice.objects.filter(question__page=first).first()
+        self.voting.question_answer_pairs = json.dumps([[choice.question_id, choice.id]])
+        self.voting.hidden_pages = json.dumps([[second.id]])
+        self.voting.save()
+        self.client.force_login(self.user)
+        self.exported = self.client.get(reverse('export-voting-json', args=[self.voting.id])).content
+
+    def tree(self, voting):
+        return [(page.title, [(question.title, [choice.name for choice in question.choices.order_by('id')])
+                              for question in page.questions.order_by('id')])
+                for page in voting.pages.order_by('order')]
+
+    def test_import_recreates_exported_survey_with_remapped_logic(self):
+        response = self.client.post(reverse('import-voting'), self.exported, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['rows'], 1 + 2 + 4 + 12)
+        imported = Voting.objects.get(id=response.data['imported'][0]['id'])
+        self.assertEqual(imported.author_id, self.user.id)
+        self.assertEqual(self.tree(imported), self.tree(self.voting))
+        first, second = imported.pages.order_by('order')
+        choice = Choice.objects.filter(question__page=first).first()
+        self.assertEqual(json.loads(imported.question_answer_pairs), [[choice.question_id, choice.id]])
+        self.assertEqual(imported.logic_index['hide'], {str(choice.id): [second.id]})
+
+    def test_command_imports_many_surveys_across_chunk_boundaries(self):
+        document = json.loads(self.exported)
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8') as file:
+            json.dump([document, document], file, ensure_ascii=False)
+            file.write('\n')
+            json.dump(document, file, ensure_ascii=False)
+        self.addCleanup(os.unlink, file.name)
+
+        with mock.patch('surApp.survey_import.iter_json_documents.__defaults__', (7,)):
+            output = StringIO()
+            call_command('import_votings', file.name, author='author', stdout=output)
+
+        self.assertEqual(Voting.objects.count(), 4)
+        self.assertIn('строк/с', output.getvalue())
+        for voting in Voting.objects.exclude(id=self.voting.id):
+            self.assertEqual(self.tree(voting), self.tree(self.voting))
+
+    def test_invalid_survey_rolls_back_whole_request(self):
+        document = json.loads(self.exported)
+        broken = {**document, 'pages': [{'title': 'Страница', 'questions': [{'choices': []}]}]}
+        response = self.client.post(reverse('import-voting'), [document, broken], content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('question 0', response.data['error'])
+        self.assertEqual(Voting.objects.count(), 1)
+
+    def test_syntax_error_stops_reading_and_names_page(self):
+        stream = BytesIO(b'{"title": "a", "pages": tru}\n' + b'{"title": "b"}\n' * 10000)
+        with self.assertRaisesMessage(SurveyImportError, 'Invalid JSON'):
+            list(iter_json_documents(stream, chunk_size=64))
+        self.assertLess(stream.tell(), 1024)
+
+        document = json.loads(self.exported)
+        document['pages'][0]['title'] = 'x' * 1000
+        response = self.client.post(reverse('import-voting'), document, content_type='application/json')
+        self.assertTrue(response.data['error'].startswith('page 0: "title"'))
+
+
+class VoteImportTests(SurveyTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='password')
+        self.voting = make_voting(self.user, questions=2, choices=2)
+        for choice in Choice.objects.filter(question__page__voting=self.voting):
+            Vote.objects.create(user=self.user, voting=self.voting, question=choice.question, choice=choice)
+        rebuild_tallies(self.voting.id)
+        self.client.force_login(self.user)
+        self.url = reverse('import-votes', args=[self.voting.id])
+
+    def exported(self, stream):
+        response = self.client.get(reverse('export-votes', args=[self.voting.id]), {'stream': stream})
+        return b''.join(response.streaming_content)
+
+    def test_csv_round_trip_reports_bad_rows(self):
+        other = make_voting(self.user, questions=1, choices=1)
+        foreign = Choice.objects.get(question__page__voting=other)
+        choice = Choice.objects.filter(question__page__voting=self.voting).first()
+        content = self.exported('csv') + (
+            f'ghost,{choice.question_id},,{choice.id},\r\n'
+            f'author,{foreign.question_id},,{foreign.id},\r\n'
+            f'author,{choice.question_id},,x,\r\n'
+        ).encode('utf-8')
+        upload = BytesIO(content)
+        upload.name = 'votes.csv'
+
+        response = self.client.post(self.url, {'file': upload})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['imported'], response.data['rejected']), (4, 3))
+        self.assertEqual([error['row'] for error in response.data['errors']], [6, 7, 8])
+        self.assertEqual(response.data['errors'][0]['error'], 'User not found')
+        self.assertEqual(Vote.objects.filter(voting=self.voting).count(), 8)
+        self.assertEqual(verify_tallies(self.voting.id), {})
+
+    def test_only_author_can_import(self):
+        User.objects.create_user(username='stranger', password='password')
+        self.client.login(username='stranger', password='password')
+        upload = BytesIO(self.exported('csv'))
+        upload.name = 'votes.csv'
+
+        self.assertEqual(self.client.post(self.url, {'file': upload}).status_code, 403)
+
+    def test_command_imports_xlsx_in_chunks(self):
+        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as file:
+            file.write(self.exported('xlsx'))
+        self.addCleanup(os.unlink, file.name)
+
+        output = StringIO()
+        call_command('import_votes', file.name, voting=self.voting.id, chunk_size=3, stdout=output)
+
+        self.assertIn('Загружено голосов: 4', output.getvalue())
+        self.assertEqual(Vote.objects.filter(voting=self.voting).count(), 8)
+        self.assertEqual(verify_tallies(self.voting.id), {})
+        self.assertEqual(len(Submission.objects.get(voting=self.voting).choice_ids), 4)
+
+    def test_endpoint_failure_keeps_no_partial_import(self):
+        upload = BytesIO(self.exported('csv'))
+        upload.name = 'votes.csv'
+        import_chunk = VoteImporter.import_chunk
+
+        def import_and_fail(importer, numbered_rows, columns):
+            import_chunk(importer, numbered_rows, columns)
+            raise VoteImportError('Invalid CSV: broken row')
+        with mock.patch.object(VoteImporter, 'import_chunk', import_and_fail):
+            response = self.client.post(self.url, {'file': upload})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Vote.objects.filter(voting=self.voting).count(), 4)
+
+    def test_command_resumes_from_reported_row(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as file:
+            file.write(self.exported('csv'))
+        self.addCleanup(os.unlink, file.name)
+
+        import_chunk = VoteImporter.import_chunk
+
+        def import_first_chunk(importer, numbered_rows, columns):
+            if importer.last_row > 1:
+                raise DatabaseError('connection lost')
+            import_chunk(importer, numbered_rows, columns)
+        with mock.patch.object(VoteImporter, 'import_chunk', import_first_chunk), \
+                self.assertRaisesMessage(CommandError, '--start-row 5'):
+            call_command('import_votes', file.name, voting=self.voting.id, chunk_size=3, stdout=StringIO())
+        call_command('import_votes', file.name, voting=self.voting.id, chunk_size=3, start_row=5, stdout=StringIO())
+
+        self.assertEqual(Vote.objects.filter(voting=self.voting).count(), 8)
+        self.assertEqual(verify_tallies(self.voting.id), {})
+
+
+class SubmissionTests(SurveyTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='password')
+        self.voter = User.objects.create_user(username='voter', password='password')
+        self.voting = make_voting(self.author, questions=3, choices=2)
+        self.choices = list(Choice.objects.filter(question__page__voting=self.voting).order_by('id'))
+
+    def submit(self, user, choices):
+        payload = [{'user': user.id, 'question': c.question_id, 'choice': c.id} for c in choices]
+        return self.client.post(reverse('do_response', args=[self.voting.id]), payload, content_type='application/json')
+
+    def test_each_call_creates_compact_submission(self):
+        self.submit(self.voter, self.choices[::2])
+        self.submit(self.voter, self.choices[1:2])
+        self.submit(self.author, self.choices[:1])
+
+        submission = Submission.objects.filter(respondent=self.voter).order_by('id').first()
+        self.assertEqual(submission.choice_ids, [c.id for c in self.choices[::2]])
+        self.assertEqual(len(bytes(submission.choices)), 12)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('poll-respondents', args=[self.voting.id]))
+        self.assertEqual(response.data, {'voting_id': self.voting.id, 'respondents': 2, 'submissions': 3})
+
+    def test_answers_visible_to_author_and_respondent_only(self):
+        self.submit(self.voter, self.choices[:1])
+        url = reverse('respondent-answers', args=[self.voting.id, self.voter.id])
+        stranger = User.objects.create_user(username='stranger', password='password')
+
+        self.client.force_login(stranger)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        for user in (self.author, self.voter):
+            self.client.force_login(user)
+            response = self.client.get(url)
+            self.assertEqual([item['choices'] for item in response.data], [[self.choices[0].id]])
+
+    def test_backfill_groups_existing_votes_by_respondent(self):
+        for choice in self.choices[:3]:
+            Vote.objects.create(user=self.voter, voting=self.voting, question=choice.question, choice=choice)
+        self.submit(self.author, self.choices[:1])
+        # Новая отправка того же респондента не должна скрывать его старые голоса
+        self.submit(self.voter, self.choices[:1])
+
+        call_command('backfill_submissions', stdout=StringIO())
+        call_command('backfill_submissions', stdout=StringIO())
+
+        submissions = Submission.objects.filter(respondent=self.voter).order_by('id')
+        self.assertEqual([s.choice_ids for s in submissions],
+                         [[self.choices[0].id], [c.id for c in self.choices[:3]]])
+        self.assertEqual(Submission.objects.count(), 3)
+
+
+class ColumnarSnapshotTests(SurveyTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='password')
+        self.voting = make_voting(self.user, questions=2, choices=3)
+        self.choices = list(Choice.objects.filter(question__page__voting=self.voting).order_by('id'))
+        self.voters = [User.objects.create_user(username=f'voter{index}') for index in range(3)]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(COLUMNAR_SNAPSHOTS={'DIRECTORY': directory.name})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.url = reverse('poll-statistic', args=[self.voting.id])
+
+    def vote(self, voter, choices):
+        for choice in choices:
+            Vote.objects.create(user=voter, voting=self.voting, question=choice.question, choice=choice)
+
+    def counts(self, source):
+        cache.clear()
+        response = self.client.get(f'{self.url}?source={source}')
+        return {c['choice_id']: c['votes_count'] for q in response.data for c in q['choices']}
+
+    def test_snapshot_plus_delta_matches_aggregate(self):
+        self.vote(self.voters[0], self.choices[:1] + self.choices[3:4])
+        self.vote(self.voters[1], self.choices[1:2] + self.choices[3:4])
+        self.assertEqual(self.counts('columnar'), self.counts('aggregate'))
+
+        call_command('compact_votes', batch_size=3, stdout=StringIO())
+        self.vote(self.voters[2], self.choices[:1] + self.choices[5:6])
+
+        self.assertEqual(self.counts('columnar'), self.counts('aggregate'))
+        self.assertEqual(self.counts('columnar')[self.choices[0].id], 2)
+        manifest = get_snapshot(self.voting.id).manifest
+        self.assertEqual((manifest['votes'], len(manifest['parts'])), (4, 2))
+
+    def test_incremental_compaction_appends_only_new_votes(self):
+        self.vote(self.voters[0], self.choices[:2])
+        self.assertEqual(compact_votes(self.voting.id), 2)
+        self.vote(self.voters[1], self.choices[2:3])
+        self.vote(self.voters[0], self.choices[3:4])
+        self.assertEqual(compact_votes(self.voting.id), 2)
+        self.assertEqual(compact_votes(self.voting.id), 0)
+
+        snapshot = get_snapshot(self.voting.id)
+        respondents = np.concatenate([part['respondent'] for part in snapshot.parts()])
+        self.assertEqual(respondents.tolist(), [0, 0, 1, 0])
+        with self.assertNumQueries(3):
+            self.client.get(f'{self.url}?source=columnar')
+
+    def test_late_committed_lower_id_is_not_skipped(self):
+        self.vote(self.voters[0], self.choices[:1])
+        first = Vote.objects.get()
+        Vote.objects.create(id=first.id + 10, user=self.voters[1], voting=self.voting,
+                            question=self.choices[3].question, choice=self.choices[3])
+        compact_votes(self.voting.id)
+        # Транзакция с меньшим id зафиксирована уже после сжатия
+        Vote.objects.create(id=first.id + 5, user=self.voters[2], voting=self.voting,
+                            question=self.choices[4].question, choice=self.choices[4])
+
+        self.assertEqual(self.counts('columnar'), self.counts('aggregate'))
+        self.assertEqual(compact_votes(self.voting.id), 1)
+        self.assertEqual(compact_votes(self.voting.id), 0)
+        self.assertEqual(get_snapshot(self.voting.id).manifest['votes'], 3)
+        self.assertEqual(self.counts('columnar'), self.counts('aggregate'))
+
+    def test_deleted_votes_flag_snapshot_until_recompacted(self):
+        self.vote(self.voters[0], self.choices[:2])
+        compact_votes(self.voting.id)
+        self.voters[0].delete()
+
+        self.assertEqual(get_snapshot(self.voting.id).manifest['parts'], [])
+        self.assertEqual(self.counts('columnar'), self.counts('aggregate'))
+        self.vote(self.voters[1], self.choices[:1])
+        self.assertEqual(compact_votes(self.voting.id), 1)
+        self.assertEqual(get_snapshot(self.voting.id).manifest['votes'], 1)
+
+    def test_removed_choice_votes_are_deleted_in_one_query_and_flag_snapshot(self):
+        self.vote(self.voters[0], self.choices[:2])
+        for voter in self.voters:
+            self.vote(voter, self.choices[2:3])
+        compact_votes(self.voting.id)
+
+        def remove_choice(choice):
+            data = VotingSerializer(self.voting).data
+            for question in data['pages'][0]['questions']:
+                question['choices'] = [c for c in question['choices'] if c['id'] != choice.id]
+            serializer = VotingSerializer(self.voting, data=data)
+            serializer.is_valid(raise_exception=True)
+            with CaptureQueriesContext(connection) as queries:
+                serializer.save()
+            # Голоса не читаются построчно: один DELETE по вариантам
+            return [query['sql'].split()[0] for query in queries if '"surApp_vote"' in query['sql']]
+
+        self.assertEqual(remove_choice(self.choices[1]), ['DELETE'])
+        self.assertEqual(get_snapshot(self.voting.id).manifest['parts'], [])
+        compact_votes(self.voting.id)
+        self.assertEqual(remove_choice(self.choices[2]), ['DELETE'])
+        self.assertEqual(get_snapshot(self.voting.id).manifest['parts'], [])
+        self.assertEqual(self.counts('columnar'), self.counts('aggregate'))
+
+    def test_rebuild_drops_deleted_votes(self):
+        self.vote(self.voters[0], self.choices[:2])
+        compact_votes(self.voting.id)
+        Vote.objects.filter(choice=self.choices[0]).delete()
+
+        compact_votes(self.voting.id, rebuild=True)
+
+        self.assertEqual(get_snapshot(self.voting.id).manifest['votes'], 1)
+        self.assertEqual(self.counts('columnar'), self.counts('aggregate'))
+
+
+class PollCrosstabTests(SurveyTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='password')
+        self.voting = make_voting(self.author, questions=2, choices=2)
+        (self.q1a, self.q1b), (self.q2a, self.q2b) = [
+            list(question.choices.order_by('id')) for question in Question.objects.filter(
+                page__voting=self.voting).order_by('id')]
+        answers = [(self.q1a, self.q2a), (self.q1a, self.q2b), (self.q1a, self.q2a), (self.q1b, self.q2b)]
+        for index, choices in enumerate(answers):
+            voter = User.objects.create_user(username=f'voter{index}')
+            for choice in choices:
+                Vote.objects.create(user=voter, voting=self.voting, question=choice.question, choice=choice)
+        self.client.force_login(self.author)
+        self.url = reverse('poll-crosstab', args=[self.voting.id])
+        self.table = f'{self.url}?rows={self.q1a.question_id}&columns={self.q2a.question_id}'
+
+    def test_filtered_counts_and_crosstab(self):
+        response = self.client.get(f'{self.table}&choice={self.q1a.id}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['respondents'], response.data['filtered_respondents']), (4, 3))
+        counts = {c['choice_id']: c['votes_count'] for q in response.data['results'] for c in q['choices']}
+        self.assertEqual(counts, {self.q1a.id: 3, self.q1b.id: 0, self.q2a.id: 2, self.q2b.id: 1})
+        self.assertEqual(response.data['crosstab'], {
+            'rows': [self.q1a.id, self.q1b.id], 'columns': [self.q2a.id, self.q2b.id],
+            'counts': [[2, 1], [0, 0]],
+        })
+
+    def test_matrix_is_reused_until_poll_version_changes(self):
+        self.client.get(self.table)
+        with mock.patch('surApp.crosstab.build_matrix') as build:
+            response = self.client.get(f'{self.table}&choice={self.q2b.id}')
+        build.assert_not_called()
+        self.assertEqual(response.data['filtered_respondents'], 2)
+
+        bump_version(self.voting.id)
+        with mock.patch('surApp.crosstab.build_matrix', wraps=build_matrix) as build:
+            self.client.get(self.table)
+        build.assert_called_once()
+
+    def test_matrix_from_columnar_snapshot_matches_database(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(COLUMNAR_SNAPSHOTS={'DIRECTORY': directory.name}):
+            before = self.client.get(self.table).data
+            compact_votes(self.voting.id, batch_size=3)
+            matrix_cache.clear()
+            self.assertEqual(self.client.get(self.table).data, before)
+
+    def test_rejects_bad_parameters_and_other_users(self):
+        other = make_voting(self.author, questions=1, choices=1)
+        foreign = Choice.objects.get(question__page__voting=other)
+        self.assertEqual(self.client.get(f'{self.table}&choice={foreign.id}').status_code, 400)
+        self.assertEqual(self.client.get(f'{self.table}&choice=x').status_code, 400)
+
+        self.assertEqual(self.client.get(f'{self.url}?rows={self.q1a.question_id}').status_code, 400)
+        with override_settings(CROSSTAB={'MAX_CELLS': 3}):
+            self.assertEqual(self.client.get(self.table).status_code, 400)
+
+        self.client.force_login(User.objects.get(username='voter0'))
+        self.assertEqual(self.client.get(self.table).status_code, 403)
+
+
+class BoundedConnectionPoolTests(TestCase):
+    def test_waits_for_free_connection_instead_of_failing(self):
+        from psycopg2 import OperationalError
+        from surService.db_backends.postgresql_pool.base import BoundedConnectionPool
+
+        with mock.patch('psycopg2.pool.ThreadedConnectionPool') as threaded_pool:
+            connection_pool = BoundedConnectionPool(1, 1, 0.05, dbname='surservice')
+        threaded_pool.return_value.getconn.return_value = mock.MagicMock(closed=0)
+        connection = connection_pool.getconn()
+        with self.assertRaises(OperationalError):
+            connection_pool.getconn()
+
+        connection_pool.putconn(connection)
+        connection_pool.getconn()
+        self.assertEqual(threaded_pool.return_value.getconn.call_count, 2)
+
+    def test_discards_connections_closed_by_server(self):
+        from psycopg2 import OperationalError
+        from surService.db_backends.postgresql_pool.base import BoundedConnectionPool
+
+        closed = mock.Mock(closed=2)
+        broken = mock.Mock(closed=0)
+        broken.cursor.return_value.__enter__ = mock.Mock(side_effect=OperationalError('server closed the connection'))
+        broken.cursor.return_value.__exit__ = mock.Mock(return_value=False)
+        healthy = mock.MagicMock(closed=0)
+        with mock.patch('psycopg2.pool.ThreadedConnectionPool') as threaded_pool:
+            connection_pool = BoundedConnectionPool(1, 2, 0.05, dbname='surservice')
+        threaded_pool.return_value.getconn.side_effect = [closed, broken, healthy]
+
+        self.assertIs(connection_pool.getconn(), healthy)
+        threaded_pool.return_value.putconn.assert_has_calls([mock.call(closed, close=True),
+                                                             mock.call(broken, close=True)])
+        healthy.cursor.return_value.__enter__.return_value.execute.assert_called_once_with('SELECT 1')
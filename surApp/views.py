@@ -1,21 +1,74 @@
 import io
 import pandas as pd
 import json
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse, FileResponse
+from django.utils.http import parse_etags
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.parsers import MultiPartParser
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.tokens import RefreshToken
+from surService.routers import choose_read_database, read_database
 
+from .async_views import AsyncDispatchMixin, is_asgi, run_sync
+from .authentication import blacklist_cache, issue_tokens
 from .models import *
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from .serializers import *
+from .crosstab import CrosstabError, crosstab, parse_ids
+from .exports import iter_csv, iter_vote_rows, spool_to_file, write_xlsx
+from .instrumentation import metrics, record_votes_ingested
+from .live import get_broker, iter_live_results
+from .logic import LogicError, compile_logic, dump_rules, next_visible_page, recompile_logic
+from .pagination import IdCursorPagination
+from .results_cache import cached_results
+from .snapshots import get_snapshot, refresh_snapshot
+from .spool import get_vote_spool
+from .submissions import respondent_submissions, submission_counts
+from .survey_import import SurveyImportError, import_surveys
+from .vote_import import READERS, VoteImportError, VoteImporter, detect_format
+from .statistics import STATISTICS_SOURCES, requested_source
 from rest_framework.generics import ListAPIView, CreateAPIView, RetrieveUpdateAPIView, DestroyAPIView, GenericAPIView, \
     RetrieveAPIView, UpdateAPIView
 from django.http import Http404, JsonResponse
 
 
+class ReplicaReadMixin:
+    # Аналитические представления читают с реплики (если она настроена), кроме окна read-your-writes.
+    # Для потоковых ответов запросы привязываются к self.read_database явно через .using()
+    read_database = 'default'
+    read_database_context = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.read_database = choose_read_database(request.user.id)
+        self.read_database_context = read_database(self.read_database)
+        self.read_database_context.__enter__()
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.read_database_context is not None:
+                self.read_database_context.__exit__(None, None, None)
+                self.read_database_context = None
+
+
+def streaming_response(request, chunks, content_type):
+    # Генераторы с запросами к базе нельзя отдавать StreamingHttpResponse под ASGI (Django 3.2 перебирает
+    # их в цикле событий): там ответ сначала собирается во временный файл
+    if is_asgi(request):
+        return FileResponse(spool_to_file(chunks), content_type=content_type)
+    return StreamingHttpResponse(chunks, content_type=content_type)
+
+
 class HomeView(APIView):
     def get(self, request, *args, **kwargs):
         if request.user.is_authenticated:
@@ -24,15 +77,38 @@ class HomeView(APIView):
             return Response({"message": "Войти"}, status=status.HTTP_200_OK)
 
 
+def count_subquery(queryset, group_by, expression):
+    # Коррелированный подзапрос "сколько строк у этого опроса" для аннотации списка опросов
+    counts = queryset.order_by().values(group_by).annotate(total=expression).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
 class VotingListByUserAPIView(ListAPIView):
-    serializer_class = VotingSerializer
+    # По умолчанию - краткий список со счетчиками одним запросом; ?expand=1 отдает полное дерево
+    serializer_class = VotingSummarySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = IdCursorPagination
+
+    def is_expanded(self):
+        return self.request.query_params.get('expand') in ('1', 'true')
+
+    def get_serializer_class(self):
+        return VotingSerializer if self.is_expanded() else VotingSummarySerializer
 
     def get_queryset(self):
         user_id = self.kwargs['user_id']
         if user_id != self.request.user.id:
             raise Http404("Страница не найдена")
-        return Voting.objects.filter(author=user_id)
+        votings = Voting.objects.filter(author=user_id)
+        if self.is_expanded():
+            return votings.prefetch_related('pages__questions__choices')
+        return votings.annotate(
+            page_count=count_subquery(Page.objects.filter(voting=OuterRef('pk')), 'voting', Count('id')),
+            question_count=count_subquery(
+                Question.objects.filter(page__voting=OuterRef('pk')), 'page__voting', Count('id')),
+            response_count=count_subquery(
+                Vote.objects.filter(voting=OuterRef('pk')), 'voting', Count('user', distinct=True)),
+        )
 
 
 class VotingCreateAPIView(CreateAPIView):
@@ -41,7 +117,8 @@ class VotingCreateAPIView(CreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        # Только id: в stateless-режиме request.user - TokenUser, а не объект User
+        serializer.save(author_id=self.request.user.id)
 
 
 class VotingUpdateAPIView(RetrieveUpdateAPIView):
@@ -51,7 +128,7 @@ class VotingUpdateAPIView(RetrieveUpdateAPIView):
 
     def perform_update(self, serializer):
         # Проверяем, что текущий пользователь является автором опроса
-        if serializer.instance.author != self.request.user:
+        if serializer.instance.author_id != self.request.user.id:
             raise PermissionDenied("You do not have permission to perform this action.")
         serializer.save()
 
@@ -62,7 +139,7 @@ class VotingDeleteAPIView(DestroyAPIView):
 
     def perform_destroy(self, instance):
         # Проверяем, что текущий пользователь является автором опроса
-        if instance.author != self.request.user:
+        if instance.author_id != self.request.user.id:
             raise PermissionDenied("You do not have permission to delete this voting.")
         instance.delete()
 
@@ -79,7 +156,7 @@ class UserLoginAPIView(GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data
-        refresh = RefreshToken.for_user(user)
+        refresh = issue_tokens(user)
 
         return Response({
             'refresh': str(refresh),
@@ -101,6 +178,7 @@ class LogoutAPIView(APIView):
             # Удаление токена из черного списка
             token = RefreshToken(refresh_token)
             token.blacklist()
+            blacklist_cache.delete(token[jwt_settings.JTI_CLAIM])
 
             return Response({'detail': 'Вы успешно вышли из учетной записи.'}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -110,82 +188,205 @@ class LogoutAPIView(APIView):
 class VotingDetailView(RetrieveAPIView):
     serializer_class = VotingSerializer
     queryset = Voting.objects.all()
+    # Анкета отдается анонимным респондентам, проверка токена (и запрос User) не нужна
+    authentication_classes = []
 
-    def get_object(self):
+    def get(self, request, *args, **kwargs):
+        # Отдаем заранее собранный снимок: без запросов к базе, с ETag для ответа 304
         voting_id = self.kwargs.get('pk')
-        return get_object_or_404(self.get_queryset(), pk=voting_id)
+        try:
+            snapshot = get_snapshot(voting_id)
+        except Voting.DoesNotExist:
+            raise Http404("Страница не найдена")
 
-    def get(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        etags = parse_etags(request.headers.get('If-None-Match', ''))
+        if snapshot['etag'] in etags or '*' in etags:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(snapshot['body'], content_type='application/json')
+        response['ETag'] = snapshot['etag']
+        response['Cache-Control'] = getattr(settings, 'VOTING_SNAPSHOT_CACHE_CONTROL', 'public, no-cache')
+        return response
+
+
+def accept_votes(voting_id, data, context):
+    # Возвращает (данные ответа, код статуса)
+    voting = get_object_or_404(Voting, pk=voting_id)
+    if not voting.pages.exists():
+        return {"error": "No pages found for this voting"}, status.HTTP_400_BAD_REQUEST
 
+    # Принадлежность всех вопросов опросу и вариантов вопросам проверяется одним запросом
+    serializer = BulkVoteSerializer(data=data, context={**context, 'voting': voting})
+    if not serializer.is_valid():
+        errors = serializer.errors
+        # Ошибки принадлежности - в прежнем виде {"error": "<текст>"}, ошибки полей - как их отдает DRF
+        if isinstance(errors, dict) and 'error' in errors:
+            errors = {"error": errors['error'][0]}
+        return errors, status.HTTP_400_BAD_REQUEST
 
-class VoteBulkCreateView(CreateAPIView):
+    if getattr(settings, 'VOTE_INGESTION_MODE', 'sync') == 'spool':
+        # Голоса попадут в Vote позже, через manage.py drain_vote_spool
+        get_vote_spool().append(voting.id, serializer.validated_data)
+        record_votes_ingested(len(serializer.validated_data))
+        return serializer.data, status.HTTP_202_ACCEPTED
+
+    # Один bulk_create и обновление ChoiceTally в одной транзакции
+    serializer.save()
+    record_votes_ingested(len(serializer.validated_data))
+    return serializer.data, status.HTTP_201_CREATED
+
+
+class VoteBulkCreateView(AsyncDispatchMixin, CreateAPIView):
     queryset = Voting.objects.all()
-    serializer_class = VoteSerializer
+    serializer_class = VoteSubmissionSerializer
 
-    def post(self, request, *args, **kwargs):
-        voting_id = self.kwargs.get('pk')
-        voting = get_object_or_404(Voting, pk=voting_id)
-        pages = voting.pages.all()
-        if not pages:
-            return Response({"error": "No pages found for this voting"}, status=status.HTTP_400_BAD_REQUEST)
+    async def post(self, request, *args, **kwargs):
+        data, status_code = await run_sync(request, self.submit, request)
+        return Response(data, status=status_code)
 
-        serializer = self.get_serializer(data=request.data, many=True)
-        serializer.is_valid(raise_exception=True)
+    def submit(self, request):
+        # Разбор тела тоже в потоке: большие отправки не держат цикл событий
+        return accept_votes(self.kwargs.get('pk'), request.data, self.get_serializer_context())
 
-        # Проверяем, принадлежат ли все вопросы к определенным страницам опроса
-        for vote_data in serializer.validated_data:
-            question_id = vote_data['question']
-            question = get_object_or_404(Question, pk=question_id.id)
-            if question.page.voting != voting:
-                return Response({"error": "Question does not belong to the specified voting"},
-                                status=status.HTTP_400_BAD_REQUEST)
 
-        self.perform_create(serializer)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+class MetricsView(APIView):
+    # Метрики процесса для Prometheus. Если задан METRICS_TOKEN, нужен заголовок Authorization: Bearer <токен>
+    authentication_classes = []
 
-    def perform_create(self, serializer):
-        serializer.save()
+    def get(self, request, *args, **kwargs):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        if token and request.headers.get('Authorization', '') != f'Bearer {token}':
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+        gauges = []
+        if getattr(settings, 'VOTE_INGESTION_MODE', 'sync') == 'spool':
+            gauges.append(('vote_spool_depth', 'Голоса в журнале, ожидающие переноса в Vote',
+                           get_vote_spool().depth()['votes']))
+        return HttpResponse(metrics.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
-class DetailStatisticAPIView(RetrieveAPIView):
+class VoteSpoolStatusView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_vote_spool().depth())
+
+
+def iter_ndjson_votes(votes):
+    # Голоса строками JSON без сериализатора: только целые числа из values_list
+    rows = votes.order_by('id').values_list('user_id', 'question_id', 'choice_id').iterator(chunk_size=5000)
+    for user_id, question_id, choice_id in rows:
+        yield f'{{"user": {user_id}, "question": {question_id}, "choice": {choice_id}}}\n'
+
+
+class DetailStatisticAPIView(ReplicaReadMixin, RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = VoteSerializer
     queryset = Vote.objects.all()
+    pagination_class = IdCursorPagination
 
     def get(self, request, *args, **kwargs):
         voting_id = self.kwargs.get('pk')
-        votes = Vote.objects.filter(question__page__voting_id=voting_id)  # Фильтруем по идентификатору опроса
-        serializer = self.get_serializer(votes, many=True)
-        return Response(serializer.data)
+        votes = Vote.objects.using(self.read_database).filter(voting_id=voting_id)  # Фильтруем по идентификатору опроса
+
+        # ?stream=ndjson: все голоса потоком, память сервера не зависит от размера опроса
+        if request.query_params.get('stream') == 'ndjson':
+            return streaming_response(request, iter_ndjson_votes(votes), 'application/x-ndjson')
+
+        # Иначе страницы по курсору id (?cursor=..., ?page_size=...)
+        page = self.paginate_queryset(votes)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+def poll_results(poll_id, query_params):
+    # Возвращает (данные ответа, код статуса)
+    source = requested_source(query_params)
+    if source not in STATISTICS_SOURCES:
+        return {"error": f"Unknown statistics source: {source}"}, status.HTTP_400_BAD_REQUEST
+    # Результат кешируется по версии опроса; версия меняется с каждой принятой отправкой голосов
+    return cached_results(poll_id, source, STATISTICS_SOURCES[source]), status.HTTP_200_OK
 
 
-class PollDetailAPIView(APIView):
+class PollDetailAPIView(AsyncDispatchMixin, APIView):
+    async def get(self, request, poll_id, format=None):
+        data, status_code = await run_sync(request, self.results, request.user.id, poll_id, request.query_params)
+        return Response(data, status=status_code)
+
+    def results(self, user_id, poll_id, query_params):
+        # Как ReplicaReadMixin, но выбор реплики действует только в потоке с запросами
+        with read_database(choose_read_database(user_id)):
+            return poll_results(poll_id, query_params)
+
+
+class PollRespondentsView(ReplicaReadMixin, APIView):
+    # Число респондентов и отправок опроса по индексу Submission, без подсчета по Vote
     def get(self, request, poll_id, format=None):
-        questions = Question.objects.filter(page__voting_id=poll_id)
-        data = []
-        for question in questions:
-            question_data = {
-                'question_id': question.id,
-                'question_title': question.title,
-                'question_type': question.type,
-                'choices': []
-            }
-            choices = Choice.objects.filter(question_id=question.id)
-            for choice in choices:
-                votes_count = Vote.objects.filter(choice_id=choice.id).count()
-                choice_data = {
-                    'choice_id': choice.id,
-                    'choice_title': choice.name,
-                    'votes_count': votes_count
-                }
-                question_data['choices'].append(choice_data)
-            data.append(question_data)
+        voting = get_object_or_404(Voting, id=poll_id)
+        return Response({'voting_id': voting.id, **submission_counts(voting.id)})
+
+
+class RespondentAnswersView(ReplicaReadMixin, APIView):
+    # Отправки одного респондента: видны автору опроса и самому респонденту
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, poll_id, user_id, format=None):
+        voting = get_object_or_404(Voting, id=poll_id)
+        if request.user.id not in (voting.author_id, user_id):
+            raise PermissionDenied("You do not have permission to view these answers.")
+        return Response(respondent_submissions(voting.id, user_id))
+
+
+class PollCrosstabView(APIView):
+    # Отфильтрованные результаты и таблица вариант x вариант для автора опроса:
+    # ?choice=<id> (повторяется) - только респонденты, выбравшие эти варианты,
+    # ?rows=<question_id> и ?columns=<question_id> (обязательны, повторяются) - вопросы строк и столбцов.
+    # Матрица кешируется под версией опроса, поэтому строится по основной базе, а не по отстающей реплике
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, poll_id, format=None):
+        voting = get_object_or_404(Voting, id=poll_id)
+        if voting.author_id != request.user.id:
+            raise PermissionDenied("You do not have permission to view this voting crosstab.")
+        try:
+            data = crosstab(
+                voting.id,
+                parse_ids(request.query_params.getlist('choice'), 'choice'),
+                parse_ids(request.query_params.getlist('rows'), 'rows'),
+                parse_ids(request.query_params.getlist('columns'), 'columns'),
+            )
+        except CrosstabError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
         return Response(data)
 
 
+class PollStatisticStreamView(APIView):
+    # Server-Sent Events: результаты опроса целиком, затем изменения счетчиков, собранные за LIVE_RESULTS['INTERVAL'].
+    # Подсчет выполняется один раз на процесс для всех подключенных зрителей (surApp/live.py).
+    # Поток держит поток воркера и ждет изменений блокирующе, поэтому работает только через WSGI
+    # с потоковым воркером (gunicorn gthread/gevent); под ASGI Django 3.2 выполнил бы его в цикле событий
+    def get(self, request, poll_id, format=None):
+        if is_asgi(request):
+            return Response({"error": "Live results stream is served only by WSGI workers"},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+        source = requested_source(request.query_params)
+        if source not in STATISTICS_SOURCES:
+            return Response({"error": f"Unknown statistics source: {source}"}, status=status.HTTP_400_BAD_REQUEST)
+        if not Voting.objects.filter(id=poll_id).exists():
+            raise Http404("Страница не найдена")
+
+        last_event_id = request.headers.get('Last-Event-ID', '')
+        last_event_id = int(last_event_id) if last_event_id.isdigit() else None
+        # request_finished закроет соединение только после конца потока (до LIVE_RESULTS['MAX_AGE']):
+        # с пулом соединений зрители заняли бы его целиком. Освобождаем сразу, брокер откроет свое при пересчете
+        connections.close_all()
+        response = StreamingHttpResponse(
+            iter_live_results(get_broker(), poll_id, source, last_event_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Отключаем буферизацию ответа в nginx, иначе события приходят пачками
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
 class VotingUpdateLogicView(UpdateAPIView):
     queryset = Voting.objects.all()
     serializer_class = VotingSerializer
@@ -194,17 +395,50 @@ class VotingUpdateLogicView(UpdateAPIView):
     # Переопределение метода partial_update для обновления только указанных полей
     def partial_update(self, request, *args, **kwargs):
         instance = self.get_object()  # Получаем объект Voting для обновления
+        if not isinstance(request.data, dict):
+            return Response({"error": "Request body must be a JSON object"}, status=status.HTTP_400_BAD_REQUEST)
         # Обновляем только указанные поля, если они присутствуют в запросе
-        if 'question_answer_pairs' in request.data:
-            instance.question_answer_pairs = request.data['question_answer_pairs']
-        if 'hidden_pages' in request.data:
-            instance.hidden_pages = request.data['hidden_pages']
+        question_answer_pairs = request.data.get('question_answer_pairs', instance.question_answer_pairs)
+        hidden_pages = request.data.get('hidden_pages', instance.hidden_pages)
+        # Проверяем правила по id вопросов, вариантов и страниц опроса и компилируем индекс переходов
+        try:
+            instance.logic_index = compile_logic(instance, question_answer_pairs, hidden_pages)
+        except LogicError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        instance.question_answer_pairs = dump_rules(question_answer_pairs)
+        instance.hidden_pages = dump_rules(hidden_pages)
         # Сохраняем изменения
         instance.save()
         # Возвращаем успешный ответ
         return Response(self.get_serializer(instance).data, status=status.HTTP_200_OK)
 
 
+class NextPageView(APIView):
+    # Следующая видимая страница по скомпилированной логике опроса:
+    # {"page": <id текущей страницы или null>, "choices": [<id выбранных вариантов>]}
+    authentication_classes = []
+
+    def post(self, request, pk, *args, **kwargs):
+        index = Voting.objects.filter(pk=pk).values_list('logic_index', flat=True).first()
+        if index is None:
+            raise Http404("Страница не найдена")
+        if not index:
+            # Опрос создан до появления индекса: компилируем один раз
+            voting = Voting.objects.get(pk=pk)
+            recompile_logic(voting)
+            index = voting.logic_index
+        if not isinstance(request.data, dict):
+            return Response({"error": "Request body must be a JSON object"}, status=status.HTTP_400_BAD_REQUEST)
+        choices = request.data.get('choices', [])
+        if not isinstance(choices, list):
+            return Response({"error": "choices must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            next_page, hidden = next_visible_page(index, request.data.get('page'), choices)
+        except LogicError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'next_page': next_page, 'hidden_pages': sorted(hidden)})
+
+
 class VotingUpdateSubmitView(UpdateAPIView):
     queryset = Voting.objects.all()
     serializer_class = VotingSerializer
@@ -217,6 +451,8 @@ class VotingUpdateSubmitView(UpdateAPIView):
         if 'is_submit' in request.data:
             instance.is_submit = request.data['is_submit']
         instance.save()
+        # Публикация: снимок для респондентов собирается сразу, а не на первом запросе
+        refresh_snapshot(instance.id)
         # Возвращаем успешный ответ
         return Response(self.get_serializer(instance).data, status=status.HTTP_200_OK)
 
@@ -227,12 +463,18 @@ class ValidateTokenView(APIView):
         return Response({'detail': 'Token is valid.'})
 
 
-class ExportVotesToExcelView(APIView):
+class ExportVotesToExcelView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, voting_id, *args, **kwargs):
         voting = get_object_or_404(Voting, id=voting_id)
-        votes = Vote.objects.filter(question__page__voting_id=voting_id).select_related('question', 'choice', 'user')
+
+        # ?stream=csv|xlsx: потоковая выгрузка пачками по id, память не зависит от числа голосов
+        stream = request.query_params.get('stream')
+        if stream:
+            return self.stream_export(stream, voting_id)
+
+        votes = Vote.objects.filter(voting_id=voting_id).select_related('question', 'choice', 'user')
 
         # Собираем данные для экспорта
         data = []
@@ -258,8 +500,23 @@ class ExportVotesToExcelView(APIView):
 
         return response
 
-
-class ExportVotingToJsonFileView(APIView):
+    def stream_export(self, stream, voting_id):
+        rows = iter_vote_rows(Vote.objects.using(self.read_database).filter(voting_id=voting_id))
+        if stream == 'csv':
+            response = streaming_response(self.request, iter_csv(rows), 'text/csv; charset=utf-8')
+            response['Content-Disposition'] = f'attachment; filename=votes_voting_{voting_id}.csv'
+            return response
+        if stream == 'xlsx':
+            return FileResponse(
+                write_xlsx(rows),
+                as_attachment=True,
+                filename=f'votes_voting_{voting_id}.xlsx',
+                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            )
+        return Response({"error": f"Unknown export format: {stream}"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ExportVotingToJsonFileView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, voting_id, *args, **kwargs):
@@ -282,3 +539,58 @@ class ExportVotingToJsonFileView(APIView):
         response = HttpResponse(buffer, content_type='application/json')
         response['Content-Disposition'] = f'attachment; filename="voting_{voting_id}.json"'
         return response
+
+
+class ImportVotingView(APIView):
+    # Обратная операция к ExportVotingToJsonFileView: JSON выгрузки телом запроса (application/json)
+    # или файлом file (multipart). Несколько опросов - массивом или объектами подряд. Всё или ничего
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        if request.content_type.startswith('multipart/'):
+            stream = request.FILES.get('file')
+        else:
+            # Тело читается потоком, без разбора в request.data
+            stream = request.stream
+        if stream is None:
+            return Response({"error": "No survey data provided"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                result = import_surveys(stream, request.user.id)
+        except SurveyImportError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        if not result['imported']:
+            return Response({"error": "No surveys found"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_201_CREATED)
+
+
+class ImportVotesView(APIView):
+    # Загрузка ответов, собранных офлайн: CSV или XLSX с колонками выгрузки ExportVotesToExcelView
+    # (User, Question ID, Choice ID). Ошибочные строки пропускаются и возвращаются в errors.
+    # Файл загружается в одной транзакции: после сбоя его можно отправить повторно без дублей
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+    MAX_REPORTED_ERRORS = 1000
+
+    def post(self, request, voting_id, *args, **kwargs):
+        voting = get_object_or_404(Voting, id=voting_id)
+        if voting.author_id != request.user.id:
+            raise PermissionDenied("You do not have permission to import votes into this voting.")
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
+        importer = VoteImporter(voting)
+        try:
+            file_format = request.data.get('format') or detect_format(upload.name)
+            if file_format not in READERS:
+                raise VoteImportError(f'Unsupported file format: {file_format}')
+            with transaction.atomic():
+                result = importer.run(READERS[file_format](upload.file))
+        except VoteImportError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        errors = [dict(zip(('row', 'user', 'question', 'choice', 'error'), row))
+                  for row in importer.errors[:self.MAX_REPORTED_ERRORS]]
+        return Response({**result, 'errors': errors,
+                         'errors_truncated': len(importer.errors) > self.MAX_REPORTED_ERRORS},
+                        status=status.HTTP_201_CREATED)
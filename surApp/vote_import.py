@@ -0,0 +1,177 @@
+import csv
+import io
+import time
+import zipfile
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from .instrumentation import record_votes_ingested
+from .models import Choice, Vote
+from .results_cache import bump_version_on_commit
+from .submissions import SubmissionCollector
+from .tallies import apply_votes
+
+# Колонки выгрузки ExportVotesToExcelView, нужные для загрузки; остальные (Question, Choice) игнорируются
+USER_COLUMN = 'User'
+QUESTION_COLUMN = 'Question ID'
+CHOICE_COLUMN = 'Choice ID'
+ERROR_REPORT_HEADER = ['Row', USER_COLUMN, QUESTION_COLUMN, CHOICE_COLUMN, 'Error']
+
+
+class VoteImportError(ValueError):
+    pass
+
+
+def iter_csv_rows(stream):
+    try:
+        yield from csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    except (UnicodeDecodeError, csv.Error) as error:
+        raise VoteImportError(f'Invalid CSV: {error}')
+
+
+def iter_xlsx_rows(stream):
+    # read_only: openpyxl читает лист строками, не загружая книгу целиком
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError) as error:
+        raise VoteImportError(f'Invalid XLSX: {error}')
+    try:
+        sheet = workbook['Votes'] if 'Votes' in workbook.sheetnames else workbook.worksheets[0]
+        for row in sheet.iter_rows(values_only=True):
+            yield ['' if value is None else value for value in row]
+    finally:
+        workbook.close()
+
+
+READERS = {'csv': iter_csv_rows, 'xlsx': iter_xlsx_rows}
+
+
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension not in READERS:
+        raise VoteImportError(f'Unsupported file format: {filename}')
+    return extension
+
+
+def parse_id(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+
+class VoteImporter:
+    # Загрузка голосов одного опроса: вопросы и варианты опроса читаются одним запросом,
+    # пользователи - по пачке, голоса вставляются пачками по chunk_size в отдельных транзакциях.
+    # Ошибочные строки не прерывают загрузку, а попадают в self.errors. last_row - номер последней
+    # строки файла в зафиксированной пачке: после сбоя загрузка продолжается с start_row=last_row + 1,
+    # иначе уже вставленные голоса задвоятся. Если все-или-ничего, run вызывается внутри transaction.atomic()
+    def __init__(self, voting, chunk_size=5000, dry_run=False, start_row=2):
+        self.voting = voting
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        # Строка 1 - заголовок, данные начинаются со строки 2
+        self.start_row = max(start_row, 2)
+        self.last_row = self.start_row - 1
+        self.question_choices = {}
+        for choice_id, question_id in Choice.objects.filter(question__page__voting=voting).values_list(
+                'id', 'question_id'):
+            self.question_choices.setdefault(question_id, set()).add(choice_id)
+        self.user_ids = {}
+        self.submissions = SubmissionCollector(voting.id)
+        self.imported = 0
+        self.errors = []
+
+    def run(self, rows):
+        started = time.perf_counter()
+        rows = iter(rows)
+        header = next(rows, None)
+        columns = self.columns(header)
+        row_number = self.last_row
+        for _ in islice(rows, row_number - 1):
+            pass
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk([(row_number + offset + 1, row) for offset, row in enumerate(chunk)], columns)
+            row_number += len(chunk)
+            self.last_row = row_number
+        # Одна Submission на респондента за всю загрузку. Если загрузка прервалась, отправки для уже
+        # зафиксированных пачек создает manage.py backfill_submissions
+        with transaction.atomic():
+            self.submissions.create()
+        seconds = time.perf_counter() - started
+        return {
+            'imported': self.imported,
+            'rejected': len(self.errors),
+            'last_row': self.last_row,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round((self.imported + len(self.errors)) / seconds, 1) if seconds else None,
+        }
+
+    def columns(self, header):
+        names = [str(name).strip() for name in header or []]
+        missing = [name for name in (USER_COLUMN, QUESTION_COLUMN, CHOICE_COLUMN) if name not in names]
+        if missing:
+            raise VoteImportError(f'Missing columns: {", ".join(missing)}')
+        return names.index(USER_COLUMN), names.index(QUESTION_COLUMN), names.index(CHOICE_COLUMN)
+
+    def resolve_users(self, usernames):
+        unknown = {name for name in usernames if name not in self.user_ids}
+        if unknown:
+            self.user_ids.update(User.objects.filter(username__in=unknown).values_list('username', 'id'))
+
+    def import_chunk(self, numbered_rows, columns):
+        user_column, question_column, choice_column = columns
+        parsed = []
+        for number, row in numbered_rows:
+            if not any(str(value).strip() for value in row):
+                continue
+            try:
+                values = [row[user_column], row[question_column], row[choice_column]]
+            except IndexError:
+                self.errors.append([number, '', '', '', 'Row is too short'])
+                continue
+            parsed.append((number, values))
+        self.resolve_users({str(values[0]).strip() for number, values in parsed})
+
+        votes = []
+        for number, (username, question_value, choice_value) in parsed:
+            error = None
+            user_id = self.user_ids.get(str(username).strip())
+            question_id, choice_id = parse_id(question_value), parse_id(choice_value)
+            if user_id is None:
+                error = 'User not found'
+            elif question_id is None or choice_id is None:
+                error = 'Question ID and Choice ID must be integers'
+            elif question_id not in self.question_choices:
+                error = 'Question does not belong to the specified voting'
+            elif choice_id not in self.question_choices[question_id]:
+                error = 'Choice does not belong to the specified question'
+            if error:
+                self.errors.append([number, username, question_value, choice_value, error])
+                continue
+            votes.append(Vote(voting_id=self.voting.id, user_id=user_id, question_id=question_id,
+                              choice_id=choice_id))
+
+        if votes and not self.dry_run:
+            with transaction.atomic():
+                Vote.objects.bulk_create(votes, batch_size=self.chunk_size)
+                apply_votes(votes)
+                bump_version_on_commit(self.voting.id)
+            self.submissions.add(votes)
+            record_votes_ingested(len(votes))
+        self.imported += len(votes)
+
+    def write_error_report(self, output):
+        writer = csv.writer(output)
+        writer.writerow(ERROR_REPORT_HEADER)
+        writer.writerows(self.errors)
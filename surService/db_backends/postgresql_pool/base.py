@@ -0,0 +1,97 @@
+import threading
+
+import psycopg2.extras
+from psycopg2 import OperationalError, extensions, pool
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def is_usable(connection):
+    # Проверка при выдаче из пула. Открытую SELECT 1 транзакцию откатывает get_new_connection
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except psycopg2.Error:
+        return False
+    return True
+
+
+class BoundedConnectionPool:
+    # ThreadedConnectionPool при исчерпании сразу бросает PoolError; здесь поток ждет свободное
+    # соединение до TIMEOUT секунд, поэтому потоков воркера может быть больше, чем соединений
+    def __init__(self, min_size, max_size, timeout, **conn_params):
+        self.pool = pool.ThreadedConnectionPool(min_size, max_size, **conn_params)
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+
+    def getconn(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise OperationalError(f'No free database connection in the pool after {self.timeout} s')
+        try:
+            # Соединение, разорванное сервером (перезапуск, таймаут простоя, переключение реплики), отбрасывается.
+            # Простаивающих в пуле не больше max_size, поэтому последняя попытка - уже новое соединение
+            for _ in range(self.max_size + 1):
+                connection = self.pool.getconn()
+                if is_usable(connection):
+                    return connection
+                self.pool.putconn(connection, close=True)
+            raise OperationalError('No usable database connection in the pool')
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, connection, close=False):
+        try:
+            self.pool.putconn(connection, close=close)
+        finally:
+            self.slots.release()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # PostgreSQL с пулом соединений внутри процесса (psycopg2 ThreadedConnectionPool).
+    # close() возвращает соединение в пул, поэтому CONN_MAX_AGE для этого движка должен быть 0.
+    # Размер пула и ожидание свободного соединения: DATABASES[...]['POOL'] = {'MIN_SIZE', 'MAX_SIZE', 'TIMEOUT'}
+    def get_pool(self, conn_params):
+        # Отдельный пул на каждый набор параметров: служебное соединение к базе postgres
+        # (создание тестовой базы) и изменение настроек не попадают в чужой пул
+        key = (self.alias, frozenset((name, repr(value)) for name, value in conn_params.items()))
+        with _pools_lock:
+            if key not in _pools:
+                options = self.settings_dict.get('POOL', {})
+                _pools[key] = BoundedConnectionPool(
+                    options.get('MIN_SIZE', 1), options.get('MAX_SIZE', 10), options.get('TIMEOUT', 30),
+                    **conn_params
+                )
+            return _pools[key]
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        connection_pool = self.get_pool(conn_params)
+        connection = connection_pool.getconn()
+        self._connection_pool = connection_pool
+        if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+
+        # То же, что делает base.DatabaseWrapper после Database.connect()
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                # Разорванные соединения пул закрывает, а не выдает повторно
+                self._connection_pool.putconn(self.connection, close=bool(self.connection.closed))
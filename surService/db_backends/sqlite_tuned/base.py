@@ -0,0 +1,22 @@
+from django.db.backends.sqlite3 import base
+from django.utils.asyncio import async_unsafe
+
+# Значения по умолчанию: WAL позволяет читать во время записи, busy_timeout ждет блокировку
+# вместо мгновенной ошибки "database is locked"
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # SQLite с PRAGMA из DATABASES[...]['PRAGMAS'], применяемыми к каждому новому соединению
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        pragmas = {**DEFAULT_PRAGMAS, **self.settings_dict.get('PRAGMAS', {})}
+        for name, value in pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
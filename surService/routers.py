@@ -0,0 +1,60 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+_read_database = ContextVar('read_database', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def recent_write_key(user_id):
+    return f'recent-write:{user_id}'
+
+
+def record_write(user_id):
+    # Запоминаем, что пользователь только что писал в базу: пока не истекло окно,
+    # его аналитические запросы идут на основную базу (read-your-writes)
+    window = getattr(settings, 'REPLICA_READ_YOUR_WRITES_SECONDS', 0)
+    if window and user_id is not None:
+        cache.set(recent_write_key(user_id), True, timeout=window)
+
+
+def choose_read_database(user_id=None):
+    replicas = get_replicas()
+    if not replicas:
+        return 'default'
+    if getattr(settings, 'REPLICA_READ_YOUR_WRITES_SECONDS', 0) and user_id is not None:
+        if cache.get(recent_write_key(user_id)):
+            return 'default'
+    return random.choice(replicas)
+
+
+@contextmanager
+def read_database(alias):
+    token = _read_database.set(alias)
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+class PrimaryReplicaRouter:
+    # Все записи и обычные чтения - на default. Чтения внутри read_database(alias)
+    # (аналитика и выгрузки) - на выбранную реплику
+    def db_for_read(self, model, **hints):
+        return _read_database.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from datetime import timedelta
 from pathlib import Path
 
+import dj_database_url
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,14 +49,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'surApp.middleware.RequestInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'surApp.middleware.RequestProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'surApp.middleware.ReadYourWritesMiddleware',
 ]
 
 CORS_ORIGIN_ALLOW_ALL = True
@@ -84,10 +88,61 @@ WSGI_APPLICATION = 'surService.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Адрес базы берется из DATABASE_URL (по умолчанию - db.sqlite3 рядом с проектом).
+# Соединения переиспользуются между запросами в течение DB_CONN_MAX_AGE секунд.
+# DB_POOL_MAX_SIZE > 0 включает пул соединений внутри процесса для PostgreSQL; при исчерпании пула
+# поток ждет свободное соединение DB_POOL_TIMEOUT секунд.
+# SQLITE_TUNED=1 (по умолчанию) включает для SQLite WAL, busy_timeout, synchronous=NORMAL и mmap
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+SQLITE_TUNED = os.environ.get('SQLITE_TUNED', '1') == '1'
+
+
+def database_from_url(url):
+    config = dj_database_url.parse(url, conn_max_age=DB_CONN_MAX_AGE)
+    if config['ENGINE'] == 'django.db.backends.postgresql' and DB_POOL_MAX_SIZE:
+        # Соединение возвращается в пул в конце запроса, поэтому постоянные соединения Django не нужны
+        config.update(ENGINE='surService.db_backends.postgresql_pool', CONN_MAX_AGE=0,
+                      POOL={'MIN_SIZE': DB_POOL_MIN_SIZE, 'MAX_SIZE': DB_POOL_MAX_SIZE, 'TIMEOUT': DB_POOL_TIMEOUT})
+    elif config['ENGINE'] == 'django.db.backends.sqlite3' and SQLITE_TUNED:
+        # Остальные PRAGMA - DEFAULT_PRAGMAS в surService/db_backends/sqlite_tuned/base.py
+        config.update(ENGINE='surService.db_backends.sqlite_tuned',
+                      PRAGMAS={'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))})
+    return config
+
+
 DATABASES = {
+    'default': database_from_url(os.environ.get('DATABASE_URL', f'sqlite:///{BASE_DIR / "db.sqlite3"}')),
+}
+
+# Реплики только для чтения: статистика и выгрузки читают с них (surService.routers).
+# REPLICA_DATABASE_URLS - адреса через запятую; локально можно взять копию SQLite:
+# REPLICA_DATABASE_URLS=sqlite:///replica.sqlite3
+DATABASE_REPLICAS = []
+for index, url in enumerate(filter(None, os.environ.get('REPLICA_DATABASE_URLS', '').split(','))):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {**database_from_url(url.strip()), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['surService.routers.PrimaryReplicaRouter']
+
+# Окно read-your-writes в секундах: после своих изменений пользователь читает аналитику с основной базы.
+# 0 - выключено
+REPLICA_READ_YOUR_WRITES_SECONDS = int(os.environ.get('REPLICA_READ_YOUR_WRITES_SECONDS', 0))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Файловый кеш общий для всех процессов на одном сервере; для нескольких серверов
+# задайте CACHE_BACKEND/CACHE_LOCATION (например, Redis или Memcached). add в файловом кеше не атомарен,
+# поэтому блокировка пересчета результатов (surApp.results_cache) для него берется через flock
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / '.cache')),
     }
 }
 
@@ -142,14 +197,102 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
+        # Basic auth не используется: он считает PBKDF2 пароля на каждом запросе
+        'surApp.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ]
 }
 
+# Проверка JWT: 'cached' - пользователь из базы с кешем в памяти процесса на TTL секунд,
+# 'stateless' - пользователь из claims токена без запросов к базе
+AUTH_FAST_PATH = {
+    'MODE': os.environ.get('JWT_AUTH_MODE', 'cached'),
+    'TTL': 30,
+    'CHECK_BLACKLIST': True,
+}
+
 LOGIN_REDIRECT_URL = '/home/'
 
+# Количество шардов на вариант ответа в ChoiceTally
+VOTE_TALLY_SHARDS = 8
+
+# Режим приема голосов: 'sync' пишет в Vote внутри запроса,
+# 'spool' складывает отправки в локальный журнал и отвечает 202 (перенос: manage.py drain_vote_spool)
+VOTE_INGESTION_MODE = os.environ.get('VOTE_INGESTION_MODE', 'sync')
+
+VOTE_SPOOL = {
+    'PATH': os.environ.get('VOTE_SPOOL_PATH', BASE_DIR / 'vote_spool.sqlite3'),
+    'BATCH_SIZE': 5000,
+    'FLUSH_INTERVAL': 1.0,
+}
+
+# Заголовок Cache-Control для снимка анкеты (api/response-voting/<pk>/); клиенты перепроверяют его по ETag
+VOTING_SNAPSHOT_CACHE_CONTROL = 'public, no-cache'
+
+# Кеш результатов api/poll-statistic/: ключ - опрос и его версия, версия меняется при каждой отправке голосов.
+# MAX_STALENESS - сколько секунд отдавать предыдущий результат, пока один воркер считает новый
+POLL_RESULTS_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'MAX_STALENESS': 5,
+    'LOCK_TIMEOUT': 10,
+}
+
+# Колоночные снимки голосов для ?source=columnar (manage.py compact_votes): .npy по опросам в DIRECTORY
+COLUMNAR_SNAPSHOTS = {
+    'DIRECTORY': os.environ.get('COLUMNAR_SNAPSHOT_DIR', BASE_DIR / 'columnar'),
+    'BATCH_SIZE': 1_000_000,
+    # Столько последних id голосов перечитывается при сжатии и подсчете: транзакции фиксируются не по порядку id
+    'OVERLAP': 10_000,
+}
+
+# api/poll-crosstab/: матрица респондент x вариант строится один раз на версию опроса и хранится в памяти процесса
+CROSSTAB = {
+    'MAX_MATRICES': 4,
+    'MAX_BYTES': 512 * 1024 * 1024,
+    'CHUNK_ROWS': 65536,
+    'MAX_CELLS': 250_000,
+}
+
+# Поток api/poll-statistic/<id>/stream/: изменения проверяются раз в INTERVAL секунд одним зрителем
+# на процесс. Каждый зритель держит поток воркера, поэтому нужен потоковый WSGI-воркер (gthread/gevent);
+# под ASGI поток отвечает 501
+LIVE_RESULTS = {
+    'BACKEND': 'surApp.live.ResultsCacheBackend',
+    'INTERVAL': 1.0,
+    'HEARTBEAT': 15.0,
+    'MAX_AGE': 300.0,
+}
+
+# Server-Timing, лог медленных запросов (с самыми медленными и повторяющимися SQL) и гистограммы для /metrics
+REQUEST_INSTRUMENTATION = {
+    'SLOW_REQUEST_MS': int(os.environ.get('SLOW_REQUEST_MS', 500)),
+    'SLOWEST_QUERIES': 3,
+    'REPEATED_QUERY_THRESHOLD': 5,
+    'SERVER_TIMING': True,
+}
+# Профиль отдельного запроса: X-Profile: 1 от сотрудника или X-Profile-Token (manage.py create_profile_token).
+# Хранятся последние MAX_PROFILES профилей, список - в админке: /admin/profiles/
+REQUEST_PROFILING = {
+    'ENABLED': os.environ.get('REQUEST_PROFILING_ENABLED', '1') == '1',
+    'DIRECTORY': os.environ.get('REQUEST_PROFILING_DIR', BASE_DIR / 'profiles'),
+    'MAX_PROFILES': 50,
+    'PROFILER': 'auto',
+}
+
+# Пустое значение - /metrics доступен без токена (закрывайте на уровне сети)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {'surApp.middleware': {'handlers': ['console'], 'level': 'WARNING'}},
+}
+
+# Источник данных для api/poll-statistic/ по умолчанию: 'aggregate' (подсчет Vote) или 'tally' (ChoiceTally)
+POLL_STATISTICS_SOURCE = 'aggregate'
+
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=35),
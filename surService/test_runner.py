@@ -0,0 +1,29 @@
+import unittest
+
+from django.core.cache import caches
+from django.test.runner import DiscoverRunner
+
+
+def clear_caches():
+    # Кеши Django и кеши процесса из surApp: после отката теста новый опрос или пользователь
+    # получает тот же id, и запись предыдущего теста отдалась бы как своя
+    from surApp.authentication import blacklist_cache, user_cache
+    from surApp.crosstab import matrix_cache
+
+    for cache in caches.all():
+        cache.clear()
+    user_cache.clear()
+    blacklist_cache.clear()
+    matrix_cache.clear()
+
+
+class IsolatedCachesResultMixin:
+    def startTest(self, test):
+        clear_caches()
+        super().startTest(test)
+
+
+class IsolatedCachesTestRunner(DiscoverRunner):
+    def get_resultclass(self):
+        base = super().get_resultclass() or unittest.TextTestResult
+        return type(f'IsolatedCaches{base.__name__}', (IsolatedCachesResultMixin, base), {})
@@ -0,0 +1,13 @@
+# Настройки для manage.py test: те же, что surService.settings, но без общих с сервером кешей
+from .settings import *  # noqa: F401,F403
+
+# Кеши в памяти процесса вместо файлового кеша в BASE_DIR/.cache
+CACHES = {alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': alias}
+          for alias in CACHES}
+
+if not DATABASE_REPLICAS:
+    # Тесты роутера направляют чтения на replica_0 (DATABASE_REPLICAS=['replica_0']): здесь это зеркало default
+    DATABASES['replica_0'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+
+# Перед каждым тестом очищает кеши: id в тестовой базе повторяются после отката транзакции теста
+TEST_RUNNER = 'surService.test_runner.IsolatedCachesTestRunner'
@@ -1,11 +1,14 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from surApp.admin import request_profiles
 from surApp.views import *
 
 
 urlpatterns = [
+    path('admin/profiles/', admin.site.admin_view(request_profiles), name='request-profiles'),
     path('admin/', admin.site.urls),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('home/', HomeView.as_view(), name='home'),
     path('show_votings/<int:user_id>/', VotingListByUserAPIView.as_view(), name='voting-list-by-user'),
     path('create/voting/', VotingCreateAPIView.as_view(), name='voting-create'),
@@ -15,12 +18,21 @@ urlpatterns = [
     path('api/login/', UserLoginAPIView.as_view(), name='login'),
     path('api/logout/', LogoutAPIView.as_view(), name='logout'),
     path('api/answer-voting/<int:pk>/', VoteBulkCreateView.as_view(), name='do_response'),
+    path('api/vote-spool/', VoteSpoolStatusView.as_view(), name='vote-spool'),
     path('api/response-voting/<int:pk>/', VotingDetailView.as_view(), name='voting-detail'),
     path('api/detail-statistic/<int:pk>/', DetailStatisticAPIView.as_view(), name='detail-statistic'),
     path('api/poll-statistic/<int:poll_id>/', PollDetailAPIView.as_view(), name='poll-statistic'),
+    path('api/poll-statistic/<int:poll_id>/stream/', PollStatisticStreamView.as_view(), name='poll-statistic-stream'),
+    path('api/poll-crosstab/<int:poll_id>/', PollCrosstabView.as_view(), name='poll-crosstab'),
+    path('api/poll-respondents/<int:poll_id>/', PollRespondentsView.as_view(), name='poll-respondents'),
+    path('api/poll-respondents/<int:poll_id>/<int:user_id>/', RespondentAnswersView.as_view(),
+         name='respondent-answers'),
     path('api/add_logic/<int:pk>/', VotingUpdateLogicView.as_view(), name='add-logic'),
+    path('api/next-page/<int:pk>/', NextPageView.as_view(), name='next-page'),
     path('api/submit/<int:pk>/', VotingUpdateSubmitView.as_view(), name='submit'),
     path('api/token/validate/', ValidateTokenView.as_view(), name='token_validate'),
     path('api/export-votes/<int:voting_id>/', ExportVotesToExcelView.as_view(), name='export-votes'),
     path('api/export-voting-json/<int:voting_id>/', ExportVotingToJsonFileView.as_view(), name='export-voting-json'),
+    path('api/import-voting/', ImportVotingView.as_view(), name='import-voting'),
+    path('api/import-votes/<int:voting_id>/', ImportVotesView.as_view(), name='import-votes'),
 ]